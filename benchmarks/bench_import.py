@@ -0,0 +1,26 @@
+"""
+Benchmark of the import time of xsequence and its submodules, each imported in a fresh interpreter.
+Usage: python benchmarks/bench_import.py [number_of_repetitions]
+"""
+
+import subprocess
+import sys
+
+MODULES = ['xsequence', 'xsequence.lattice', 'xsequence.helpers.pyat_functions',
+           'xsequence.helpers.xtrack_functions', 'xsequence.helpers.madx_parser']
+
+
+def import_time(module: str) -> float:
+    """ Import time of module in a fresh interpreter, in seconds """
+    script = f'import time; start = time.perf_counter(); import {module}; print(time.perf_counter() - start)'
+    return float(subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout)
+
+
+def main(repetitions: int = 5):
+    for module in MODULES:
+        best = min(import_time(module) for _ in range(repetitions))
+        print(f'{module:40s} {best*1e3:8.1f} ms')
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
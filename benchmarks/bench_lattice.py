@@ -0,0 +1,149 @@
+"""
+Benchmarks of core lattice operations on synthetic lattices, with wall time and peak memory.
+Usage: python -m benchmarks.bench_lattice [--lattices fodo lhc_like] [--sizes 1000 100000] [--cases ...]
+                                          [--repeat 3] [--output results.json] [--compare baseline.json]
+With --compare, results are compared against a saved baseline and the exit code is 1 on regressions.
+"""
+
+import argparse
+import json
+import platform
+import sys
+import time
+import tracemalloc
+import numpy as np
+import xsequence.elements as xe
+from xsequence.lattice import Lattice
+from benchmarks.lattices import LATTICE_DATA, make_lattice
+
+
+def _pyat_ring(lattice: Lattice):
+    from xsequence.helpers.pyat_functions import lattice_to_pyat
+    return lattice_to_pyat(lattice)
+
+
+def _pyat_get_indices(ring):
+    from xsequence.helpers.pyat_functions import get_indices
+    return get_indices(ring, [xe.Quadrupole, xe.SectorBend])
+
+
+def _range_s(lattice: Lattice) -> tuple:
+    total_length = lattice.get_total_length()
+    return lattice.sequence._v, 0.25*total_length, 0.75*total_length
+
+
+def _sbend_lattice(kind: str, num_nodes: int) -> Lattice:
+    lattice = make_lattice(kind, num_nodes)
+    lattice.convert_sbend_to_rbend()
+    return lattice
+
+
+# Benchmark cases as (setup, run): setup(kind, num_nodes) is not timed, run(setup result) is timed
+CASES = {
+    '__init__': (lambda kind, num_nodes: LATTICE_DATA[kind](num_nodes), lambda data: Lattice(**data)),
+    '_get_line': (make_lattice, lambda lattice: lattice._get_line()),
+    'slice_lattice': (make_lattice, lambda lattice: lattice.slice_lattice()),
+    'get_class': (make_lattice, lambda lattice: lattice.get_class([xe.Quadrupole, xe.Sextupole])),
+    'find_elements': (make_lattice, lambda lattice: lattice.sequence._v.find_elements('q*')),
+    'get_range_s': (lambda kind, num_nodes: _range_s(make_lattice(kind, num_nodes)),
+                    lambda args: args[0].get_range_s(args[1], args[2])),
+    'convert_sbend_to_rbend': (make_lattice, lambda lattice: lattice.convert_sbend_to_rbend()),
+    'convert_rbend_to_sbend': (_sbend_lattice, lambda lattice: lattice.convert_rbend_to_sbend()),
+    'lattice_to_pyat': (make_lattice, _pyat_ring),
+    'pyat_get_indices': (lambda kind, num_nodes: _pyat_ring(make_lattice(kind, num_nodes)), _pyat_get_indices),
+}
+
+
+def measure(setup, run, repeat: int = 3) -> dict:
+    """ Best and mean wall time over repeat runs, each on a fresh setup, and peak traced memory of one more run """
+    times = []
+    for _ in range(repeat):
+        argument = setup()
+        start = time.perf_counter()
+        run(argument)
+        times.append(time.perf_counter() - start)
+    argument = setup()
+    tracemalloc.start()
+    try:
+        run(argument)
+        peak_memory = tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+    return {'time_best': min(times), 'time_mean': float(np.mean(times)), 'repeat': repeat, 'peak_memory': peak_memory}
+
+
+def run_benchmarks(lattices: list, sizes: list, cases: list, repeat: int = 3) -> list:
+    """ Run benchmark cases on all lattices and sizes, cases with missing optional dependencies are skipped """
+    results = []
+    for kind in lattices:
+        for num_nodes in sizes:
+            for case in cases:
+                setup, run = CASES[case]
+                result = {'case': case, 'lattice': kind, 'num_nodes': num_nodes}
+                try:
+                    result.update(measure(lambda: setup(kind, num_nodes), run, repeat=repeat))
+                except ImportError as error:
+                    result['skipped'] = str(error)
+                results.append(result)
+                print(format_result(result), flush=True)
+    return results
+
+
+def format_result(result: dict, baseline: dict = None) -> str:
+    """ One line summary of benchmark result, with ratio to baseline time if given """
+    label = f"{result['lattice']:10s} {result['num_nodes']:>9d} {result['case']:24s}"
+    if 'skipped' in result:
+        return f"{label} skipped: {result['skipped']}"
+    line = f"{label} {result['time_best']*1e3:12.2f} ms {result['peak_memory']/2**20:10.2f} MiB"
+    if baseline is not None and 'time_best' in baseline:
+        line += f" {result['time_best']/baseline['time_best']:8.2f}x"
+    return line
+
+
+def get_metadata() -> dict:
+    return {'python': platform.python_version(), 'numpy': np.__version__, 'platform': platform.platform(),
+            'date': time.strftime('%Y-%m-%dT%H:%M:%S')}
+
+
+def compare(results: list, baseline: list, threshold: float = 1.25) -> list:
+    """ Get results slower than threshold times their baseline, matched by case, lattice and size """
+    baseline = {(entry['case'], entry['lattice'], entry['num_nodes']): entry for entry in baseline}
+    regressions = []
+    for result in results:
+        reference = baseline.get((result['case'], result['lattice'], result['num_nodes']))
+        print(format_result(result, reference))
+        if reference is None or 'time_best' not in reference or 'time_best' not in result:
+            continue
+        if result['time_best'] > threshold*reference['time_best']:
+            regressions.append(result)
+    return regressions
+
+
+def main(argv: list = None) -> int:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument('--lattices', nargs='+', default=list(LATTICE_DATA), choices=list(LATTICE_DATA))
+    parser.add_argument('--sizes', nargs='+', type=int, default=[1_000, 10_000])
+    parser.add_argument('--cases', nargs='+', default=list(CASES), choices=list(CASES))
+    parser.add_argument('--repeat', type=int, default=3)
+    parser.add_argument('--output', help='Write results as JSON to this file')
+    parser.add_argument('--compare', help='Compare against baseline JSON file written with --output')
+    parser.add_argument('--threshold', type=float, default=1.25, help='Slowdown ratio counted as regression')
+    args = parser.parse_args(argv)
+
+    results = run_benchmarks(args.lattices, args.sizes, args.cases, repeat=args.repeat)
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump({'metadata': get_metadata(), 'results': results}, f, indent=2)
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['results']
+        print(f'\nComparison against {args.compare}:')
+        regressions = compare(results, baseline, threshold=args.threshold)
+        for result in regressions:
+            print(f"Regression: {result['case']} on {result['lattice']} with {result['num_nodes']} nodes")
+        return 1 if regressions else 0
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,17 @@
+"""
+Benchmark of the direct Lattice to pyat export.
+Usage: python -m benchmarks.bench_pyat_export [number_of_nodes]
+"""
+
+import sys
+from benchmarks.bench_lattice import CASES, format_result, measure
+
+
+def main(num_nodes: int = 100_000):
+    setup, run = CASES['lattice_to_pyat']
+    result = measure(lambda: setup('fodo', num_nodes), run, repeat=1)
+    print(format_result(dict(result, case='lattice_to_pyat', lattice='fodo', num_nodes=num_nodes)))
+
+
+if __name__ == '__main__':
+    main(*[int(arg) for arg in sys.argv[1:]])
@@ -0,0 +1,111 @@
+"""
+Synthetic lattices of configurable size for benchmarks.
+Every generator returns the keyword arguments of Lattice, so that construction itself can be timed,
+use make_lattice to build the lattice.
+"""
+
+import math
+import xsequence.elements as xe
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Node, NodesList, Beam
+
+
+def _cells_to_lattice_data(name: str, elements: dict, nodes: list, energy: float, particle: str) -> dict:
+    """ Keyword arguments of Lattice from elements and (element name, center location) pairs """
+    sequence = NodesList([Node(element_name, location=location) for element_name, location in nodes])
+    return {'name': name, 'elements': elements, 'sequence': sequence, 'beam': Beam(energy, particle),
+            'global_variables': {}}
+
+
+def fodo_data(num_nodes: int) -> dict:
+    """ FODO ring with shared elements, 7 nodes per cell """
+    num_cells = max(1, num_nodes // 7)
+    elements = {'qf': xe.Quadrupole('qf', length=1.0, k1=0.2),
+                'qd': xe.Quadrupole('qd', length=1.0, k1=-0.2),
+                'mb': xe.SectorBend('mb', length=4.0, angle=math.pi/num_cells),
+                'sf': xe.Sextupole('sf', length=0.5, k2=0.1),
+                'bpm': xe.Marker('bpm')}
+    cell = [('qf', 0.5), ('sf', 1.5), ('mb', 4.0), ('bpm', 6.5), ('qd', 7.5), ('mb', 10.5), ('bpm', 13.0)]
+    nodes = [(name, location + 14.0*idx) for idx in range(num_cells) for name, location in cell]
+    return _cells_to_lattice_data('fodo', elements, nodes, 45.6, 'electron')
+
+
+def lhc_like_data(num_nodes: int) -> dict:
+    """ Ring of 8 arcs and 8 insertions with a unique element for every node, as in LHC sequences.
+    Arc cells have 6 dipoles, 2 quadrupoles, sextupoles, octupoles, correctors and monitors """
+    cell_length = 106.9
+    cell = [('mq', 1.55, xe.Quadrupole, {'length': 3.1}), ('ms', 4.0, xe.Sextupole, {'length': 0.369}),
+            ('mcb', 4.8, xe.HKicker, {'length': 0.647}), ('bpm', 5.6, xe.Monitor, {}),
+            ('mb', 13.7, xe.SectorBend, {'length': 14.3}), ('mb', 29.0, xe.SectorBend, {'length': 14.3}),
+            ('mb', 44.3, xe.SectorBend, {'length': 14.3}), ('mo', 52.4, xe.Octupole, {'length': 0.32}),
+            ('mq', 55.0, xe.Quadrupole, {'length': 3.1}), ('ms', 57.5, xe.Sextupole, {'length': 0.369}),
+            ('mcb', 58.3, xe.VKicker, {'length': 0.647}), ('bpm', 59.1, xe.Monitor, {}),
+            ('mb', 67.2, xe.SectorBend, {'length': 14.3}), ('mb', 82.5, xe.SectorBend, {'length': 14.3}),
+            ('mb', 97.8, xe.SectorBend, {'length': 14.3}), ('mco', 105.5, xe.Marker, {})]
+    insertion = [('mqx', 25.0, xe.Quadrupole, {'length': 6.37}), ('mqx', 35.0, xe.Quadrupole, {'length': 5.5}),
+                 ('mqx', 45.0, xe.Quadrupole, {'length': 6.37}), ('ip', 100.0, xe.Marker, {}),
+                 ('mqy', 160.0, xe.Quadrupole, {'length': 3.4}), ('mqm', 200.0, xe.Quadrupole, {'length': 3.4})]
+    insertion_length = 2*cell_length
+    num_cells = max(8, (num_nodes - 8*len(insertion)) // len(cell))
+    num_bends = 6*num_cells
+    bend_angle = 2*math.pi/num_bends
+
+    elements, nodes = {}, []
+    location = 0.0
+    for idx in range(num_cells):
+        if idx % (num_cells // 8) == 0 and idx // (num_cells // 8) < 8:
+            octant = idx // (num_cells // 8)
+            for family, offset, cls, kwargs in insertion:
+                if octant == 3 and family == 'mqy':
+                    elements['acs'] = xe.RFCavity('acs', voltage=2.0, frequency=400.79, lag=0.0, length=2.0)
+                    nodes.append(('acs', location + 140.0))
+                name = f'{family}.{octant}'
+                elements[name] = cls(name, **kwargs)
+                nodes.append((name, location + offset))
+            location += insertion_length
+        for family, offset, cls, kwargs in cell:
+            name = f'{family}.c{idx}.{len(nodes)}'
+            parameters = dict(kwargs, angle=bend_angle) if cls is xe.SectorBend else kwargs
+            elements[name] = cls(name, **parameters)
+            nodes.append((name, location + offset))
+        location += cell_length
+    return _cells_to_lattice_data('lhc_like', elements, nodes, 6800.0, 'proton')
+
+
+def fcc_like_data(num_nodes: int) -> dict:
+    """ Long ring of short FODO cells with shared element families, dense orbit correctors and monitors,
+    and RF cavities in two straights """
+    elements = {'qf': xe.Quadrupole('qf', length=2.9, k1=0.02), 'qd': xe.Quadrupole('qd', length=2.9, k1=-0.02),
+                'sf': xe.Sextupole('sf', length=1.4, k2=0.3), 'sd': xe.Sextupole('sd', length=1.4, k2=-0.3),
+                'hcor': xe.HKicker('hcor', length=0.5), 'vcor': xe.VKicker('vcor', length=0.5),
+                'bpm': xe.Monitor('bpm'), 'mrk': xe.Marker('mrk'),
+                'cav': xe.RFCavity('cav', voltage=20.0, frequency=400.79, lag=0.0, length=1.5)}
+    cell = [('qf', 1.45), ('sf', 3.9), ('hcor', 5.0), ('bpm', 5.5), ('mb', 13.0), ('mb', 24.0), ('mrk', 29.0),
+            ('qd', 31.45), ('sd', 33.9), ('vcor', 35.0), ('bpm', 35.5), ('mb', 43.0), ('mb', 54.0), ('mrk', 59.0)]
+    cell_length = 60.0
+    num_cells = max(3, num_nodes // len(cell))
+    elements['mb'] = xe.SectorBend('mb', length=10.0, angle=2*math.pi/(4*(num_cells - 2)))
+
+    nodes = []
+    for idx in range(num_cells):
+        location = cell_length*idx
+        if idx in (0, num_cells // 2):
+            nodes += [('cav', location + 8.0 + 2.0*jdx) for jdx in range(4)]
+            nodes += [('mrk', location + 20.0)]
+            nodes += [('cav', location + 40.0 + 2.0*jdx) for jdx in range(4)]
+            continue
+        nodes += [(name, location + offset) for name, offset in cell]
+    return _cells_to_lattice_data('fcc_like', elements, nodes, 45.6, 'electron')
+
+
+LATTICE_DATA = {'fodo': fodo_data, 'lhc_like': lhc_like_data, 'fcc_like': fcc_like_data}
+
+
+def make_lattice(kind: str, num_nodes: int) -> Lattice:
+    """ Synthetic lattice of given kind with about num_nodes nodes in its sequence """
+    return Lattice(**LATTICE_DATA[kind](num_nodes))
+
+
+def fodo_lattice(num_nodes: int) -> Lattice:
+    """ FODO ring with about num_nodes nodes in its sequence """
+    return make_lattice('fodo', num_nodes)
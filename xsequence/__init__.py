@@ -6,9 +6,18 @@ __author__ = "fcarlier"
 __author_email__ = "fcarlier@cern.ch"
 __license__ = "MIT"
 
-from . import helpers
-from . import elements
-from . import elements_dataclasses
-from . import lattice
-from . import lattice_baseclasses
-from . import slicing
+import importlib
+
+_SUBMODULES = {'aperture', 'cells', 'helpers', 'elements', 'elements_dataclasses', 'expressions', 'knobs', 'lattice', 'lattice_baseclasses',
+               'optics', 'profiling', 'slicing', 'survey', 'tables', 'validation'}
+
+
+def __getattr__(name):
+    """ Import submodules on first access """
+    if name in _SUBMODULES:
+        return importlib.import_module(f'{__name__}.{name}')
+    raise AttributeError(f"module '{__name__}' has no attribute '{name}'")
+
+
+def __dir__():
+    return sorted(list(globals()) + list(_SUBMODULES))
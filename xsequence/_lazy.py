@@ -0,0 +1,24 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+import sys
+import importlib
+import importlib.util
+
+
+def lazy_import(name: str):
+    """ Import module on first attribute access, already imported modules are returned as is.
+    Only for top-level modules, finding a submodule imports its parent packages """
+    if name in sys.modules:
+        return sys.modules[name]
+    spec = importlib.util.find_spec(name)
+    if spec is None:
+        raise ModuleNotFoundError(f"No module named '{name}'", name=name)
+    loader = importlib.util.LazyLoader(spec.loader)
+    spec.loader = loader
+    module = importlib.util.module_from_spec(spec)
+    sys.modules[name] = module
+    loader.exec_module(module)
+    return module
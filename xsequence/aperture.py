@@ -0,0 +1,139 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+import numpy as np
+
+
+APERTURE_NONE = 0
+APERTURE_ELLIPTICAL = 1
+APERTURE_RECTANGULAR = 2
+APERTURE_POLYGON = 3
+
+APERTURE_TYPES = {'elliptical': APERTURE_ELLIPTICAL, 'rectangular': APERTURE_RECTANGULAR}
+
+
+def get_aperture_row(aperture_data) -> tuple:
+    """ Get (type, size x, size y, offset x, offset y, polygon vertices) of element aperture data """
+    if aperture_data is None:
+        return APERTURE_NONE, np.inf, np.inf, 0.0, 0.0, None
+    offset = list(aperture_data.aperture_offset) + [0.0, 0.0]
+    size = list(aperture_data.aperture_size) + [np.inf, np.inf]
+    if aperture_data.aper_vx is not None and aperture_data.aper_vy is not None:
+        vertices = np.column_stack([aperture_data.aper_vx, aperture_data.aper_vy]).astype(float)
+        return APERTURE_POLYGON, np.inf, np.inf, offset[0], offset[1], vertices
+    aperture_type = APERTURE_TYPES.get(getattr(aperture_data, 'aperture_type', None), APERTURE_ELLIPTICAL)
+    return aperture_type, size[0], size[1], offset[0], offset[1], None
+
+
+def points_in_polygon(x: np.ndarray, y: np.ndarray, vertices: np.ndarray) -> np.ndarray:
+    """ Check which points are inside polygon with crossing numbers, vectorized over points and edges """
+    x_start, y_start = vertices[:, 0], vertices[:, 1]
+    x_end, y_end = np.roll(x_start, -1), np.roll(y_start, -1)
+    inside = np.zeros(len(x), dtype=bool)
+    for x1, y1, x2, y2 in zip(x_start, y_start, x_end, y_end):
+        crosses = (y1 > y) != (y2 > y)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            x_cross = x1 + (y - y1)*(x2 - x1)/(y2 - y1)
+        inside ^= crosses & (x < x_cross)
+    return inside
+
+
+class ApertureTable:
+    """ Apertures of all nodes of a lattice packed into arrays, for vectorized queries along s.
+    Every node with an aperture gives two knots, at its start and end. Between knots of the same aperture type,
+    sizes and offsets are interpolated linearly, otherwise the upstream aperture is kept.
+    Polygon apertures are not interpolated. Nodes without aperture are transparent """
+    def __init__(self, lattice):
+        rows = {}
+        knots_s, knots_row = [], []
+        for node in lattice.sequence._v:
+            name = node.element_name
+            if name not in rows:
+                rows[name] = get_aperture_row(lattice.elements._v[name].aperture_data)
+            if rows[name][0] == APERTURE_NONE:
+                continue
+            positions = node.calculate_positions()
+            knots_s += [positions['start'], positions['end']]
+            knots_row += [name, name]
+
+        self.names = np.array(knots_row, dtype=object)
+        self.s = np.array(knots_s, dtype=float)
+        self.polygons = []
+        polygon_ids = {}
+        types, sizes, offsets, polygon_index = [], [], [], []
+        for name in knots_row:
+            aperture_type, size_x, size_y, offset_x, offset_y, vertices = rows[name]
+            types.append(aperture_type)
+            sizes.append((size_x, size_y))
+            offsets.append((offset_x, offset_y))
+            if vertices is not None and name not in polygon_ids:
+                polygon_ids[name] = len(self.polygons)
+                self.polygons.append(vertices)
+            polygon_index.append(polygon_ids.get(name, -1))
+        self.types = np.array(types, dtype=np.int8)
+        self.sizes = np.array(sizes, dtype=float).reshape(-1, 2)
+        self.offsets = np.array(offsets, dtype=float).reshape(-1, 2)
+        self.polygon_index = np.array(polygon_index, dtype=int)
+
+    def __len__(self):
+        return len(self.s)
+
+    def locate(self, s) -> tuple:
+        """ Get index of upstream knot and interpolation weight towards the next knot of positions s.
+        Positions before the first knot get index -1, which has no aperture.
+        The result can be reused for several queries at the same positions """
+        s = np.asarray(s, dtype=float)
+        index = np.searchsorted(self.s, s, side='right') - 1
+        if len(self.s) < 2:
+            return index, np.zeros(s.shape)
+        upstream_index = np.clip(index, 0, len(self.s) - 2)
+        upstream, downstream = self.s[upstream_index], self.s[upstream_index + 1]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            weight = np.clip(np.where(downstream > upstream, (s - upstream)/(downstream - upstream), 0.0), 0.0, 1.0)
+        interpolated = (index >= 0) & (self.types[upstream_index] == self.types[upstream_index + 1]) & \
+                       (self.types[upstream_index] != APERTURE_POLYGON)
+        return np.where(index < 0, -1, upstream_index), np.where(interpolated, weight, 0.0)
+
+    def aperture_at(self, s, location: tuple = None) -> tuple:
+        """ Get aperture types (n,), sizes (n, 2) and offsets (n, 2) at positions s """
+        if len(self.s) == 0:
+            s = np.asarray(s, dtype=float)
+            return (np.full(s.shape, APERTURE_NONE, dtype=np.int8), np.full(s.shape + (2,), np.inf),
+                    np.zeros(s.shape + (2,)))
+        index, weight = location if location is not None else self.locate(s)
+        outside = (index < 0)[..., np.newaxis]
+        index = np.maximum(index, 0)
+        downstream = np.minimum(index + 1, len(self.s) - 1)
+        weight = weight[..., np.newaxis]
+        sizes = self.sizes[index]
+        finite = np.isfinite(sizes) & np.isfinite(self.sizes[downstream])
+        with np.errstate(invalid='ignore'):
+            sizes = np.where(finite, sizes + weight*np.where(finite, self.sizes[downstream] - sizes, 0.0), sizes)
+        offsets = self.offsets[index] + weight*(self.offsets[downstream] - self.offsets[index])
+        return (np.where(outside[..., 0], APERTURE_NONE, self.types[index]).astype(np.int8),
+                np.where(outside, np.inf, sizes), np.where(outside, 0.0, offsets))
+
+    def is_inside(self, x, y, s, location: tuple = None) -> np.ndarray:
+        """ Check which points (x, y) at positions s are inside the aperture """
+        x, y = np.asarray(x, dtype=float), np.asarray(y, dtype=float)
+        if len(self.s) == 0:
+            return np.ones(np.broadcast(x, y, s).shape, dtype=bool)
+        if location is None:
+            location = self.locate(s)
+        types, sizes, offsets = self.aperture_at(s, location)
+        dx, dy = x - offsets[..., 0], y - offsets[..., 1]
+        inside = np.ones(dx.shape, dtype=bool)
+
+        elliptical = types == APERTURE_ELLIPTICAL
+        inside[elliptical] = (dx[elliptical]/sizes[elliptical, 0])**2 + (dy[elliptical]/sizes[elliptical, 1])**2 <= 1.0
+        rectangular = types == APERTURE_RECTANGULAR
+        inside[rectangular] = (np.abs(dx[rectangular]) <= sizes[rectangular, 0]) & \
+                              (np.abs(dy[rectangular]) <= sizes[rectangular, 1])
+
+        polygon_index = np.where(types == APERTURE_POLYGON, self.polygon_index[location[0]], -1)
+        for idx in np.unique(polygon_index[polygon_index >= 0]):
+            selected = polygon_index == idx
+            inside[selected] = points_in_polygon(dx[selected], dy[selected], self.polygons[idx])
+        return inside
@@ -0,0 +1,212 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+import math
+from typing import List
+import xsequence.elements as xe
+from xsequence import validation
+from xsequence.lattice_baseclasses import Node, NodesList, match_element_name
+
+
+def place_node(node: Node, offset: float, element_number: int = 0) -> Node:
+    """ Copy of node shifted by offset """
+    return Node(node.element_name, element_number=element_number, pos_anchor=node.pos_anchor, length=node.length,
+                location=node.location + offset, reference=node.reference, reference_element=node.reference_element,
+                alignment_errors=node.alignment_errors, magnetic_errors=node.magnetic_errors)
+
+
+class Cell:
+    """ Group of nodes defined once, with locations relative to the start of the cell """
+    def __init__(self, name: str, nodes: NodesList, length: float = None):
+        self.name = name
+        self.nodes = NodesList(nodes)
+        self.length = self.nodes[-1].end if length is None else length
+        self._counts = None
+
+    @property
+    def counts(self) -> dict:
+        """ Number of nodes of every element in cell """
+        if self._counts is None:
+            self._counts = {}
+            for node in self.nodes:
+                self._counts[node.element_name] = self._counts.get(node.element_name, 0) + 1
+        return self._counts
+
+    def set_lengths(self, elements: dict):
+        for node in self.nodes:
+            node.length = elements[node.element_name].length
+        self._counts = None
+
+    def __repr__(self) -> str:
+        return f'Cell({self.name}, {len(self.nodes)} nodes, length={self.length})'
+
+
+class CellRepetition:
+    """ Cell repeated count times, the first copy starting at offset, the others following every period """
+    def __init__(self, cell: Cell, count: int = 1, offset: float = 0.0, period: float = None):
+        self.cell = cell
+        self.count = count
+        self.offset = offset
+        self.period = cell.length if period is None else period
+
+    def __len__(self):
+        return self.count*len(self.cell.nodes)
+
+    @property
+    def start(self) -> float:
+        return self.offset + self.cell.nodes[0].start
+
+    @property
+    def end(self) -> float:
+        return self.offset + (self.count - 1)*self.period + self.cell.nodes[-1].end
+
+    def __repr__(self) -> str:
+        return f'CellRepetition({self.cell.name}, count={self.count}, offset={self.offset}, period={self.period})'
+
+
+class CellSequence(List):
+    """ Sequence of single nodes, with absolute locations, and cell repetitions, ordered by position.
+    Queries work on the compressed form, nodes are only expanded for the results """
+    @property
+    def cells(self) -> dict:
+        return {item.cell.name: item.cell for item in self if isinstance(item, CellRepetition)}
+
+    @property
+    def element_names(self) -> set:
+        """ Names of all elements in sequence """
+        names = {item.element_name for item in self if isinstance(item, Node)}
+        for cell in self.cells.values():
+            names.update(cell.counts)
+        return names
+
+    @property
+    def num_nodes(self) -> int:
+        return sum(len(item) if isinstance(item, CellRepetition) else 1 for item in self)
+
+    def set_lengths(self, elements: dict):
+        """ Set lengths of nodes in single nodes and cells from elements """
+        for item in self:
+            if isinstance(item, Node):
+                item.length = elements[item.element_name].length
+        for cell in self.cells.values():
+            cell.set_lengths(elements)
+
+    def iter_nodes(self, names: set = None, start_location: float = None):
+        """ Generate expanded nodes in sequence order, with element numbers.
+        Only nodes of given element names, and only from the first node starting after start_location if given;
+        repetitions and copies before it are skipped without expanding them """
+        counts = {}
+        for item in self:
+            if isinstance(item, Node):
+                counts[item.element_name] = number = counts.get(item.element_name, 0) + 1
+                if (names is None or item.element_name in names) and \
+                   (start_location is None or item.start > start_location):
+                    yield place_node(item, 0.0, number)
+                continue
+
+            cell = item.cell
+            first = 0
+            if start_location is not None:
+                last_start = max(node.start for node in cell.nodes)
+                first = min(max(math.floor((start_location - item.offset - last_start)/item.period) + 1, 0), item.count)
+            selected = [(node, rank) for node, rank in self._rank_nodes(cell) if names is None or node.element_name in names]
+            if not selected or first == item.count:
+                for name, count in cell.counts.items():
+                    counts[name] = counts.get(name, 0) + item.count*count
+                continue
+            for copy in range(first, item.count):
+                offset = item.offset + copy*item.period
+                for node, rank in selected:
+                    if start_location is None or node.start + offset > start_location:
+                        yield place_node(node, offset, counts.get(node.element_name, 0) + copy*cell.counts[node.element_name] + rank)
+            for name, count in cell.counts.items():
+                counts[name] = counts.get(name, 0) + item.count*count
+
+    @staticmethod
+    def _rank_nodes(cell: Cell) -> list:
+        """ Nodes of cell with their occurrence number within the cell """
+        ranks = {}
+        result = []
+        for node in cell.nodes:
+            ranks[node.element_name] = ranks.get(node.element_name, 0) + 1
+            result.append((node, ranks[node.element_name]))
+        return result
+
+    def expand(self) -> NodesList:
+        """ Get flat sequence of all nodes """
+        return NodesList(self.iter_nodes())
+
+    def select(self, names: set) -> NodesList:
+        """ Get nodes of given elements """
+        names = set(names) & self.element_names
+        return NodesList(self.iter_nodes(names=names)) if names else NodesList()
+
+    def find_elements(self, pattern: str) -> NodesList:
+        """ Get nodes with element names matching pattern, as NodesList.find_elements """
+        return self.select({name for name in self.element_names if match_element_name(name, pattern)})
+
+    def get_range_s(self, start_location: float, end_location: float) -> NodesList:
+        """ Get nodes from the first node starting after start_location
+        up to the first node ending after end_location, as NodesList.get_range_s """
+        nodes = NodesList()
+        for node in self.iter_nodes(start_location=start_location):
+            nodes.append(node)
+            if node.end > end_location:
+                break
+        return nodes
+
+    def _get_total_length(self) -> float:
+        return self[-1].end
+
+    def get_line(self, elements: dict) -> tuple:
+        """ Get compressed line representation with explicit drifts, and elements including drifts.
+        Drifts inside cells and between their copies are created once per cell.
+        Raises NegativeDriftError with all overlapping nodes of the expanded sequence """
+        line = CellSequence()
+        line_elements = dict(elements)
+        drift_count = 0
+        line_cells = {}
+
+        def add_drift(line_nodes: list, name: str, start: float, end: float):
+            drift_length = end - start
+            if drift_length > 1e-10:
+                line_elements[name] = xe.Drift(name, length=drift_length)
+                line_nodes.append(Node(element_name=name, length=drift_length, location=start + drift_length/2.))
+                return True
+            elif drift_length < -1e-6: # Tolerance for rounding
+                raise validation.NegativeDriftError(validation.find_negative_drifts(self.expand(), tolerance=1e-6,
+                                                                                   start=self[0].start))
+            return False
+
+        previous_end = self[0].start
+        for item in self:
+            nodes = []
+            if add_drift(nodes, f'drift_{drift_count}', previous_end, item.start):
+                drift_count += 1
+                line.append(nodes[0])
+            if isinstance(item, Node):
+                line.append(item)
+                previous_end = item.end
+                continue
+
+            key = (item.cell.name, item.period)
+            if key not in line_cells:
+                cell_nodes = []
+                cell_end = item.cell.nodes[0].start
+                for idx, node in enumerate(item.cell.nodes):
+                    add_drift(cell_nodes, f'drift_{item.cell.name}_{idx}', cell_end, node.start)
+                    cell_nodes.append(node)
+                    cell_end = node.end
+                last = Cell(f'{item.cell.name}_line_last', cell_nodes, item.cell.length)
+                repeated = Cell(f'{item.cell.name}_line_{len(line_cells)}', list(cell_nodes), item.period)
+                add_drift(repeated.nodes, f'drift_{item.cell.name}_period_{len(line_cells)}', cell_end,
+                          item.period + item.cell.nodes[0].start)
+                line_cells[key] = (repeated, last)
+            repeated, last = line_cells[key]
+            if item.count > 1:
+                line.append(CellRepetition(repeated, item.count - 1, item.offset, item.period))
+            line.append(CellRepetition(last, 1, item.offset + (item.count - 1)*item.period, item.period))
+            previous_end = item.end
+        return line, line_elements
@@ -0,0 +1,48 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+import contextlib
+import xdeps
+from xdeps.refs import BaseRef
+from xdeps.tasks import ExprTask
+from xsequence.profiling import instrument
+
+
+class LatticeManager(xdeps.Manager):
+    """ Dependency manager which can defer propagation of set values to the end of a batch update """
+    def __init__(self):
+        super().__init__()
+        self._batch_depth = 0
+        self._pending = {}
+
+    def set_value(self, ref, value):
+        """ Set value, propagation to dependent values is deferred inside a batch update """
+        if self._batch_depth == 0:
+            return super().set_value(ref, value)
+        if ref in self.tasks:
+            self.unregister(ref)
+        if isinstance(value, BaseRef):
+            self.register(ExprTask(ref, value))
+            value = value._get_value()
+        ref._set_value(value)
+        self._pending.update(dict.fromkeys(ref._get_dependencies()))
+
+    @instrument
+    def run_tasks(self, tasks=None):
+        """ Run tasks, i.e. propagate set values to dependent values """
+        return super().run_tasks(tasks)
+
+    @contextlib.contextmanager
+    def batch(self):
+        """ Defer propagation of all set values to the exit of the outermost batch,
+        where dependent tasks are run once in topological order """
+        self._batch_depth += 1
+        try:
+            yield self
+        finally:
+            self._batch_depth -= 1
+            if self._batch_depth == 0 and self._pending:
+                pending, self._pending = list(self._pending), {}
+                self.run_tasks(self.find_tasks(pending))
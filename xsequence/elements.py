@@ -22,6 +22,20 @@ def add_unequal_arrays(a, b):
         return b + a
 
 
+def get_chord_lengths(angles, arc_lengths) -> np.ndarray:
+    """ Get chord lengths of bends from arrays of angles and arc lengths """
+    angles, arc_lengths = np.asarray(angles, dtype=float), np.asarray(arc_lengths, dtype=float)
+    half_angles = angles/2.
+    return arc_lengths*np.sinc(half_angles/np.pi)
+
+
+def get_arc_lengths(angles, chord_lengths) -> np.ndarray:
+    """ Get arc lengths of bends from arrays of angles and chord lengths """
+    angles, chord_lengths = np.asarray(angles, dtype=float), np.asarray(chord_lengths, dtype=float)
+    half_angles = angles/2.
+    return chord_lengths/np.sinc(half_angles/np.pi)
+
+
 class ShouldUseMultipoleError(Exception):
     """Exception raised for trying to define kn/ks for Quadrupole, Sextupole, Octupole."""
     def __init__(self, name: str, attr: str):
@@ -44,12 +58,15 @@ class BaseElement:
             kwargs = {'empty_kw_dict':None}
         self.aperture_data = kwargs.pop('aperture_data', None)
         self.pyat_data = kwargs.pop('pyat_data', None)
+        self.parameter_data = kwargs.pop('parameter_data', None)
 
     def _set_from_key(self, key, value):
         if key in xed.ApertureData.INIT_PROPERTIES:
             setattr(self.aperture_data, key, value)
         elif key in xed.PyatData.INIT_PROPERTIES:
             setattr(self.pyat_data, key, value)
+        elif key in xed.ElementParameterData.INIT_PROPERTIES:
+            setattr(self.parameter_data, key, value)
         else:
             setattr(self, key, value)
 
@@ -113,6 +130,9 @@ class Drift(BaseElement):
         super().__init__(name, **kwargs)
         assert self.length >= 0.0, f"Drift has zero or negative length"
 
+    def _get_thin_element(self):
+        return Marker(self.name)
+
 
 class Collimator(Drift):
     """ Collimator element class """
@@ -159,8 +179,22 @@ class SectorBend(BaseElement):
         return ThinMultipole(self.name, radiation_length=self.length/self.num_slices, knl=knl)
 
     def _calc_chordlength(self, angle: float, length: float) :
+        if angle == 0:
+            return length
         return length*(2*math.sin(angle/2.))/angle
 
+    def _get_bend_kwargs(self) -> dict:
+        return {'k0': self.k0, 'k1': self.k1, 'num_slices': self.num_slices, 'aperture_data': self.aperture_data,
+                'pyat_data': self.pyat_data, 'parameter_data': self.parameter_data}
+
+    def convert_to_rbend(self, chord_length: float = None) -> "RectangularBend":
+        """ Get rectangular bend with the same geometry, a precomputed chord length skips its calculation.
+        Values are copied, chord length and rbend edge angles are not recomputed if angle or length change later """
+        if chord_length is None:
+            chord_length = self._calc_chordlength(self.angle, self.length)
+        return RectangularBend(self.name, length=chord_length, angle=self.angle, arc_length=self.length,
+                               e1=self.e1-abs(self.angle)/2., e2=self.e2-abs(self.angle)/2., **self._get_bend_kwargs())
+
 
 class RectangularBend(SectorBend):
     """ Rectangular bend element class """
@@ -169,7 +203,10 @@ class RectangularBend(SectorBend):
         self._chord_length = kwargs.pop('length', 0)
         self._rbend_e1 = kwargs.pop('e1', 0)
         self._rbend_e2 = kwargs.pop('e2', 0)
-        kwargs['length'] = self._calc_arclength(kwargs['angle'], self._chord_length)
+        arc_length = kwargs.pop('arc_length', None)
+        if arc_length is None:
+            arc_length = self._calc_arclength(kwargs['angle'], self._chord_length)
+        kwargs['length'] = arc_length
         kwargs['e1'] = self._rbend_e1+abs(kwargs['angle'])/2.
         kwargs['e2'] = self._rbend_e2+abs(kwargs['angle'])/2.
         super().__init__(name, **kwargs)
@@ -180,6 +217,11 @@ class RectangularBend(SectorBend):
         else:
             return (angle*chord_length)/(2*math.sin(angle/2.))
 
+    def convert_to_sbend(self) -> SectorBend:
+        """ Get sector bend with the same geometry, as values of arc length and sector bend edge angles """
+        return SectorBend(self.name, length=self.length, angle=self.angle, e1=self.e1, e2=self.e2,
+                          **self._get_bend_kwargs())
+
 
 class DipoleEdge(ThinElement):
     """ Dipole edge element class """
@@ -0,0 +1,64 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+import operator
+
+
+BINARY_OPERATORS = {'+': operator.add, '-': operator.sub, '*': operator.mul, '/': operator.truediv,
+                    '//': operator.floordiv, '%': operator.mod, '**': operator.pow,
+                    '<': operator.lt, '<=': operator.le, '==': operator.eq, '!=': operator.ne,
+                    '>=': operator.ge, '>': operator.gt}
+UNARY_OPERATORS = {'-': operator.neg, '+': operator.pos}
+
+
+def split_ref(ref) -> tuple:
+    """ Split xdeps reference in its root container reference and the keys leading to it """
+    from xdeps.refs import BaseRef
+    keys = []
+    while isinstance(ref._owner, BaseRef):
+        keys.insert(0, ref._key)
+        ref = ref._owner
+    return ref, tuple(keys)
+
+
+class ExprTransformer:
+    """ Rebuild xdeps expressions walking their tree, bottom up as lark transformers do for parse trees.
+    By default operators and calls are applied to the transformed operands, subclasses define ref
+    to replace references and can override the other methods to build something else than values """
+    def transform(self, expr):
+        from xdeps.refs import BaseRef, BinOpExpr, BuiltinRef, CallRef, LiteralExpr, MutableRef, UnaryOpExpr
+        if not isinstance(expr, BaseRef):
+            return self.literal(expr)
+        if isinstance(expr, MutableRef):
+            root, keys = split_ref(expr)
+            return self.ref(expr, root, keys)
+        if isinstance(expr, BinOpExpr):
+            return self.binary(expr._op_str, self.transform(expr._lhs), self.transform(expr._rhs))
+        if isinstance(expr, UnaryOpExpr):
+            return self.unary(expr._op_str, self.transform(expr._arg))
+        if isinstance(expr, LiteralExpr):
+            return self.literal(expr._arg)
+        if isinstance(expr, BuiltinRef):
+            return self.call(expr._op, [self.transform(expr._arg)] + [self.literal(param) for param in expr._params], {})
+        if isinstance(expr, CallRef):
+            return self.call(self.transform(expr._func), [self.transform(arg) for arg in expr._args],
+                             {key: self.transform(arg) for key, arg in expr._kwargs})
+        raise ValueError(f'Expression {expr} cannot be transformed')
+
+    def ref(self, expr, root, keys: tuple):
+        """ Replace reference expr, which is root followed by keys """
+        raise NotImplementedError
+
+    def literal(self, value):
+        return value
+
+    def binary(self, op: str, lhs, rhs):
+        return BINARY_OPERATORS[op](lhs, rhs)
+
+    def unary(self, op: str, arg):
+        return UNARY_OPERATORS[op](arg)
+
+    def call(self, function, args: list, kwargs: dict):
+        return function(*args, **kwargs)
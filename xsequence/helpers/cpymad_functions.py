@@ -0,0 +1,73 @@
+import os
+import tempfile
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam
+from xsequence.helpers import madx_functions as mf
+from xsequence.helpers import madx_parser
+
+
+_MADX_FLOAT_FORMAT = '18.10g'
+
+
+def _read_globals(madx, names: set, read_all: bool = False) -> "Tuple[dict, dict]":
+    """ Read values and deferred expressions of globals used by names, following their dependencies """
+    values, expressions = {}, {}
+    pending = set(madx.globals.cmdpar) if read_all else set(names)
+    while pending:
+        name = pending.pop()
+        if name in values:
+            continue
+        try:
+            parameter = madx.globals.cmdpar[name]
+        except KeyError:
+            values[name] = 0.0
+            continue
+        values[name] = parameter.value
+        if parameter.expr is not None:
+            expressions[name] = parameter.expr
+            pending |= mf.get_expression_names(parameter.expr) - values.keys()
+    return values, expressions
+
+
+def _get_assignments(values: dict, expressions: dict) -> list:
+    """ MAD-X assignments of globals, deferred when they have an expression """
+    return [f'{key} := {expressions[key]};' if key in expressions else f'{key} = {value!r};'
+            for key, value in values.items()]
+
+
+def _save_sequence(madx, sequence_name: str, path: str):
+    """ Save sequence with its elements and used globals, with a float format which keeps full precision """
+    madx.input('set, format="25.17g";')
+    try:
+        madx.input(f'save, sequence={sequence_name}, file="{path}";')
+    finally:
+        madx.input(f'set, format="{_MADX_FLOAT_FORMAT}";')
+
+
+def from_cpymad(madx, sequence_name: str, name: str = None,
+                deferred_expressions: bool = True, read_all_globals: bool = False) -> Lattice:
+    """ Import MAD-X sequence from a cpymad instance.
+    The sequence is saved by MAD-X in one call and read back with the MAD-X parser, only the predefined
+    constants used by its expressions (or all globals, with read_all_globals) are read one by one. Deferred
+    expressions are kept as xdeps expressions of the lattice globals. The MAD-X float format is reset to
+    its default """
+    parser = madx_parser.MadxParser()
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, f'{sequence_name}.madx')
+        _save_sequence(madx, sequence_name, path)
+        result = parser.parse_file(path)
+    parser.parse_lines(_get_assignments(*_read_globals(madx, result.get_undefined_globals(sequence_name))))
+
+    lattice = result.to_lattice(sequence_name, name=name, deferred_expressions=deferred_expressions)
+    if read_all_globals:
+        values, expressions = _read_globals(madx, set(), read_all=True)
+        values = {key: value for key, value in values.items() if key not in lattice._data_globals}
+        lattice._data_globals.update(values)
+        if deferred_expressions:
+            mf.set_deferred_expressions(lattice, {key: expressions[key] for key in values if key in expressions}, {})
+    sequence = madx.sequence[sequence_name]
+    if sequence.has_beam:
+        lattice.beam = Beam(energy=sequence.beam.energy, particle=sequence.beam.particle)
+    else:
+        lattice.beam = Beam(energy=madx.beam.energy, particle=madx.beam.particle)
+    return lattice
@@ -0,0 +1,161 @@
+import re
+import functools
+import numpy as np
+import xsequence.elements as xe
+import xsequence.elements_dataclasses as xed
+
+
+MADX_ELEMENT_CLASSES = {'drift':       xe.Drift,
+                        'marker':      xe.Marker,
+                        'monitor':     xe.Monitor,
+                        'hmonitor':    xe.Monitor,
+                        'vmonitor':    xe.Monitor,
+                        'instrument':  xe.Instrument,
+                        'placeholder': xe.Placeholder,
+                        'collimator':  xe.Collimator,
+                        'rcollimator': xe.Collimator,
+                        'ecollimator': xe.Collimator,
+                        'sbend':       xe.SectorBend,
+                        'rbend':       xe.RectangularBend,
+                        'quadrupole':  xe.Quadrupole,
+                        'sextupole':   xe.Sextupole,
+                        'octupole':    xe.Octupole,
+                        'multipole':   xe.ThinMultipole,
+                        'solenoid':    xe.Solenoid,
+                        'rfcavity':    xe.RFCavity,
+                        'hkicker':     xe.HKicker,
+                        'vkicker':     xe.VKicker,
+                        'kicker':      xe.TKicker,
+                        'tkicker':     xe.TKicker,
+                       }
+
+MADX_ATTRIBUTES = {'l':      'length',
+                   'volt':   'voltage',
+                   'freq':   'frequency',
+                   'harmon': 'harmonic_number',
+                   'lrad':   'radiation_length',
+                  }
+
+MADX_POS_ANCHORS = {'entry': 'start', 'centre': 'center', 'center': 'center', 'exit': 'end'}
+
+MADX_FUNCTIONS = {'sqrt', 'log', 'log10', 'exp', 'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2',
+                  'sinh', 'cosh', 'tanh', 'abs', 'floor', 'ceil', 'round', 'ranf', 'gauss', 'tgauss', 'erf', 'erfc'}
+
+_EXTRA_ATTRIBUTES = {xe.SectorBend: ['k0', 'k1'],
+                     xe.RFCavity:   ['harmonic_number'],
+                     xe.ThinElement: ['radiation_length'],
+                    }
+
+_NAME_PATTERN = re.compile(r'[A-Za-z_\.][A-Za-z0-9_\.%]*')
+
+
+def get_element_class(keyword: str, length: float = 0.0):
+    """ Get xsequence class of MAD-X element keyword, thin solenoids are ThinSolenoid """
+    element_class = MADX_ELEMENT_CLASSES.get(keyword.lower())
+    if element_class is xe.Solenoid and length == 0.0:
+        return xe.ThinSolenoid
+    return element_class
+
+
+def get_element_attributes(element_class) -> list:
+    """ Get xsequence attributes of element class which are read from MAD-X """
+    attributes = list(getattr(element_class, 'REQUIREMENTS', []))
+    for cls, extra in _EXTRA_ATTRIBUTES.items():
+        if issubclass(element_class, cls):
+            attributes += [attr for attr in extra if attr not in attributes]
+    return attributes
+
+
+def get_madx_attribute(attribute: str) -> str:
+    """ Get MAD-X name of xsequence element attribute """
+    for madx_attribute, xsequence_attribute in MADX_ATTRIBUTES.items():
+        if xsequence_attribute == attribute:
+            return madx_attribute
+    return attribute
+
+
+def get_aperture_data(values: dict):
+    """ Get aperture dataclass from MAD-X aperture parameters, None if no aperture is defined """
+    aperture = np.trim_zeros(np.array(values.get('aperture', [0.0]), dtype=float), trim='b')
+    if len(aperture) == 0:
+        return None
+    offset = list(values.get('aper_offset', [0.0, 0.0])) + [0.0, 0.0]
+    apertype = values.get('apertype', 'circle')
+    if apertype == 'circle':
+        return xed.EllipticalAperture(aperture_size=[aperture[0], aperture[0]], aperture_offset=offset[:2])
+    elif apertype == 'ellipse':
+        return xed.EllipticalAperture(aperture_size=list(np.resize(aperture, 2)), aperture_offset=offset[:2])
+    elif apertype == 'rectangle':
+        return xed.RectangularAperture(aperture_size=list(np.resize(aperture, 2)), aperture_offset=offset[:2])
+    return None
+
+
+def madx_element_to_xsequence(name: str, keyword: str, values: dict):
+    """ Create xsequence element from MAD-X keyword and dict of MAD-X parameter values """
+    element_class = get_element_class(keyword, values.get('l', 0.0))
+    if element_class is None:
+        raise ValueError(f'No xsequence element class defined for MAD-X keyword {keyword} of element {name}')
+    kwargs = {}
+    for attribute in get_element_attributes(element_class):
+        madx_attribute = get_madx_attribute(attribute)
+        if madx_attribute in values:
+            kwargs[attribute] = values[madx_attribute]
+    if issubclass(element_class, xe.ThinElement):
+        kwargs.pop('length', None)
+    for key in ['knl', 'ksl']:
+        if key in kwargs:
+            kwargs[key] = np.array(kwargs[key], dtype=float)
+    aperture_data = get_aperture_data(values)
+    if aperture_data is not None:
+        kwargs['aperture_data'] = aperture_data
+    if values.get('tilt', 0.0) != 0.0:
+        kwargs['parameter_data'] = xed.ElementParameterData(tilt=values['tilt'])
+    return element_class(name, **kwargs)
+
+
+def get_expression_names(expression: str) -> set:
+    """ Get names of variables used in MAD-X expression, without functions and element attributes """
+    expression = re.sub(r'[A-Za-z_\.][A-Za-z0-9_\.%]*\s*->\s*[A-Za-z_][A-Za-z0-9_]*', ' ', expression)
+    expression = re.sub(r'\d+\.?\d*[eE][+-]?\d+', ' ', expression)
+    names = set(_NAME_PATTERN.findall(expression.lower()))
+    return {name for name in names if name not in MADX_FUNCTIONS and not re.fullmatch(r'\.?\d*\.?', name)}
+
+
+class _MadxElementRefs:
+    """ Element references accessed with MAD-X attribute names, as in qf->l """
+    def __init__(self, elements):
+        self.elements = elements
+
+    def __getitem__(self, name):
+        return _MadxElementRef(self.elements[str(name)])
+
+
+class _MadxElementRef:
+    def __init__(self, element):
+        self.element = element
+
+    def __getattr__(self, attribute):
+        attribute = str(attribute)
+        return getattr(self.element, MADX_ATTRIBUTES.get(attribute, attribute))
+
+
+def get_madx_evaluator(lattice):
+    """ Get evaluator of MAD-X expressions into xdeps expressions of the lattice globals """
+    import xdeps
+    return xdeps.madxutils.MadxEval(lattice._globals, lattice._math, _MadxElementRefs(lattice._elements), get='attr').eval
+
+
+def set_deferred_expressions(lattice, global_expressions: dict, element_expressions: dict):
+    """ Set deferred MAD-X expressions as xdeps expressions.
+    global_expressions: {variable: expression}, element_expressions: {(element, attribute): expression}.
+    Expressions are evaluated once, as many elements are usually powered by the same expression """
+    evaluate = functools.lru_cache(maxsize=None)(get_madx_evaluator(lattice))
+    for name, expression in global_expressions.items():
+        lattice._globals[name] = evaluate(expression)
+    for (name, attribute), expression in element_expressions.items():
+        if attribute in ['knl', 'ksl']:
+            for idx, item in enumerate(expression):
+                if item is not None:
+                    getattr(lattice._elements[name], attribute)[idx] = evaluate(item)
+        else:
+            setattr(lattice._elements[name], attribute, evaluate(expression))
@@ -0,0 +1,646 @@
+import os
+import re
+import math
+import pickle
+import hashlib
+import functools
+import concurrent.futures
+from collections import OrderedDict
+from dataclasses import dataclass, field
+import lark
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import NodesList, Node, Beam
+from xsequence.helpers import madx_functions as mf
+
+
+MADX_GRAMMAR = r"""
+    ?start: NAME ASSIGN expr                 -> assignment
+          | NAME "->" NAME ASSIGN value      -> attribute_assignment
+          | NAME ":" NAME params             -> definition
+          | NAME params                      -> command
+
+    params: ("," param)*
+    ?param: NAME ASSIGN value                -> param_value
+          | NAME                             -> param_flag
+          | "-" NAME                         -> param_unset
+
+    ?value: expr
+          | STRING                           -> string
+          | "{" [value ("," value)*] "}"     -> array
+
+    ?expr: product
+         | expr "+" product                  -> add
+         | expr "-" product                  -> sub
+    ?product: power
+            | product "*" power              -> mul
+            | product "/" power              -> div
+    ?power: atom
+          | atom ("^" | "**") power          -> pow
+    ?atom: NUMBER                            -> number
+         | "-" atom                          -> neg
+         | "+" atom
+         | NAME                              -> var
+         | NAME "->" NAME                    -> element_attribute
+         | NAME "(" [expr ("," expr)*] ")"   -> call
+         | "(" expr ")"                      -> group
+
+    ASSIGN: ":=" | "="
+    NAME: /[a-z_][a-z0-9_.$]*/
+    NUMBER: /(\d+\.?\d*|\.\d+)(e[+-]?\d+)?/
+    STRING: /"[^"]*"|'[^']*'/
+
+    %ignore /\s+/
+"""
+
+STRING_PARAMETERS = {'apertype', 'particle', 'refer', 'from', 'file', 'sequence', 'refpos', 'type', 'class', 'range'}
+
+_MODIFIERS = re.compile(r'^\s*((const|real|int|shared)\s+)+')
+_QUOTED = re.compile(r'("[^"]*"|\'[^\']*\')')
+_NUMBER = r'(?:\d+\.?\d*|\.\d+)(?:e[+-]?\d+)?'
+_NAME = r'[a-z_][a-z0-9_.$]*'
+_SIMPLE_NODE = re.compile(rf'({_NAME})\s*,\s*at\s*=\s*(-?{_NUMBER})(?:\s*,\s*from\s*=\s*({_NAME}))?')
+_SIMPLE_ASSIGNMENT = re.compile(rf'({_NAME})\s*(:?=)\s*(-?{_NUMBER})')
+_SIMPLE_VALUE = r'(?:"[^"]*"|\'[^\']*\'|\{[^{}"\']*\}|[^,{}()"\']+)'
+_SIMPLE_DEFINITION = re.compile(rf'({_NAME})\s*:\s*({_NAME})((?:\s*,\s*{_NAME}\s*:?=\s*{_SIMPLE_VALUE})*)\s*')
+_SIMPLE_PARAM = re.compile(rf'\s*,\s*({_NAME})\s*(:?=)\s*({_SIMPLE_VALUE})')
+_CONSTANT = re.compile(rf'-?{_NUMBER}')
+
+_FUNCTIONS = {'sqrt': math.sqrt, 'log': math.log, 'log10': math.log10, 'exp': math.exp,
+              'sin': math.sin, 'cos': math.cos, 'tan': math.tan, 'asin': math.asin, 'acos': math.acos,
+              'atan': math.atan, 'atan2': math.atan2, 'sinh': math.sinh, 'cosh': math.cosh, 'tanh': math.tanh,
+              'abs': abs, 'floor': math.floor, 'ceil': math.ceil, 'round': round, 'erf': math.erf, 'erfc': math.erfc}
+
+_RESULT_CACHE = OrderedDict()
+_RESULT_CACHE_SIZE = 16
+
+
+class MadxParseError(ValueError):
+    """ Error raised for statements which cannot be interpreted """
+
+
+@lark.v_args(inline=True)
+class _StatementTransformer(lark.Transformer):
+    """ Transform parsed statements into tuples, expressions into (MAD-X, python) source pairs """
+    def assignment(self, name, assign, expr):
+        return ('assign', str(name), assign == ':=', expr)
+
+    def attribute_assignment(self, name, attribute, assign, value):
+        return ('attribute', str(name), str(attribute), assign == ':=', value)
+
+    def definition(self, name, keyword, params):
+        return ('define', str(name), str(keyword), params)
+
+    def command(self, name, params):
+        return ('command', str(name), params)
+
+    def params(self, *params):
+        return list(params)
+
+    def param_value(self, name, assign, value):
+        return (str(name), assign == ':=', value)
+
+    def param_flag(self, name):
+        return (str(name), False, True)
+
+    def param_unset(self, name):
+        return (str(name), False, False)
+
+    def string(self, token):
+        return str(token)[1:-1]
+
+    def array(self, *values):
+        return [value for value in values if value is not None]
+
+    def number(self, token):
+        return (str(token), str(token))
+
+    def var(self, name):
+        return (str(name), f'v[{str(name)!r}]')
+
+    def element_attribute(self, name, attribute):
+        return (f'{name}->{attribute}', f'e({str(name)!r}, {str(attribute)!r})')
+
+    def call(self, name, *args):
+        args = [arg for arg in args if arg is not None]
+        if name not in _FUNCTIONS:
+            raise MadxParseError(f'Unknown MAD-X function {name}')
+        return (f'{name}({", ".join(arg[0] for arg in args)})', f'f[{str(name)!r}]({", ".join(arg[1] for arg in args)})')
+
+    def group(self, expr):
+        return (f'({expr[0]})', f'({expr[1]})')
+
+    def neg(self, expr):
+        return (f'-{expr[0]}', f'(-{expr[1]})')
+
+    def _binary(operator, python_operator=None):
+        def method(self, left, right):
+            return (f'{left[0]} {operator} {right[0]}', f'({left[1]} {python_operator or operator} {right[1]})')
+        return method
+
+    add = _binary('+')
+    sub = _binary('-')
+    mul = _binary('*')
+    div = _binary('/')
+    pow = _binary('^', '**')
+
+
+@functools.lru_cache(maxsize=None)
+def get_statement_parser() -> lark.Lark:
+    """ Get LALR parser of single MAD-X statements (start) or values (value), transforming while parsing
+    without building trees """
+    return lark.Lark(MADX_GRAMMAR, parser='lalr', transformer=_StatementTransformer(), maybe_placeholders=True,
+                     start=['start', 'value'])
+
+
+@functools.lru_cache(maxsize=None)
+def _parse_value(text: str):
+    """ Parse parameter value, cached as the same expressions are repeated over many elements """
+    return get_statement_parser().parse(text, start='value')
+
+
+def _is_constant(value) -> bool:
+    if isinstance(value, list):
+        return all(_is_constant(item) for item in value)
+    return not isinstance(value, tuple) or _CONSTANT.fullmatch(value[0]) is not None
+
+
+def _strip_comments(line: str, in_comment: bool) -> "Tuple[str, bool]":
+    """ Remove '!', '//' and '/* */' comments from line, returns stripped line and whether a block comment is open """
+    result = []
+    while line:
+        if in_comment:
+            end = line.find('*/')
+            if end < 0:
+                return ''.join(result), True
+            line, in_comment = line[end+2:], False
+            continue
+        match = re.search(r'!|//|/\*|"|\'', line)
+        if match is None:
+            result.append(line)
+            break
+        token = match.group()
+        result.append(line[:match.start()])
+        if token in ('"', "'"):
+            end = line.find(token, match.end())
+            end = len(line) if end < 0 else end + 1
+            result.append(line[match.start():end])
+            line = line[end:]
+        elif token == '/*':
+            line, in_comment = line[match.end():], True
+        else:
+            break
+    return ''.join(result), in_comment
+
+
+def _lower_outside_quotes(statement: str) -> str:
+    if '"' not in statement and "'" not in statement:
+        return statement.lower()
+    parts = _QUOTED.split(statement)
+    return ''.join(part if idx % 2 else part.lower() for idx, part in enumerate(parts))
+
+
+def iter_statements(lines):
+    """ Iterate over the lower case statements of MAD-X input lines, without comments """
+    buffer = []
+    in_comment = False
+    for line in lines:
+        line, in_comment = _strip_comments(line, in_comment)
+        if ';' not in line:
+            buffer.append(line)
+            continue
+        parts = line.split(';')
+        buffer.append(parts[0])
+        for part in parts[1:]:
+            statement = _lower_outside_quotes(' '.join(buffer).strip())
+            if statement:
+                yield statement
+            buffer = [part]
+    statement = ' '.join(buffer).strip()
+    if statement:
+        yield _lower_outside_quotes(statement)
+
+
+def _file_hash(path: str) -> str:
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(functools.partial(f.read, 1 << 20), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+@dataclass
+class MadxElement:
+    """ MAD-X element definition with immediate values and deferred expressions of its parameters """
+    name: str
+    base_type: str
+    values: dict = field(default_factory=dict)
+    expressions: dict = field(default_factory=dict)
+
+
+@dataclass
+class MadxSequence:
+    """ MAD-X sequence definition with nodes as (element name, at expression, from element) """
+    name: str
+    length: tuple = ('0', '0')
+    refer: str = 'centre'
+    nodes: list = field(default_factory=list)
+
+
+class _Variables(dict):
+    """ Global variables, deferred expressions are evaluated on access and undefined variables are zero """
+    def __init__(self, result):
+        super().__init__()
+        self.result = result
+        self._evaluating = set()
+
+    def __missing__(self, name):
+        expression = self.result.deferred_variables.get(name)
+        if expression is None:
+            return 0.0
+        if name in self._evaluating:
+            raise MadxParseError(f'Circular deferred expression of variable {name}')
+        self._evaluating.add(name)
+        try:
+            return self.result.evaluate(expression)
+        finally:
+            self._evaluating.discard(name)
+
+
+@dataclass
+class MadxParseResult:
+    """ Content of parsed MAD-X files: globals, element definitions, sequences and beam """
+    variables: dict = field(default_factory=dict)
+    deferred_variables: dict = field(default_factory=dict)
+    elements: dict = field(default_factory=dict)
+    sequences: dict = field(default_factory=dict)
+    beam: dict = field(default_factory=dict)
+    files: dict = field(default_factory=dict)
+    skipped: list = field(default_factory=list)
+
+    def __getstate__(self):
+        state = self.__dict__.copy()
+        state.pop('_namespace', None)
+        state['variables'] = dict(self.variables)
+        return state
+
+    @property
+    def namespace(self) -> dict:
+        namespace = self.__dict__.get('_namespace')
+        if namespace is None:
+            variables = _Variables(self)
+            variables.update(self.variables)
+            self.variables = variables
+            namespace = {'v': variables, 'e': self.get_element_value, 'f': _FUNCTIONS, '__builtins__': {}}
+            self.__dict__['_namespace'] = namespace
+        return namespace
+
+    def evaluate(self, expression: tuple) -> float:
+        """ Evaluate (MAD-X, python) expression pair with the current variables """
+        return eval(_compile(expression[1]), self.namespace)
+
+    def evaluate_value(self, value):
+        if isinstance(value, list):
+            return [self.evaluate_value(item) for item in value]
+        if isinstance(value, tuple):
+            return self.evaluate(value)
+        return value
+
+    def get_element_value(self, name: str, attribute: str):
+        """ Get current value of MAD-X element parameter """
+        element = self.elements.get(name)
+        if element is None:
+            return 0.0
+        if attribute in element.expressions:
+            return self.evaluate_value(element.expressions[attribute])
+        return element.values.get(attribute, 0.0)
+
+    def get_element_values(self, name: str) -> dict:
+        element = self.elements[name]
+        values = dict(element.values)
+        values.update({key: self.evaluate_value(expr) for key, expr in element.expressions.items()})
+        return values
+
+    def get_global_values(self) -> dict:
+        """ Get current values of all globals """
+        self.namespace
+        values = dict(self.variables)
+        values.update({name: self.variables[name] for name in self.deferred_variables})
+        return values
+
+    def _get_used_globals(self, expressions) -> set:
+        """ Get globals used by MAD-X expressions, following their deferred dependencies """
+        names, pending = set(), set()
+        for expression in expressions:
+            pending |= mf.get_expression_names(expression)
+        while pending:
+            name = pending.pop()
+            names.add(name)
+            if name in self.deferred_variables:
+                pending |= mf.get_expression_names(self.deferred_variables[name][0]) - names
+        return names
+
+    def get_undefined_globals(self, sequence_name: str) -> set:
+        """ Get globals used by the node positions and element expressions of sequence which are not defined,
+        such as the predefined constants of MAD-X """
+        sequence = self.sequences[sequence_name]
+        expressions = [at[0] for _, at, _ in sequence.nodes]
+        for element_name in dict.fromkeys(node[0] for node in sequence.nodes):
+            element = self.elements.get(element_name)
+            for expression in ([] if element is None else element.expressions.values()):
+                items = expression if isinstance(expression, list) else [expression]
+                expressions += [item[0] for item in items if isinstance(item, tuple)]
+        return {name for name in self._get_used_globals(expressions)
+                if name not in self.variables and name not in self.deferred_variables}
+
+    def _get_node_positions(self, sequence: MadxSequence) -> list:
+        """ Get (location, reference) of sequence nodes, references are anchor positions of 'from' elements """
+        locations = [self.evaluate_value(at) for _, at, _ in sequence.nodes]
+        anchors, anchor_from = {}, {}
+        for (name, _, from_name), location in zip(sequence.nodes, locations):
+            anchors.setdefault(name, location)
+            anchor_from.setdefault(name, from_name)
+        positions = []
+        for (name, _, from_name), location in zip(sequence.nodes, locations):
+            reference = 0.0
+            seen = set()
+            while from_name:
+                if from_name not in anchors or from_name in seen:
+                    raise MadxParseError(f'Cannot resolve from={from_name} of {name} in sequence {sequence.name}')
+                seen.add(from_name)
+                reference += anchors[from_name]
+                from_name = anchor_from[from_name]
+            positions.append((location, reference))
+        return positions
+
+    def to_lattice(self, sequence_name: str, name: str = None, deferred_expressions: bool = True) -> Lattice:
+        """ Build lattice of a parsed sequence, deferred expressions are kept as xdeps expressions """
+        sequence = self.sequences[sequence_name]
+        element_names = [node[0] for node in sequence.nodes]
+        elements = {}
+        element_expressions = {}
+        for element_name in dict.fromkeys(element_names):
+            madx_element = self.elements.get(element_name)
+            if madx_element is None:
+                raise MadxParseError(f'Element {element_name} of sequence {sequence_name} is not defined')
+            element = mf.madx_element_to_xsequence(element_name, madx_element.base_type,
+                                                   self.get_element_values(element_name))
+            elements[element_name] = element
+            for attribute in mf.get_element_attributes(type(element)):
+                expression = madx_element.expressions.get(mf.get_madx_attribute(attribute))
+                if expression is None:
+                    continue
+                if isinstance(expression, list):
+                    expression = [item[0] if isinstance(item, tuple) else None for item in expression]
+                else:
+                    expression = expression[0]
+                element_expressions[(element_name, attribute)] = expression
+
+        if not deferred_expressions:
+            element_expressions = {}
+        items = [item for expr in element_expressions.values() for item in (expr if isinstance(expr, list) else [expr])]
+        used = self._get_used_globals(item for item in items if item is not None)
+        global_values = self.get_global_values()
+        global_variables = {name: global_values.get(name, 0.0) for name in sorted(used)}
+        global_expressions = {name: self.deferred_variables[name][0] for name in global_variables
+                              if name in self.deferred_variables}
+
+        pos_anchor = mf.MADX_POS_ANCHORS[sequence.refer]
+        nodes = NodesList()
+        for (element_name, _, from_name), (location, reference) in zip(sequence.nodes, self._get_node_positions(sequence)):
+            nodes.append(Node(element_name, pos_anchor=pos_anchor, length=elements[element_name].length,
+                              location=location, reference=reference, reference_element=from_name or ''))
+
+        beam = Beam(energy=float(self.evaluate_value(self.beam.get('energy', ('1.0', '1.0')))),
+                    particle=self.beam.get('particle', 'positron'))
+        lattice = Lattice(name or sequence_name, elements, nodes, beam, global_variables=global_variables)
+        if deferred_expressions:
+            mf.set_deferred_expressions(lattice, global_expressions, element_expressions)
+        return lattice
+
+
+@functools.lru_cache(maxsize=None)
+def _compile(source: str):
+    return compile(source, '<madx>', 'eval')
+
+
+class MadxParser:
+    """ Streaming parser of MAD-X input files into a MadxParseResult """
+    def __init__(self, result: MadxParseResult = None):
+        self.result = result or MadxParseResult()
+        self.parser = get_statement_parser()
+        self.sequence = None
+        self._directory = '.'
+
+    def _value(self, deferred: bool, value):
+        """ Keep deferred values as expressions, evaluate immediate values """
+        if deferred:
+            return value
+        return self.result.evaluate_value(value)
+
+    def _parse_params(self, params: list, element: MadxElement = None) -> dict:
+        values = {}
+        for key, deferred, value in params:
+            if key in STRING_PARAMETERS and isinstance(value, tuple):
+                value = value[0]
+            deferred = deferred and not _is_constant(value)
+            if element is not None and deferred and isinstance(value, (tuple, list)):
+                element.values.pop(key, None)
+                element.expressions[key] = value
+                continue
+            if element is not None:
+                element.expressions.pop(key, None)
+            values[key] = self._value(deferred, value) if not isinstance(value, str) else value
+        return values
+
+    def _parse_simple(self, statement: str):
+        """ Parse the most frequent statements, sequence nodes, numeric assignments and element definitions,
+        without the LALR parser or parsing each parameter value only once """
+        match = _SIMPLE_NODE.fullmatch(statement)
+        if match is not None:
+            name, at, from_name = match.groups()
+            params = [('at', False, (at, at))] + ([('from', False, (from_name, from_name))] if from_name else [])
+            return ('command', name, params)
+        match = _SIMPLE_ASSIGNMENT.fullmatch(statement)
+        if match is not None:
+            name, assign, value = match.groups()
+            return ('assign', name, assign == ':=', (value, value))
+        match = _SIMPLE_DEFINITION.fullmatch(statement)
+        if match is not None:
+            name, keyword, params = match.groups()
+            try:
+                params = [(key, assign == ':=', _parse_value(value.strip()))
+                          for key, assign, value in _SIMPLE_PARAM.findall(params)]
+            except lark.exceptions.LarkError:
+                return None
+            return ('define', name, keyword, [(key, deferred, list(value) if isinstance(value, list) else value)
+                                              for key, deferred, value in params])
+        return None
+
+    def parse_statement(self, statement: str):
+        """ Parse and apply one MAD-X statement, statements which are not understood are skipped """
+        statement = _MODIFIERS.sub('', statement)
+        parsed = self._parse_simple(statement)
+        if parsed is not None:
+            getattr(self, f'_apply_{parsed[0]}')(*parsed[1:])
+            return
+        try:
+            parsed = self.parser.parse(statement, start='start')
+        except (lark.exceptions.LarkError, MadxParseError):
+            self.result.skipped.append(statement)
+            return
+        getattr(self, f'_apply_{parsed[0]}')(*parsed[1:])
+
+    def _apply_assign(self, name, deferred, expr):
+        self.result.namespace
+        if deferred:
+            self.result.variables.pop(name, None)
+            self.result.deferred_variables[name] = expr
+        else:
+            value = self.result.evaluate(expr)
+            self.result.deferred_variables.pop(name, None)
+            self.result.variables[name] = value
+
+    def _apply_attribute(self, name, attribute, deferred, value):
+        element = self.result.elements.get(name)
+        if element is None:
+            self.result.skipped.append(f'{name}->{attribute}')
+            return
+        element.values.update(self._parse_params([(attribute, deferred, value)], element))
+
+    def _apply_define(self, name, keyword, params):
+        if keyword == 'sequence':
+            values = self._parse_params(params)
+            self.sequence = MadxSequence(name, refer=values.get('refer', 'centre'))
+            self.sequence.length = dict((key, value) for key, _, value in params).get('l', ('0', '0'))
+            self.result.sequences[name] = self.sequence
+            return
+        node_params = [param for param in params if param[0] in ('at', 'from')]
+        params = [param for param in params if param[0] not in ('at', 'from')]
+        parent = self.result.elements.get(keyword)
+        if parent is not None:
+            element = MadxElement(name, parent.base_type, dict(parent.values), dict(parent.expressions))
+        elif keyword in mf.MADX_ELEMENT_CLASSES:
+            element = MadxElement(name, keyword)
+        else:
+            self.result.skipped.append(f'{name}: {keyword}')
+            return
+        element.values.update(self._parse_params(params, element))
+        self.result.elements[name] = element
+        if self.sequence is not None and node_params:
+            self._add_node(name, node_params)
+
+    def _add_node(self, name, params):
+        node = dict((key, value) for key, _, value in params)
+        from_name = node.get('from')
+        if isinstance(from_name, tuple):
+            from_name = from_name[0]
+        self.sequence.nodes.append((name, node.get('at', ('0', '0')), from_name))
+
+    def _apply_command(self, name, params):
+        if name == 'endsequence':
+            self.sequence = None
+        elif self.sequence is not None and name in self.result.elements:
+            self._add_node(name, params)
+        elif name == 'beam':
+            self.result.beam.update({key: value[0] if key in STRING_PARAMETERS and isinstance(value, tuple) else value
+                                     for key, _, value in params})
+        elif name == 'call':
+            path = self._parse_params(params).get('file')
+            if path is not None:
+                self.parse_file(os.path.join(self._directory, path))
+        elif name in self.result.elements and params:
+            element = self.result.elements[name]
+            element.values.update(self._parse_params(params, element))
+        else:
+            self.result.skipped.append(name)
+
+    def parse_lines(self, lines):
+        for statement in iter_statements(lines):
+            if statement in ('return', 'stop', 'exit', 'quit'):
+                break
+            self.parse_statement(statement)
+        return self.result
+
+    def parse_file(self, path: str):
+        """ Parse MAD-X file, streamed line by line. Called files are parsed relative to its directory """
+        self.result.files[os.path.abspath(path)] = _file_hash(path)
+        directory, self._directory = self._directory, os.path.dirname(os.path.abspath(path))
+        try:
+            with open(path, 'r') as f:
+                self.parse_lines(f)
+        finally:
+            self._directory = directory
+        return self.result
+
+
+def parse_madx_string(text: str) -> MadxParseResult:
+    """ Parse MAD-X input string """
+    return MadxParser().parse_lines(text.splitlines())
+
+
+def _is_valid(result: MadxParseResult) -> bool:
+    """ Check that all parsed files, including called files, are unchanged """
+    try:
+        return all(_file_hash(path) == digest for path, digest in result.files.items())
+    except OSError:
+        return False
+
+
+def _cache_key(path: str, digest: str = None) -> str:
+    """ Key of parse results, from the absolute path and content of file, as called files are relative to it """
+    path = os.path.abspath(path)
+    digest = _file_hash(path) if digest is None else digest
+    return hashlib.sha256(f'{path}\0{digest}'.encode()).hexdigest()
+
+
+def _cache_result(key: str, result: MadxParseResult):
+    """ Keep pickled result in the in-memory cache, dropping the least recently used above _RESULT_CACHE_SIZE """
+    _RESULT_CACHE[key] = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+    _RESULT_CACHE.move_to_end(key)
+    while len(_RESULT_CACHE) > _RESULT_CACHE_SIZE:
+        _RESULT_CACHE.popitem(last=False)
+
+
+def parse_madx_file(path: str, cache_dir: str = None) -> MadxParseResult:
+    """ Parse MAD-X file, cached by file path and hash in memory and in cache_dir if given.
+    Every call returns its own copy of the result, unpickled from the cache """
+    key = _cache_key(path)
+    result = pickle.loads(_RESULT_CACHE[key]) if key in _RESULT_CACHE else None
+    cache_file = os.path.join(cache_dir, f'{key}.pkl') if cache_dir is not None else None
+    if result is None and cache_file is not None and os.path.exists(cache_file):
+        with open(cache_file, 'rb') as f:
+            result = pickle.load(f)
+    if result is not None and _is_valid(result):
+        if key in _RESULT_CACHE:
+            _RESULT_CACHE.move_to_end(key)
+        else:
+            _cache_result(key, result)
+        return result
+
+    result = MadxParser().parse_file(path)
+    _cache_result(key, result)
+    if cache_file is not None:
+        os.makedirs(cache_dir, exist_ok=True)
+        with open(cache_file, 'wb') as f:
+            pickle.dump(result, f, protocol=pickle.HIGHEST_PROTOCOL)
+    return result
+
+
+def parse_madx_files(paths: list, max_workers: int = None, cache_dir: str = None) -> list:
+    """ Parse independent MAD-X files in parallel, one file per worker process """
+    paths = list(paths)
+    if len(paths) <= 1 or max_workers == 1:
+        return [parse_madx_file(path, cache_dir=cache_dir) for path in paths]
+    with concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(functools.partial(parse_madx_file, cache_dir=cache_dir), paths))
+    for path, result in zip(paths, results):
+        path = os.path.abspath(path)
+        _cache_result(_cache_key(path, result.files[path]), result)
+    return results
+
+
+def from_madx_file(path: str, sequence_name: str, name: str = None,
+                   deferred_expressions: bool = True, cache_dir: str = None) -> Lattice:
+    """ Import MAD-X sequence from file without MAD-X """
+    return parse_madx_file(path, cache_dir=cache_dir).to_lattice(sequence_name, name=name,
+                                                                 deferred_expressions=deferred_expressions)
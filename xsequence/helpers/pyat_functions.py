@@ -1,28 +1,118 @@
-import at
+import fnmatch
+import math
 import numpy as np
-import pandas as pd
-
-
-def pyat_optics_to_pandas_df(ring, lin):
-    df = pd.DataFrame()
-    df['name'] = [ring[i].FamName for i in lin['idx']]
-    df['keyword'] = [ring[i].__class__.__name__.lower() for i in lin['idx']]
-    df['s'] = lin['s_pos']
-    df['betx'] = lin['beta'][:,0]
-    df['bety'] = lin['beta'][:,1]
-    df['alfx'] = lin['alpha'][:,0]
-    df['alfy'] = lin['alpha'][:,1]
-    df['mux'] = lin['mu'][:,0]
-    df['muy'] = lin['mu'][:,1]
-    df['dx'] = lin['dispersion'][:,0]
-    df['dy'] = lin['dispersion'][:,1]
-    df['x'] = lin['closed_orbit'][:,0]
-    df['px'] = lin['closed_orbit'][:,1]
-    df['y'] = lin['closed_orbit'][:,2]
-    df['py'] = lin['closed_orbit'][:,3]
-    df['delta'] = lin['closed_orbit'][:,4]
-    df['ct'] = lin['closed_orbit'][:,5]
-    return df
+import xsequence.elements as xe
+from xsequence import validation
+from xsequence._lazy import lazy_import
+from xsequence.profiling import instrument
+
+at = lazy_import('at')
+pd = lazy_import('pandas')
+
+
+PYAT_CLASSES = {xe.Drift:         'Drift',
+                xe.Monitor:       'Monitor',
+                xe.Marker:        'Marker',
+                xe.SectorBend:    'Dipole',
+                xe.Quadrupole:    'Quadrupole',
+                xe.Sextupole:     'Sextupole',
+                xe.Octupole:      'Octupole',
+                xe.Multipole:     'Multipole',
+                xe.ThinMultipole: 'ThinMultipole',
+                xe.RFCavity:      'RFCavity',
+                xe.HKicker:       'Corrector',
+                xe.VKicker:       'Corrector',
+                xe.TKicker:       'Corrector',
+               }
+
+
+OPTICS_COLUMNS = (('s',     's_pos',        None),
+                  ('betx',  'beta',         0),
+                  ('bety',  'beta',         1),
+                  ('alfx',  'alpha',        0),
+                  ('alfy',  'alpha',        1),
+                  ('mux',   'mu',           0),
+                  ('muy',   'mu',           1),
+                  ('dx',    'dispersion',   0),
+                  ('dy',    'dispersion',   1),
+                  ('x',     'closed_orbit', 0),
+                  ('px',    'closed_orbit', 1),
+                  ('y',     'closed_orbit', 2),
+                  ('py',    'closed_orbit', 3),
+                  ('delta', 'closed_orbit', 4),
+                  ('ct',    'closed_orbit', 5),
+                 )
+
+
+class RingCategories:
+    """ Categorical index of element names and keywords of a pyat ring, or of a list of its elements """
+    def __init__(self, ring):
+        names = [element.FamName for element in ring]
+        keywords = [element.__class__.__name__.lower() for element in ring]
+        self.names, self.name_codes = np.unique(names, return_inverse=True)
+        self.keywords, self.keyword_codes = np.unique(keywords, return_inverse=True)
+
+    def __len__(self):
+        return len(self.name_codes)
+
+
+def get_refpts_from_lin(lin, refpts=None) -> np.ndarray:
+    """ Get element indices of optics data, from lindata or explicitly given refpts """
+    if 'idx' in lin.dtype.names:
+        return lin['idx']
+    if refpts is None:
+        raise ValueError('lindata has no idx field, refpts have to be given')
+    return np.asarray(refpts)
+
+
+def _get_optics_columns(ring, lin, refpts=None, categories=None):
+    """ Get optics columns, without categories of the whole ring only the elements at refpts are categorized """
+    idx = get_refpts_from_lin(lin, refpts=refpts)
+    if categories is None:
+        categories = RingCategories([ring[i] for i in np.asarray(idx).tolist()])
+        name_codes, keyword_codes = categories.name_codes, categories.keyword_codes
+    else:
+        name_codes, keyword_codes = categories.name_codes[idx], categories.keyword_codes[idx]
+    columns = {'name': (categories.names, name_codes),
+               'keyword': (categories.keywords, keyword_codes)}
+    for column, field, plane in OPTICS_COLUMNS:
+        columns[column] = lin[field] if plane is None else lin[field][:, plane]
+    return columns
+
+
+def pyat_optics_to_pandas_df(ring, lin, refpts=None, categories=None, categorical: bool = False):
+    """ Build optics DataFrame in one pass. Name and keyword columns are strings,
+    or pandas Categorical columns with categorical=True """
+    columns = _get_optics_columns(ring, lin, refpts=refpts, categories=categories)
+    for key in ['name', 'keyword']:
+        values, codes = columns[key]
+        if categorical:
+            columns[key] = pd.Categorical.from_codes(codes, categories=values)
+        else:
+            columns[key] = values[codes].astype(object)
+    return pd.DataFrame(columns)
+
+
+def pyat_optics_to_record_array(ring, lin, refpts=None, categories=None) -> np.recarray:
+    """ Build optics table as NumPy record array, for consumers not needing pandas """
+    columns = _get_optics_columns(ring, lin, refpts=refpts, categories=categories)
+    for key in ['name', 'keyword']:
+        values, codes = columns[key]
+        columns[key] = values[codes]
+    return np.rec.fromarrays(list(columns.values()), names=list(columns.keys()))
+
+
+def pyat_optics_to_arrow(ring, lin, refpts=None, categories=None):
+    """ Build optics table as pyarrow Table, with dictionary encoded name and keyword columns """
+    try:
+        import pyarrow as pa
+    except ImportError as error:
+        raise ImportError('pyarrow is required for Arrow output of optics tables') from error
+    columns = _get_optics_columns(ring, lin, refpts=refpts, categories=categories)
+    for key in ['name', 'keyword']:
+        values, codes = columns[key]
+        columns[key] = pa.DictionaryArray.from_arrays(codes.astype(np.int32), values)
+    return pa.table(columns)
 
 
 def calc_optics_pyat(ring, radiation=False, tapering=False, xy_step = 1.0e-10, dp_step = 1.0e-9):
@@ -40,32 +130,250 @@ def calc_optics_pyat(ring, radiation=False, tapering=False, xy_step = 1.0e-10, d
     return l 
 
 
-def get_optics_pyat(ring, radiation=False, xy_step = 1.0e-10, dp_step = 1.0e-9):
-    idx = get_indices(ring, [at.lattice.elements.Dipole, at.lattice.elements.Quadrupole, at.lattice.elements.Sextupole])
+class RefptIndex:
+    """ Persistent index of pyat refpts and s positions by element class and name pattern.
+    Element types can be pyat or xsequence classes. Rebuild the index after changing the ring layout """
+    def __init__(self, ring):
+        self.categories = RingCategories(ring)
+        classes = [element.__class__ for element in ring]
+        self.classes = list(dict.fromkeys(classes))
+        class_codes = {cls: code for code, cls in enumerate(self.classes)}
+        self.class_codes = np.array([class_codes[cls] for cls in classes])
+        self.s_positions = ring.get_s_pos(range(len(ring) + 1))
+        self._refpts = {}
+
+    def get_refpts(self, element_types: list = None, pattern: str = None) -> np.ndarray:
+        """ Get sorted refpts of elements matching any of element_types and the name pattern.
+        The refpts are cached and returned as read-only array """
+        key = (None if element_types is None else tuple(element_types), pattern)
+        if key not in self._refpts:
+            mask = np.ones(len(self.class_codes), dtype=bool)
+            if element_types is not None:
+                pyat_types = tuple(get_pyat_class(el_type) for el_type in element_types)
+                codes = [code for code, cls in enumerate(self.classes) if issubclass(cls, pyat_types)]
+                mask &= np.isin(self.class_codes, codes)
+            if pattern is not None:
+                codes = [code for code, name in enumerate(self.categories.names) if fnmatch.fnmatchcase(name, pattern)]
+                mask &= np.isin(self.categories.name_codes, codes)
+            refpts = np.flatnonzero(mask)
+            refpts.flags.writeable = False
+            self._refpts[key] = refpts
+        return self._refpts[key]
+
+    def get_s_pos(self, refpts) -> np.ndarray:
+        return self.s_positions[refpts]
+
+
+def get_pyat_class(element_type):
+    """ Get pyat class of xsequence element class, pyat classes are returned as is """
+    for cls in element_type.__mro__:
+        if cls in PYAT_CLASSES:
+            return getattr(at, PYAT_CLASSES[cls])
+    return element_type
+
+
+def get_optics_pyat(ring, radiation=False, xy_step = 1.0e-10, dp_step = 1.0e-9,
+                    refpt_index=None, element_types=None, refpts=None):
+    """ Calculate optics at refpts, or at elements of element_types.
+    Without a (reusable) RefptIndex, element_types are found in one scan of the ring """
+    if refpts is None:
+        if element_types is None:
+            element_types = [at.lattice.elements.Dipole, at.lattice.elements.Quadrupole, at.lattice.elements.Sextupole]
+        if refpt_index is None:
+            refpts = get_indices(ring, element_types)
+        else:
+            refpts = refpt_index.get_refpts(element_types)
     
     if radiation:
         ring.radiation_on(quadrupole_pass='auto')
         ring.set_cavity_phase()
         ring.tapering(niter = 2, quadrupole=True, sextupole=True, XYStep=xy_step, DPStep=dp_step)
-        l0,q,l = at.linopt6(ring,refpts=idx,get_chrom=True,
+        l0,q,l = at.linopt6(ring,refpts=refpts,get_chrom=True,
                             coupled=False, XYStep=xy_step, DPStep=dp_step)
     else: 
         ring.radiation_off()
-        l0,q,qp,l = at.linopt(ring,refpts=idx,get_chrom=True,
+        l0,q,qp,l = at.linopt(ring,refpts=refpts,get_chrom=True,
                             coupled=False, XYStep=xy_step, DPStep=dp_step)
 
-    spos = ring.get_s_pos(idx)
+    spos = ring.get_s_pos(refpts) if refpt_index is None else refpt_index.get_s_pos(refpts)
     return l, spos 
 
     
 
 def get_indices(lat, element_types):
-    indices = []
-    for el_type in element_types:
-        idx = at.get_refpts(lat, el_type)
-        indices.append(idx)
-    indices = np.sort(np.concatenate(indices))
-    return indices
-   
+    """ Get sorted refpts of elements matching any of element_types, pyat or xsequence classes """
+    pyat_types = tuple(get_pyat_class(el_type) for el_type in element_types)
+    return np.flatnonzero([isinstance(element, pyat_types) for element in lat])
+
+
+def _get_occurrence_template(element) -> tuple:
+    """ Get class, scalar attributes and parameter arrays of pyat element, to create its occurrences """
+    attributes = {key: value for key, value in element.__dict__.items() if not isinstance(value, np.ndarray)}
+    arrays = [(key, value) for key, value in element.__dict__.items() if isinstance(value, np.ndarray)]
+    return element.__class__, attributes, arrays
+
+
+def _new_occurrence(template: tuple, **attributes):
+    """ Create pyat element of template skipping attribute conversion, with its own parameter arrays
+    so that every occurrence can be changed independently """
+    cls, template_attributes, arrays = template
+    new = object.__new__(cls)
+    state = new.__dict__
+    state.update(template_attributes)
+    for key, value in arrays:
+        state[key] = value.copy()
+    state.update(attributes)
+    return new
+
+
+def _get_polynoms(knl, ksl, length: float = 1.0):
+    """ Convert MAD-X integrated strengths into pyat PolynomA, PolynomB """
+    order = max(len(knl), len(ksl), 1)
+    factorials = np.array([math.factorial(n) for n in range(order)])
+    poly_a = np.zeros(order)
+    poly_b = np.zeros(order)
+    poly_a[:len(ksl)] = ksl
+    poly_b[:len(knl)] = knl
+    return poly_a/(factorials*length), poly_b/(factorials*length)
+
+
+def _drift_to_pyat(element, lattice):
+    return at.Drift(element.name, element.length)
+
+
+def _monitor_to_pyat(element, lattice):
+    if element.length > 0:
+        return at.Monitor(element.name, Length=element.length, PassMethod='DriftPass')
+    return at.Monitor(element.name)
+
+
+def _marker_to_pyat(element, lattice):
+    return at.Marker(element.name)
+
+
+def _sbend_to_pyat(element, lattice):
+    return at.Dipole(element.name, element.length, element.angle, element.k1,
+                     EntranceAngle=element.e1, ExitAngle=element.e2)
+
+
+def _quadrupole_to_pyat(element, lattice):
+    return at.Quadrupole(element.name, element.length, element.k1, PolynomA=[0.0, element.k1s])
+
+
+def _sextupole_to_pyat(element, lattice):
+    return at.Sextupole(element.name, element.length, element.k2/2., PolynomA=[0.0, 0.0, element.k2s/2.])
+
+
+def _octupole_to_pyat(element, lattice):
+    poly_a, poly_b = _get_polynoms(element.knl, element.ksl, element.length)
+    return at.Octupole(element.name, element.length, poly_a, poly_b)
+
+
+def _multipole_to_pyat(element, lattice):
+    if element.length == 0.0:
+        return _thin_multipole_to_pyat(element, lattice)
+    poly_a, poly_b = _get_polynoms(element.knl, element.ksl, element.length)
+    return at.Multipole(element.name, element.length, poly_a, poly_b)
+
+
+def _thin_multipole_to_pyat(element, lattice):
+    poly_a, poly_b = _get_polynoms(element.knl, element.ksl)
+    return at.ThinMultipole(element.name, poly_a, poly_b)
+
+
+def _rfcavity_to_pyat(element, lattice):
+    return at.RFCavity(element.name, element.length, element.voltage*1e6, element.frequency*1e6,
+                       int(element.harmonic_number), element.energy*1e9)
+
+
+def _kicker_to_pyat(element, lattice):
+    if isinstance(element, xe.TKicker):
+        kick_angle = [element.hkick, element.vkick]
+    elif isinstance(element, xe.HKicker):
+        kick_angle = [element.kick, 0.0]
+    else:
+        kick_angle = [0.0, element.kick]
+    return at.Corrector(element.name, element.length, kick_angle)
+
+
+def _solenoid_to_pyat(element, lattice):
+    return at.Element(element.name, Length=element.length, PassMethod='SolenoidLinearPass', K=element.ks)
+
+
+PYAT_CONVERTERS = {xe.Drift:         _drift_to_pyat,
+                   xe.Monitor:       _monitor_to_pyat,
+                   xe.ThinElement:   _marker_to_pyat,
+                   xe.SectorBend:    _sbend_to_pyat,
+                   xe.Quadrupole:    _quadrupole_to_pyat,
+                   xe.Sextupole:     _sextupole_to_pyat,
+                   xe.Octupole:      _octupole_to_pyat,
+                   xe.Multipole:     _multipole_to_pyat,
+                   xe.ThinMultipole: _thin_multipole_to_pyat,
+                   xe.RFCavity:      _rfcavity_to_pyat,
+                   xe.HKicker:       _kicker_to_pyat,
+                   xe.VKicker:       _kicker_to_pyat,
+                   xe.TKicker:       _kicker_to_pyat,
+                   xe.Solenoid:      _solenoid_to_pyat,
+                  }
+
+
+def _get_pyat_converter(element_type):
+    for cls in element_type.__mro__:
+        if cls in PYAT_CONVERTERS:
+            return PYAT_CONVERTERS[cls]
+    raise ValueError(f'No pyat conversion defined for element class {element_type.__name__}')
+
+
+def _set_pyat_data(pyat_element, element):
+    """ Set PassMethod and NumIntSteps from PyatData of element """
+    if element.pyat_data is not None:
+        for key, value in element.pyat_data:
+            if value is not None:
+                setattr(pyat_element, key, value)
+
+
+def _iter_ring_elements(params: dict, elements: list):
+    """ Iterator of at.Lattice yielding the elements as they are, parameters are given by lattice_to_pyat """
+    return iter(elements)
+
+
+@instrument
+def lattice_to_pyat(lattice, update_rf: bool = True) -> "at.Lattice":
+    """ Export xsequence Lattice to pyat Lattice.
+    One pyat element is created per unique element, and every occurrence is created from it with its own
+    parameter arrays. Drifts are computed from the arrays of node positions, without the line representation.
+    Energies are assumed in GeV, RF voltage in MV and RF frequency in MHz """
+    if update_rf:
+        lattice._update_cavity_energy()
+        lattice._update_harmonic_number()
+    nodes = list(lattice.cell_sequence.iter_nodes()) if lattice._is_compressed() else lattice.sequence._v
+    if len(nodes) == 0:
+        raise ValueError(f'Lattice {lattice.name} has no nodes to export')
+    starts, ends = validation.get_node_bounds(nodes)
+    gaps = starts - np.concatenate([starts[:1], ends[:-1]])
+    if np.any(gaps < -1e-6): # Tolerance for rounding
+        raise validation.NegativeDriftError(validation.find_negative_drifts(nodes, tolerance=1e-6, start=starts[0]))
+
+    elements = lattice.elements._v
+    templates = {}
+    for name in dict.fromkeys(node.element_name for node in nodes):
+        element = elements[name]
+        pyat_element = _get_pyat_converter(type(element))(element, lattice)
+        _set_pyat_data(pyat_element, element)
+        templates[name] = _get_occurrence_template(pyat_element)
 
+    drift_template = _get_occurrence_template(at.Drift('drift', 0.0))
+    ring_elements = []
+    drift_count = 0
+    for node, gap in zip(nodes, gaps.tolist()):
+        if gap > 1e-10:
+            ring_elements.append(_new_occurrence(drift_template, FamName=f'drift_{drift_count}', Length=gap))
+            drift_count += 1
+        ring_elements.append(_new_occurrence(templates[node.element_name]))
 
+    params = {'name': lattice.name, 'energy': lattice.beam.energy*1e9,
+              'particle': lattice.beam.particle, 'periodicity': 1}
+    cavities = [template for template in templates.values() if issubclass(template[0], at.RFCavity)]
+    if cavities:
+        params['harmonic_number'] = cavities[0][1]['HarmNumber']
+    return at.Lattice(ring_elements, iterator=_iter_ring_elements, **params)
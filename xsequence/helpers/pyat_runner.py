@@ -0,0 +1,89 @@
+import pickle
+import asyncio
+import hashlib
+import concurrent.futures
+from xsequence.helpers import pyat_functions
+
+
+TABLE_CONVERTERS = {'pandas': pyat_functions.pyat_optics_to_pandas_df,
+                    'recarray': pyat_functions.pyat_optics_to_record_array}
+
+
+def _run_optics_job(ring_data: bytes, options: dict, table: str):
+    """ Compute optics table of pickled ring, runs in the worker processes """
+    ring = pickle.loads(ring_data)
+    lin = pyat_functions.calc_optics_pyat(ring, **options)
+    return TABLE_CONVERTERS[table](ring, lin, refpts=range(len(ring)))
+
+
+class _OpticsJob:
+    """ Computation in the executor shared by all identical requests, with the number of waiting requests """
+    def __init__(self, future: asyncio.Future):
+        self.future = future
+        self.waiters = 0
+
+
+class PyatOpticsRunner:
+    """ Asyncio runner of pyat optics computations in a bounded process pool.
+    Identical requests in flight share one computation, pyat rings are compared by their pickled content.
+    A computation is cancelled when all its requests are cancelled or timed out, which only takes effect
+    while it is still queued, a running worker process is not interrupted """
+    def __init__(self, max_workers: int = None, executor: concurrent.futures.Executor = None,
+                 timeout: float = None, table: str = 'pandas'):
+        if table not in TABLE_CONVERTERS:
+            raise ValueError(f'Unknown table kind {table}, expected one of {list(TABLE_CONVERTERS)}')
+        self._owns_executor = executor is None
+        self.executor = concurrent.futures.ProcessPoolExecutor(max_workers=max_workers) if executor is None else executor
+        self.timeout = timeout
+        self.table = table
+        self._jobs = {}
+
+    @property
+    def num_in_flight(self) -> int:
+        return len(self._jobs)
+
+    def _get_job(self, ring, options: dict) -> _OpticsJob:
+        ring_data = pickle.dumps(ring, protocol=pickle.HIGHEST_PROTOCOL)
+        key = hashlib.sha256(ring_data + repr(sorted(options.items())).encode()).hexdigest()
+        job = self._jobs.get(key)
+        if job is None or job.future.cancelled():
+            loop = asyncio.get_running_loop()
+            job = self._jobs[key] = _OpticsJob(loop.run_in_executor(self.executor, _run_optics_job,
+                                                                    ring_data, options, self.table))
+            job.future.add_done_callback(lambda _, job=job: self._remove_job(key, job))
+        return job
+
+    def _remove_job(self, key: str, job: _OpticsJob):
+        if self._jobs.get(key) is job:
+            del self._jobs[key]
+
+    async def calc_optics(self, ring, radiation: bool = False, tapering: bool = False,
+                          xy_step: float = 1.0e-10, dp_step: float = 1.0e-9, timeout: float = None):
+        """ Compute optics table of pyat ring as calc_optics_pyat, without blocking the event loop.
+        Raises asyncio.TimeoutError after timeout seconds, the default timeout of the runner if not given """
+        options = {'radiation': radiation, 'tapering': tapering, 'xy_step': xy_step, 'dp_step': dp_step}
+        job = self._get_job(ring, options)
+        job.waiters += 1
+        try:
+            return await asyncio.wait_for(asyncio.shield(job.future), self.timeout if timeout is None else timeout)
+        finally:
+            job.waiters -= 1
+            if job.waiters == 0 and not job.future.done():
+                job.future.cancel()
+
+    def submit(self, ring, **kwargs) -> asyncio.Future:
+        """ Schedule calc_optics in the running event loop, returns the future of the optics table """
+        return asyncio.ensure_future(self.calc_optics(ring, **kwargs))
+
+    def close(self):
+        """ Cancel queued computations and shut down the executor if created by the runner """
+        for job in list(self._jobs.values()):
+            job.future.cancel()
+        if self._owns_executor:
+            self.executor.shutdown(wait=False)
+
+    async def __aenter__(self) -> "PyatOpticsRunner":
+        return self
+
+    async def __aexit__(self, *args):
+        self.close()
@@ -0,0 +1,302 @@
+import numpy as np
+import xsequence.elements as xe
+from xsequence._lazy import lazy_import
+from xsequence.expressions import ExprTransformer, split_ref
+from xsequence.profiling import instrument
+
+xt = lazy_import('xtrack')
+
+
+def _drift_to_xtrack(element):
+    return xt.Drift(length=element.length)
+
+
+def _marker_to_xtrack(element):
+    return xt.Marker()
+
+
+def _thin_multipole_to_xtrack(element):
+    return xt.Multipole(knl=element.knl, ksl=element.ksl, length=element.radiation_length)
+
+
+def _dipole_edge_to_xtrack(element):
+    side = 'entry' if element.side == 'entrance' else 'exit'
+    return xt.DipoleEdge(k=element.h, e1=element.edge_angle, side=side)
+
+
+def _kicker_to_xtrack(element):
+    if isinstance(element, xe.TKicker):
+        hkick, vkick = element.hkick, element.vkick
+    elif isinstance(element, xe.HKicker):
+        hkick, vkick = element.kick, 0.0
+    else:
+        hkick, vkick = 0.0, element.kick
+    return xt.Multipole(knl=[-hkick], ksl=[vkick], length=element.length)
+
+
+def _thin_solenoid_to_xtrack(element):
+    return xt.Solenoid(ksi=element.ksi, length=0.0)
+
+
+def _rfcavity_to_xtrack(element):
+    if element.length > 0:
+        raise ValueError(f'RF cavity {element.name} has non-zero length, slice lattice for xtrack export')
+    return xt.Cavity(voltage=element.voltage*1e6, frequency=element.frequency*1e6, lag=element.lag*360)
+
+
+def _thin_rfcavity_to_xtrack(element):
+    return xt.Cavity(voltage=element.voltage*1e6, frequency=element.frequency*1e6, lag=element.lag*360)
+
+
+def _bend_has_angle() -> bool:
+    """ Recent xtrack defines bends by length and angle and rejects setting h, older versions only know h """
+    return hasattr(xt.Bend, 'angle')
+
+
+def _sbend_to_xtrack(element):
+    if _bend_has_angle():
+        return xt.Bend(angle=element.angle, k1=element.k1, length=element.length,
+                       edge_entry_angle=element.e1, edge_exit_angle=element.e2)
+    h = element.angle/element.length
+    return xt.Bend(k0=h, h=h, k1=element.k1, length=element.length,
+                   edge_entry_angle=element.e1, edge_exit_angle=element.e2)
+
+
+def _quadrupole_to_xtrack(element):
+    return xt.Quadrupole(k1=element.k1, k1s=element.k1s, length=element.length)
+
+
+def _sextupole_to_xtrack(element):
+    return xt.Sextupole(k2=element.k2, k2s=element.k2s, length=element.length)
+
+
+def _octupole_to_xtrack(element):
+    return xt.Octupole(k3=element.k3, k3s=element.k3s, length=element.length)
+
+
+def _solenoid_to_xtrack(element):
+    return xt.Solenoid(ks=element.ks, length=element.length)
+
+
+THIN_XTRACK_CONVERTERS = {xe.Drift:         _marker_to_xtrack,
+                          xe.Marker:        _marker_to_xtrack,
+                          xe.ThinMultipole: _thin_multipole_to_xtrack,
+                          xe.DipoleEdge:    _dipole_edge_to_xtrack,
+                          xe.ThinSolenoid:  _thin_solenoid_to_xtrack,
+                          xe.HKicker:       _kicker_to_xtrack,
+                          xe.VKicker:       _kicker_to_xtrack,
+                          xe.TKicker:       _kicker_to_xtrack,
+                          xe.RFCavity:      _thin_rfcavity_to_xtrack,
+                         }
+
+
+THICK_XTRACK_CONVERTERS = {xe.Drift:         _drift_to_xtrack,
+                           xe.Marker:        _marker_to_xtrack,
+                           xe.ThinMultipole: _thin_multipole_to_xtrack,
+                           xe.DipoleEdge:    _dipole_edge_to_xtrack,
+                           xe.ThinSolenoid:  _thin_solenoid_to_xtrack,
+                           xe.HKicker:       _kicker_to_xtrack,
+                           xe.VKicker:       _kicker_to_xtrack,
+                           xe.TKicker:       _kicker_to_xtrack,
+                           xe.RFCavity:      _rfcavity_to_xtrack,
+                           xe.SectorBend:    _sbend_to_xtrack,
+                           xe.Quadrupole:    _quadrupole_to_xtrack,
+                           xe.Sextupole:     _sextupole_to_xtrack,
+                           xe.Octupole:      _octupole_to_xtrack,
+                           xe.Solenoid:      _solenoid_to_xtrack,
+                          }
+
+
+def _get_xtrack_converter(element_type, converters: dict):
+    for cls in element_type.__mro__:
+        if cls in converters:
+            return converters[cls]
+    raise ValueError(f'No xtrack conversion defined for element class {element_type.__name__}')
+
+
+def _get_thin_knob_targets(element, key: tuple, kind: str) -> list:
+    """ Get xtrack (attribute, index, factor) targets of thin slices, for an attribute of the parent element """
+    if kind == 'edge':
+        if isinstance(element, xe.SectorBend) and key == ('angle',):
+            return [('k', None, 1/element.length)]
+        return []
+    if isinstance(element, xe.ThinElement):
+        return _get_thick_knob_targets(element, key)
+    slice_length = element.length/element.num_slices
+    if isinstance(element, xe.SectorBend):
+        targets = {('angle',): [('knl', 0, 1/element.num_slices), ('hxl', None, 1/element.num_slices)]}
+    elif isinstance(element, xe.Quadrupole):
+        targets = {('k1',): [('knl', 1, slice_length)], ('k1s',): [('ksl', 1, slice_length)]}
+    elif isinstance(element, xe.Sextupole):
+        targets = {('k2',): [('knl', 2, slice_length)], ('k2s',): [('ksl', 2, slice_length)]}
+    elif isinstance(element, xe.Octupole):
+        targets = {('k3',): [('knl', 3, slice_length)], ('k3s',): [('ksl', 3, slice_length)]}
+    elif isinstance(element, xe.Solenoid):
+        targets = {('ks',): [('ksi', None, slice_length)]}
+    elif isinstance(element, xe.Multipole):
+        if len(key) == 2 and key[0] in ['knl', 'ksl']:
+            return [(key[0], key[1], 1/element.num_slices)]
+        return []
+    elif isinstance(element, xe.TKicker):
+        targets = {('hkick',): [('knl', 0, -1/element.num_slices)], ('vkick',): [('ksl', 0, 1/element.num_slices)]}
+    elif isinstance(element, xe.HKicker):
+        targets = {('kick',): [('knl', 0, -1/element.num_slices)]}
+    elif isinstance(element, xe.VKicker):
+        targets = {('kick',): [('ksl', 0, 1/element.num_slices)]}
+    else:
+        return _get_thick_knob_targets(element, key)
+    return targets.get(key, [])
+
+
+def _get_thick_knob_targets(element, key: tuple) -> list:
+    """ Get xtrack (attribute, index, factor) targets for an attribute of an element converted as is """
+    if isinstance(element, xe.SectorBend):
+        if _bend_has_angle():
+            angle_targets = [('angle', None, 1.0)]
+        else:
+            angle_targets = [('k0', None, 1/element.length), ('h', None, 1/element.length)]
+        targets = {('angle',): angle_targets,
+                   ('k1',): [('k1', None, 1.0)],
+                   ('e1',): [('edge_entry_angle', None, 1.0)],
+                   ('e2',): [('edge_exit_angle', None, 1.0)]}
+    elif isinstance(element, xe.Quadrupole):
+        targets = {('k1',): [('k1', None, 1.0)], ('k1s',): [('k1s', None, 1.0)]}
+    elif isinstance(element, xe.Sextupole):
+        targets = {('k2',): [('k2', None, 1.0)], ('k2s',): [('k2s', None, 1.0)]}
+    elif isinstance(element, xe.Octupole):
+        targets = {('k3',): [('k3', None, 1.0)], ('k3s',): [('k3s', None, 1.0)]}
+    elif isinstance(element, xe.Solenoid):
+        targets = {('ks',): [('ks', None, 1.0)]}
+    elif isinstance(element, xe.TKicker):
+        targets = {('hkick',): [('knl', 0, -1.0)], ('vkick',): [('ksl', 0, 1.0)]}
+    elif isinstance(element, xe.HKicker):
+        targets = {('kick',): [('knl', 0, -1.0)]}
+    elif isinstance(element, xe.VKicker):
+        targets = {('kick',): [('ksl', 0, 1.0)]}
+    elif isinstance(element, xe.RFCavity):
+        targets = {('voltage',): [('voltage', None, 1e6)],
+                   ('frequency',): [('frequency', None, 1e6)],
+                   ('lag',): [('lag', None, 360.)]}
+    elif isinstance(element, xe.ThinMultipole):
+        if len(key) == 2 and key[0] in ['knl', 'ksl']:
+            return [(key[0], key[1], 1.0)]
+        return []
+    elif isinstance(element, xe.ThinSolenoid):
+        targets = {('ksi',): [('ksi', None, 1.0)]}
+    elif isinstance(element, xe.DipoleEdge):
+        targets = {('h',): [('k', None, 1.0)], ('edge_angle',): [('e1', None, 1.0)]}
+    else:
+        return []
+    return targets.get(key, [])
+
+
+class _XtrackExprTransformer(ExprTransformer):
+    """ Rebuild xdeps expression of lattice on the variables and functions of xtrack line.
+    Only globals and math functions can be referenced """
+    def __init__(self, lattice, line):
+        self.lattice = lattice
+        self.line = line
+
+    def ref(self, expr, root, keys: tuple):
+        if root is self.lattice._globals and len(keys) == 1:
+            return self.line.vars[keys[0]]
+        if root is self.lattice._math and len(keys) == 1:
+            return getattr(self.line.functions, keys[0])
+        raise ValueError(f'Reference {expr} cannot be carried over to xtrack')
+
+
+def _set_knob_expressions(line, lattice, thin_names: dict, thin: bool):
+    """ Carry globals and expressions of element attributes driven by globals over to the xtrack line.
+    Expressions depending on other element attributes are not carried, their values are """
+    for name, value in lattice.globals._v.items():
+        line.vars[name] = value
+
+    transformer = _XtrackExprTransformer(lattice, line)
+    for task in lattice.dep_mgr.find_tasks():
+        if not hasattr(task, 'expr'):
+            continue
+        roots = {split_ref(dep)[0] for dep in task.dependencies}
+        if not all(root is lattice._globals or root is lattice._math for root in roots):
+            continue
+        root, keys = split_ref(task.taskid)
+        expr = transformer.transform(task.expr)
+        if root is lattice._globals:
+            line.vars[keys[0]] = expr
+        elif root is lattice._elements and keys[0] in thin_names:
+            element = lattice.elements._v[keys[0]]
+            for thin_name, kind in thin_names[keys[0]]:
+                if thin:
+                    targets = _get_thin_knob_targets(element, keys[1:], kind)
+                else:
+                    targets = _get_thick_knob_targets(element, keys[1:])
+                for attribute, index, factor in targets:
+                    if index is None:
+                        setattr(line.element_refs[thin_name], attribute, expr*factor)
+                    else:
+                        getattr(line.element_refs[thin_name], attribute)[index] = expr*factor
+
+
+def _get_drifts(nodes, start: float, end: float) -> tuple:
+    """ Get lengths of drifts in front of each node and after the last node, with indices of unique lengths """
+    positions = np.array([node.position for node in nodes] + [end])
+    lengths = np.diff(positions, prepend=start)
+    if np.any(lengths < -1e-6):
+        idx = int(np.argmax(lengths < -1e-6))
+        raise ValueError(f'Negative drift in front of element {nodes[idx].element_name}, {lengths[idx]}')
+    lengths = np.round(np.clip(lengths, 0, None), 12)
+    unique_lengths, drift_idx = np.unique(lengths, return_inverse=True)
+    return lengths, unique_lengths, drift_idx
+
+
+@instrument
+def lattice_to_xtrack(lattice, thin: bool = True, method: str = 'teapot', particle_ref=None) -> "xt.Line":
+    """ Export xsequence Lattice to xtrack Line.
+    With thin=True the thin sequence of slice_lattice is exported, otherwise the line of _get_line.
+    Every unique element is created once and shared by all of its occurrences, and drifts of equal length
+    are shared as well. Globals and expressions of element strengths driven by globals are carried over
+    to the line variables. RF voltage is assumed in MV, RF frequency in MHz and lag in units of 2pi """
+    if thin:
+        lattice.slice_lattice(method=method)
+        nodes, elements, converters = lattice.thin_sequence, lattice.thin_elements, THIN_XTRACK_CONVERTERS
+        first_node = (lattice.cell_sequence if lattice._is_compressed() else lattice.sequence._v)[0]
+        lengths, unique_lengths, drift_idx = _get_drifts(nodes, first_node.start, lattice.get_total_length())
+    else:
+        line, elements = lattice._get_line()
+        nodes = list(line.iter_nodes())
+        converters = THICK_XTRACK_CONVERTERS
+
+    names_by_class = {}
+    for name in dict.fromkeys(node.element_name for node in nodes):
+        names_by_class.setdefault(type(elements[name]), []).append(name)
+    xtrack_elements = {}
+    for element_type, names in names_by_class.items():
+        converter = _get_xtrack_converter(element_type, converters)
+        for name in names:
+            xtrack_elements[name] = converter(elements[name])
+
+    thin_names = {}
+    if thin:
+        for name in xtrack_elements:
+            parent, _, suffix = name.rpartition('_sliced_')
+            kind = 'edge' if suffix in ['entrance', 'exit'] else 'slice'
+            thin_names.setdefault(parent, []).append((name, kind))
+            if kind == 'slice' and isinstance(lattice.elements._v.get(parent), xe.SectorBend):
+                xtrack_elements[name].hxl = xtrack_elements[name].knl[0]
+        drift_names = []
+        for idx, length in enumerate(unique_lengths):
+            drift_names.append(f'drift_{idx}')
+            xtrack_elements[f'drift_{idx}'] = xt.Drift(length=length)
+        element_names = []
+        for node, length, idx in zip(nodes, lengths, drift_idx):
+            if length > 0:
+                element_names.append(drift_names[idx])
+            element_names.append(node.element_name)
+        if lengths[-1] > 0:
+            element_names.append(drift_names[drift_idx[-1]])
+    else:
+        thin_names = {name: [(name, 'element')] for name in xtrack_elements}
+        element_names = [node.element_name for node in nodes]
+
+    line = xt.Line(elements=xtrack_elements, element_names=element_names, particle_ref=particle_ref)
+    _set_knob_expressions(line, lattice, thin_names, thin)
+    return line
@@ -0,0 +1,145 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+import numpy as np
+from xsequence.expressions import ExprTransformer, split_ref
+
+
+def _erf(x):
+    import scipy.special
+    return scipy.special.erf(x)
+
+
+def _erfc(x):
+    import scipy.special
+    return scipy.special.erfc(x)
+
+
+NUMPY_FUNCTIONS = {'sqrt': np.sqrt, 'exp': np.exp, 'log': np.log, 'log10': np.log10,
+                   'sin': np.sin, 'cos': np.cos, 'tan': np.tan, 'asin': np.arcsin, 'acos': np.arccos,
+                   'atan': np.arctan, 'atan2': np.arctan2, 'sinh': np.sinh, 'cosh': np.cosh, 'tanh': np.tanh,
+                   'fabs': np.abs, 'floor': np.floor, 'ceil': np.ceil, 'pow': np.power,
+                   'erf': _erf, 'erfc': _erfc}
+
+
+def _get_key(lattice, ref) -> tuple:
+    """ Get key of xdeps reference: ('globals', name) or (element, attribute[, index]) """
+    root, keys = split_ref(ref)
+    if root is lattice._globals and len(keys) == 1:
+        return ('globals', keys[0])
+    if root is lattice._elements and len(keys) in (2, 3):
+        return keys
+    raise ValueError(f'Knob dependency {ref} is neither a global nor an element attribute')
+
+
+class _SourceTransformer(ExprTransformer):
+    """ Translate xdeps expression into numpy source, with computed dependencies as locals of the knob
+    function and all other values as constants """
+    def __init__(self, evaluator, lattice):
+        self.evaluator = evaluator
+        self.lattice = lattice
+
+    def ref(self, expr, root, keys: tuple):
+        if root is self.lattice._math and len(keys) == 1:
+            if keys[0] not in NUMPY_FUNCTIONS:
+                raise ValueError(f'Function math.{keys[0]} cannot be vectorized')
+            return f'math_{keys[0]}'
+        key = _get_key(self.lattice, expr)
+        if key in self.evaluator._locals:
+            return self.evaluator._locals[key]
+        if key[0] == 'globals':
+            return self.literal(self.lattice.globals._v.get(key[1], 0.0))
+        value = getattr(self.lattice.elements._v[key[0]], key[1])
+        return self.literal(value if len(key) == 2 else value[key[2]])
+
+    def literal(self, value) -> str:
+        return self.evaluator._constant(value)
+
+    def binary(self, op: str, lhs: str, rhs: str) -> str:
+        return f'({lhs} {op} {rhs})'
+
+    def unary(self, op: str, arg: str) -> str:
+        return f'({op}{arg})'
+
+    def call(self, function, args: list, kwargs: dict) -> str:
+        function = function if isinstance(function, str) else self.literal(function)
+        arguments = list(args) + [f'{key}={value}' for key, value in kwargs.items()]
+        return f'{function}({", ".join(arguments)})'
+
+
+class KnobEvaluator:
+    """ Compiled evaluation of element attributes driven by selected global knobs.
+    The dependency graph of the knobs is extracted once and compiled into one vectorized function,
+    values of all other globals and element attributes are frozen at compilation """
+    def __init__(self, lattice, knobs: list):
+        self.knobs = list(knobs)
+        for knob in self.knobs:
+            if knob not in lattice.globals._v:
+                raise KeyError(f'Knob {knob} is not a global variable of lattice {lattice.name}')
+        tasks = [task for task in lattice.dep_mgr.find_tasks([lattice._globals[knob] for knob in self.knobs])
+                 if hasattr(task, 'expr')]
+
+        self._locals = {('globals', knob): f'k{idx}' for idx, knob in enumerate(self.knobs)}
+        self._constants = {}
+        lines = []
+        targets = []
+        transformer = _SourceTransformer(self, lattice)
+        for task in tasks:
+            key = _get_key(lattice, task.taskid)
+            source = transformer.transform(task.expr)
+            self._locals[key] = f't{len(self._locals)}'
+            lines.append(f'    {self._locals[key]} = {source}')
+            if key[0] != 'globals':
+                targets.append(key)
+
+        classes = {key: type(lattice.elements._v[key[0]]) for key in targets}
+        self.targets = sorted(targets, key=lambda key: classes[key].__name__)
+        self.groups = {}
+        for idx, key in enumerate(self.targets):
+            start = self.groups.get(classes[key], slice(idx, idx)).start
+            self.groups[classes[key]] = slice(start, idx + 1)
+
+        arguments = ', '.join(f'k{idx}' for idx in range(len(self.knobs)))
+        results = ', '.join(self._locals[key] for key in self.targets)
+        self.source = '\n'.join([f'def knob_function({arguments}):'] + lines + [f'    return [{results}]'])
+        namespace = dict(self._constants, **{f'math_{name}': f for name, f in NUMPY_FUNCTIONS.items()})
+        exec(compile(self.source, f'<knobs {lattice.name}>', 'exec'), namespace)
+        self._function = namespace['knob_function']
+
+    def _constant(self, value) -> str:
+        name = f'c{len(self._constants)}'
+        self._constants[name] = value
+        return name
+
+    def _get_knob_arrays(self, settings) -> list:
+        if isinstance(settings, dict):
+            return [np.asarray(settings[knob], dtype=float) for knob in self.knobs]
+        settings = np.asarray(settings, dtype=float)
+        if settings.ndim == 1:
+            settings = settings[:, np.newaxis] if len(self.knobs) == 1 else settings[np.newaxis, :]
+        if settings.shape[1] != len(self.knobs):
+            raise ValueError(f'Expected settings of shape (n, {len(self.knobs)}), got {settings.shape}')
+        return list(settings.T)
+
+    def evaluate(self, settings) -> np.ndarray:
+        """ Evaluate targets for a batch of knob settings, given as {knob: array} or as array (n, number of knobs).
+        Returns array (n, number of targets), columns ordered as targets """
+        knob_arrays = self._get_knob_arrays(settings)
+        shape = np.broadcast(*knob_arrays).shape if knob_arrays else ()
+        num_settings = shape[0] if shape else 1
+        result = np.empty((num_settings, len(self.targets)))
+        for idx, value in enumerate(self._function(*knob_arrays)):
+            result[:, idx] = value
+        return result
+
+    def evaluate_by_class(self, settings) -> dict:
+        """ Evaluate targets for a batch of knob settings, grouped by element class as {class: (targets, array)} """
+        result = self.evaluate(settings)
+        return {cls: (self.targets[group], result[:, group]) for cls, group in self.groups.items()}
+
+    def evaluate_dict(self, settings) -> dict:
+        """ Evaluate targets for a batch of knob settings as {target: array of values per setting} """
+        result = self.evaluate(settings)
+        return {key: result[:, idx] for idx, key in enumerate(self.targets)}
@@ -4,16 +4,24 @@
 # ############################################## #
 
 import math, copy
-import xdeps
 import numpy as np
-import scipy.constants
 import xsequence.elements as xe
-from xsequence import slicing
-from xsequence.lattice_baseclasses import Node, NodesList, Beam
+from xsequence import slicing, validation
+from xsequence.lattice_baseclasses import Node, NodesList, Beam, OccurrenceIndex, find_node_index, bisect_position
+from xsequence.profiling import instrument
+
+
+_LAZY_DEPENDENCY_ATTRIBUTES = {'dep_mgr', '_elements', '_globals', '_math', 'elements', 'globals'}
+_LAZY_SEQUENCE_ATTRIBUTES = {'_sequence', 'sequence', 'occurrences'}
+_LAZY_LINE_ATTRIBUTES = {'_line', '_line_elements'}
 
 
 class Lattice:
-    """ Class to describe an accelerator lattice """
+    """ Class to describe an accelerator lattice.
+    With lazy=True, dependency references and derived node data are only built on first access.
+    With key='cells', sequence is a CellSequence of repeated cells, which is only expanded to the flat sequence
+    on first access of sequence """
+    @instrument
     def __init__(self,
                  name:str,
                  elements:dict,
@@ -22,44 +30,152 @@ class Lattice:
                  key: str = 'sequence',
                  global_variables: dict = {},
                  order_nodes: str = False,
+                 lazy: bool = False,
                  ):
 
         self.name = name
         self.beam = beam
-
-        if order_nodes:
-            sequence = self._order_nodes_by_position(sequence)
+        self._order_nodes = order_nodes
 
         if key == 'line':
             elements, sequence = self._get_sequence_from_line(sequence, elements)
 
         self._data_globals  = global_variables
         self._data_elements = elements
-        self._data_sequence = sequence
-
-        self.dep_mgr=xdeps.Manager()
+        if key == 'cells':
+            sequence.set_lengths(elements)
+            self.cell_sequence = sequence
+        else:
+            self._data_sequence = sequence
+
+        if not lazy:
+            self._init_dependencies()
+            if key != 'cells':
+                self._init_sequence()
+
+    def __getattr__(self, name):
+        """ Build attributes of lazily constructed lattices on first access """
+        if name in _LAZY_DEPENDENCY_ATTRIBUTES:
+            self._init_dependencies()
+        elif name in _LAZY_SEQUENCE_ATTRIBUTES:
+            self._init_sequence()
+        elif name == '_data_sequence' and 'cell_sequence' in self.__dict__:
+            self._data_sequence = self.cell_sequence.expand()
+        elif name == 'thin_sequence' and 'thin_cell_sequence' in self.__dict__:
+            self._set_thin_sequence(self.thin_cell_sequence.iter_nodes())
+        elif name in _LAZY_LINE_ATTRIBUTES:
+            self._set_line()
+        else:
+            raise AttributeError(f"'{type(self).__name__}' object has no attribute '{name}'")
+        return self.__dict__[name]
+
+    @instrument
+    def _init_dependencies(self):
+        """ Set dependency manager with references to elements and globals """
+        import xdeps
+        from xsequence.dependency_manager import LatticeManager
+        self.dep_mgr=LatticeManager()
         self._elements = self.dep_mgr.ref(self._data_elements, 'elements')
-        self._sequence = self.dep_mgr.ref(self._data_sequence, 'sequence')
         self._globals  = self.dep_mgr.ref(self._data_globals , 'globals' )
         self._math  = self.dep_mgr.ref(math, 'math' )
 
         self.elements = xdeps.madxutils.Mix(self._data_elements, self._elements)
-        self.sequence = xdeps.madxutils.Mix(self._data_sequence, self._sequence)
         self.globals  = xdeps.madxutils.Mix(self._data_globals , self._globals )
 
+    @instrument
+    def _init_sequence(self):
+        """ Set reference to sequence and derived node data: ordering, lengths and element numbers """
+        import xdeps
+        if self._order_nodes:
+            self._data_sequence = self._order_nodes_by_position(self._data_sequence)
+        self._sequence = self.dep_mgr.ref(self._data_sequence, 'sequence')
+        self.sequence = xdeps.madxutils.Mix(self._data_sequence, self._sequence)
+
         self._set_lengths_of_nodes()
         self._set_element_number()
 
+    @instrument
     def get_drifts(self) -> NodesList:
         """ Get list of Drift elements """
         self._set_line()
         return NodesList([node for node in self.sequence if type(self.elements[node.element_name]) is xe.Drift])
 
+    def _is_compressed(self) -> bool:
+        """ Check if lattice is defined by cells which are not expanded yet """
+        return '_data_sequence' not in self.__dict__
+
+    @instrument
     def get_class(self, class_types: list) -> NodesList:
         """ Get list of elements matching given classes """
-        return NodesList([node for node in self.sequence if type(self.elements[node.element_name]) in class_types])
+        names = {name for name, element in self.elements._v.items() if type(element) in class_types}
+        if not names:
+            return NodesList()
+        if self._is_compressed():
+            return self.cell_sequence.select(names)
+        return NodesList([node for node in self.sequence if node.element_name in names])
+
+    @instrument
+    def find_elements(self, pattern: str) -> NodesList:
+        """ Get nodes with element names matching pattern: '*suffix', 'prefix*' or a substring """
+        if self._is_compressed():
+            return self.cell_sequence.find_elements(pattern)
+        return self.sequence._v.find_elements(pattern)
+
+    @instrument
+    def get_range_s(self, start_location: float, end_location: float) -> NodesList:
+        """ Get nodes from the first node starting after start_location up to the first node ending after end_location """
+        if self._is_compressed():
+            return self.cell_sequence.get_range_s(start_location, end_location)
+        return self.sequence._v.get_range_s(start_location, end_location)
+
+    def batch_update(self):
+        """ Context manager for bulk edits, values written inside are set directly
+        but dependent values are only recomputed once, on exit """
+        return self.dep_mgr.batch()
+
+    @instrument
+    def compile_knobs(self, knobs: list) -> "KnobEvaluator":
+        """ Compile element attributes driven by given globals for batched evaluation of knob settings """
+        from xsequence.knobs import KnobEvaluator
+        return KnobEvaluator(self, knobs)
+
+    @instrument
+    def get_aperture_table(self) -> "ApertureTable":
+        """ Get apertures of all nodes packed into arrays for vectorized queries along s """
+        from xsequence.aperture import ApertureTable
+        return ApertureTable(self)
+
+    @instrument
+    def survey(self, **initial) -> "Survey":
+        """ Compute global floor coordinates of all nodes, initial coordinates as keyword arguments (x0, theta0, ...) """
+        from xsequence.survey import Survey
+        return Survey(self, **initial)
+
+    @instrument
+    def linear_optics(self, method: str = 'teapot') -> "LinearOptics":
+        """ Compute linear optics of the sliced thin lattice with batched transfer matrices """
+        from xsequence.optics import LinearOptics
+        return LinearOptics(self, method=method)
+
+    @instrument
+    def to_table(self, kind: str = 'pandas', attributes: tuple = None):
+        """ Get table of nodes with positions, element strengths and apertures, built from columns at once.
+        kind is 'pandas', 'dict', 'recarray' or 'arrow' """
+        from xsequence import tables
+        columns = tables.get_table_columns(self, tables.ELEMENT_ATTRIBUTES if attributes is None else attributes)
+        return tables.columns_to_table(columns, kind=kind)
+
+    @instrument
+    def write_table(self, path: str, table_format: str = None, chunk_size: int = None, attributes: tuple = None):
+        """ Write table of nodes to Parquet, Feather or TFS file, format from extension if not given """
+        from xsequence import tables
+        tables.write_table(self.to_table(kind='dict', attributes=attributes), path, table_format=table_format,
+                           chunk_size=chunk_size or tables.CHUNK_SIZE,
+                           headers={'name': self.name, 'type': 'SEQUENCE', 'length': self.get_total_length()})
 
     def get_total_length(self) -> float:
+        if self._is_compressed():
+            return self.cell_sequence._get_total_length()
         return self.sequence._v._get_total_length()
 
     def _update_cavity_energy(self, force=True):
@@ -74,6 +190,7 @@ class Lattice:
 
     def _update_harmonic_number(self, force=True):
         """ Update the harmonic number of RF cavities using ultra-relativistic approximation. Needed for pyat """
+        import scipy.constants
         for cavity_node in self.get_class(class_types=[xe.RFCavity]):
             element = self.elements[cavity_node.element_name]
             if force:
@@ -110,12 +227,17 @@ class Lattice:
                 sequence_elements[node.element_name] = elements[node.element_name]
         return sequence_elements, sequence
 
-    def _check_negative_drifts(self):
-        """ Check any occurence of negative drifts in sequence """
-        start = np.array( self.sequence.get_positions(pos_anchor='start') )
-        end = np.array( self.sequence.get_positions(pos_anchor='end') )
-        end = np.insert(end, 0, 0)[:-1]
-        assert np.all(start - end >= 0), "Negative drift detected"
+    @instrument
+    def validate(self, indices: list = None, tolerance: float = 0.0) -> "validation.DriftReport":
+        """ Find all negative drifts in sequence, or only around the nodes at given indices """
+        nodes = self.cell_sequence.expand() if self._is_compressed() else self.sequence._v
+        if indices is None:
+            return validation.find_negative_drifts(nodes, tolerance=tolerance)
+        return validation.find_local_negative_drifts(nodes, indices, tolerance=tolerance)
+
+    def _check_negative_drifts(self, indices: list = None):
+        """ Check any occurence of negative drifts in sequence, or only around the nodes at given indices """
+        self.validate(indices).raise_for_negative_drifts()
 
     def _set_line(self):
         """ Set line representation of sequence with explicit drifts """
@@ -123,80 +245,242 @@ class Lattice:
         self._line = line
         self._line_elements = line_elements
 
+    @instrument
     def _get_line(self):
-        """ Convert sequence representation to line representation including drifts """
+        """ Convert sequence representation to line representation including drifts.
+        Compressed lattices give a compressed CellSequence line, iterate nodes of both with line.iter_nodes() """
+        if self._is_compressed():
+            return self.cell_sequence.get_line(self.elements._v)
         previous_end = self.sequence[0].start
         drift_count = 0
         nodes_with_drifts = NodesList()
         elements_with_drifts = self.elements._v.copy()
         for node in self.sequence:
-            drift_length = node.start-previous_end
+            positions = node.calculate_positions()
+            drift_length = positions['start']-previous_end
             if drift_length > 1e-10:
                 drift_pos = previous_end + drift_length/2.
                 drift_name = f'drift_{drift_count}'
                 elements_with_drifts[drift_name] = xe.Drift(drift_name, length=drift_length)
                 nodes_with_drifts.append(Node(element_name=drift_name, length=drift_length, location=drift_pos))
                 drift_count += 1
-            elif node.start < previous_end-1e-6: # Tolerance for rounding
-                raise ValueError(f'Negative drift at element {node.element_name} {node.element_number}, {drift_length}, node = {node}')
+            elif positions['start'] < previous_end-1e-6: # Tolerance for rounding
+                validation.find_negative_drifts(self.sequence._v, tolerance=1e-6,
+                                                start=self.sequence[0].start).raise_for_negative_drifts()
 
             nodes_with_drifts.append(node)
-            previous_end = node.end
+            previous_end = positions['end']
         return nodes_with_drifts, elements_with_drifts
 
     def _set_element_number(self):
         """ Set element number to count multiple occurences of same element in sequence """
-        temp_dict = {}
-        for idx, node in enumerate(self.sequence):
-            name = node.element_name
-            if name in temp_dict:
-                temp_dict[name] += 1
-            else:
-                temp_dict[name] = 1
-            self.sequence[idx].element_number = temp_dict[name]
+        self.occurrences = OccurrenceIndex(self.sequence._v)
 
-    def update_sequence(self):
-        """ Update sequence and perform checks """
+    @instrument
+    def update_sequence(self, inserted: list = None, removed: list = None):
+        """ Update sequence and perform checks.
+        Given indices of inserted nodes and/or removed nodes, element numbers and drifts are only updated locally """
         # self._order_nodes_by_position(nodes)
-        self._set_element_number()
-        self._check_negative_drifts()
-
+        if inserted is None and removed is None:
+            self._check_negative_drifts()
+            self._set_element_number()
+        else:
+            self._check_negative_drifts(inserted or [])
+            self.occurrences.update(added=[self.sequence._v[idx] for idx in inserted or []], removed=removed or [])
+        for name in _LAZY_LINE_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+
+    def _splice_sequence(self, nodes: list, inserted: list = None, removed: list = None, new_elements: dict = None):
+        """ Replace all nodes of sequence in place and update sequence locally, restoring it on negative drifts.
+        New elements of the inserted nodes are only added to elements once the sequence is valid """
+        sequence = self.sequence._v
+        previous = list(sequence)
+        sequence[:] = nodes
+        try:
+            self.update_sequence(inserted=inserted, removed=removed)
+        except validation.NegativeDriftError:
+            sequence[:] = previous
+            raise
+        if new_elements:
+            with self.batch_update():
+                for name, element in new_elements.items():
+                    self.elements[name] = element
+
+    def _get_new_nodes(self, elements: list, locations, pos_anchor: str) -> tuple:
+        """ Get nodes of elements, given as element instances or names of lattice elements,
+        and the element instances not yet in lattice, which are not added to elements here """
+        new_elements = {}
+        names = []
+        for element in elements:
+            if isinstance(element, str):
+                if element not in self.elements._v and element not in new_elements:
+                    raise KeyError(f'Element {element} not found in lattice {self.name}')
+                names.append(element)
+            else:
+                if element.name not in self.elements._v:
+                    new_elements[element.name] = element
+                elif self.elements._v[element.name] is not element:
+                    raise ValueError(f'Other element with name {element.name} already in lattice {self.name}')
+                names.append(element.name)
+        locations = np.broadcast_to(np.asarray(locations, dtype=float), (len(names),)).tolist()
+        lengths = {name: (new_elements[name] if name in new_elements else self.elements._v[name]).length
+                   for name in dict.fromkeys(names)}
+        return ([Node(name, pos_anchor=pos_anchor, length=lengths[name], location=location)
+                 for name, location in zip(names, locations)], new_elements)
+
+    @instrument
+    def insert_elements(self, elements: list, locations, pos_anchor: str = 'center') -> np.ndarray:
+        """ Insert nodes of elements at given locations, merged into the sorted sequence in one pass.
+        Returns the indices of the new nodes in sequence """
+        new_nodes, new_elements = self._get_new_nodes(elements, locations, pos_anchor)
+        sequence = self.sequence._v
+        new_positions = np.array([node.position for node in new_nodes], dtype=float)
+        order = np.argsort(new_positions, kind='stable')
+        new_nodes = [new_nodes[idx] for idx in order]
+        insert_at = np.array([bisect_position(sequence, position, right=True) for position in new_positions[order].tolist()],
+                             dtype=int)
+        indices = insert_at + np.arange(len(new_nodes))
+
+        nodes = []
+        previous = 0
+        for node, idx in zip(new_nodes, insert_at.tolist()):
+            nodes += sequence[previous:idx]
+            nodes.append(node)
+            previous = idx
+        nodes += sequence[previous:]
+        self._splice_sequence(nodes, inserted=indices.tolist(), new_elements=new_elements)
+        return indices
+
+    @instrument
+    def remove_nodes(self, indices) -> list:
+        """ Remove nodes at given indices from sequence, elements are kept. Returns removed nodes """
+        sequence = self.sequence._v
+        keep = np.ones(len(sequence), dtype=bool)
+        keep[np.asarray(indices, dtype=int)] = False
+        removed = [node for node, kept in zip(sequence, keep.tolist()) if not kept]
+        self._splice_sequence([node for node, kept in zip(sequence, keep.tolist()) if kept], removed=removed)
+        return removed
+
+    @instrument
+    def remove_elements(self, element_names: list) -> list:
+        """ Remove all nodes of given elements from sequence, elements are kept. Returns removed nodes """
+        if isinstance(element_names, str):
+            element_names = [element_names]
+        return self.remove_nodes([idx for name in element_names for idx in self.get_node_indices(name)])
+
+    @instrument
+    def replace_nodes(self, indices, elements: list) -> list:
+        """ Replace nodes at given indices by nodes of other elements at the same positions. Returns replaced nodes """
+        indices = np.asarray(indices, dtype=int).tolist()
+        sequence = self.sequence._v
+        new_nodes, new_elements = self._get_new_nodes(elements, [sequence[idx].position for idx in indices], 'center')
+        nodes = list(sequence)
+        for idx, node in zip(indices, new_nodes):
+            nodes[idx] = node
+        removed = [sequence[idx] for idx in indices]
+        self._splice_sequence(nodes, inserted=indices, removed=removed, new_elements=new_elements)
+        return removed
+
+    def get_node_indices(self, element_name: str) -> list:
+        """ Get indices in sequence of all nodes of element, with binary searches on position for few nodes """
+        sequence = self.sequence._v
+        occurrences = self.occurrences[element_name]
+        if len(occurrences)*16 > len(sequence):
+            ids = {id(node) for node in occurrences}
+            return [idx for idx, node in enumerate(sequence) if id(node) in ids]
+        indices = []
+        for node in occurrences:
+            indices.append(find_node_index(sequence, node, lo=indices[-1] + 1 if indices else 0))
+        return indices
+
+    @instrument
     def convert_sbend_to_rbend(self):
-        """ Convert all sbends to rbends in elements """
-        for key in self.elements:
-            if isinstance(self.elements[key], xe.SectorBend):
-                self.elements[key] = self.elements[key].convert_to_rbend()
-
+        """ Convert all sbends to rbends in elements, chord lengths of all bends are calculated at once.
+        Expressions keep driving angle, arc length and e1, e2 as sector bend quantities, the chord length
+        and rbend edge angles are not updated by them """
+        names = [name for name, element in self.elements._v.items() if type(element) is xe.SectorBend]
+        angles = [self.elements[name].angle for name in names]
+        chord_lengths = xe.get_chord_lengths(angles, [self.elements[name].length for name in names])
+        self._replace_elements({name: self.elements[name].convert_to_rbend(chord_length=chord_length)
+                                for name, chord_length in zip(names, chord_lengths.tolist())})
+
+    @instrument
     def convert_rbend_to_sbend(self):
-        """ Convert all rbends to sbends in elements """
-        for key in self.elements:
-            if isinstance(self.elements[key], xe.RectangularBend):
-                self.elements[key] = self.elements[key].convert_to_sbend()
-
-    def slice_lattice(self, method: str = 'teapot'):
-        """ Slice lattice to obtain sequence of thin elements """
-        self.thin_elements = {}
-        self.thin_sequence = []
-        self._thin_elements = self.dep_mgr.ref(self.thin_elements, 'thin_elements')
-        self._thin_sequence = self.dep_mgr.ref(self.thin_sequence, 'thin_sequence')
-
-        for idx, node in enumerate(self.sequence):
-            element = self.elements[node.element_name]
-
-            if isinstance(element, xe.SectorBend):
-                h = element.angle/element.length
-                thin_name = f'{node.element_name}_sliced_entrance'
-                self._thin_sequence.append(Node(thin_name, reference=node.position, location=node.start, length=0.0))
-                self._thin_elements[thin_name] = xe.DipoleEdge(thin_name, side='entrance', h=h, edge_angle=element.e1)
-
-            thin_positions = slicing.get_slice_positions(element, method=method)
-            for idx, thin_pos in enumerate(thin_positions):
-                thin_name = f'{node.element_name}_sliced_{idx}'
-                self._thin_sequence.append(Node(thin_name, reference=node.position, location=thin_pos, length=0.0))
-                self._thin_elements[thin_name] = element._get_thin_element()
-
-            if isinstance(element, xe.SectorBend):
-                h = element.angle/element.length
-                thin_name = f'{node.element_name}_sliced_exit'
-                self._thin_sequence.append(Node(thin_name, reference=node.position, location=node.end, length=0.0))
-                self._thin_elements[thin_name] = xe.DipoleEdge(thin_name, side='exit', h=h, edge_angle=element.e2)
+        """ Convert all rbends to sbends in elements, expressions keep driving their attributes """
+        self._replace_elements({name: element.convert_to_sbend() for name, element in self.elements._v.items()
+                                if type(element) is xe.RectangularBend})
+
+    def _replace_elements(self, elements: dict):
+        """ Replace elements in one batch update, keeping expressions of their attributes and node lengths.
+        The cached line holds the replaced elements and is rebuilt on next access """
+        with self.batch_update():
+            for name, element in elements.items():
+                self.elements[name] = element
+        for node in self.sequence._v:
+            if node.element_name in elements:
+                node.length = elements[node.element_name].length
+        for name in _LAZY_LINE_ATTRIBUTES:
+            self.__dict__.pop(name, None)
+
+    @instrument
+    def slice_lattice(self, method: str = 'teapot', num_workers: int = 1, use_threads: bool = False):
+        """ Slice lattice to obtain sequence of thin elements.
+        With num_workers > 1, or None for all cores, the sequence is sliced in parallel processes, or threads.
+        Compressed lattices keep the sliced cells as thin_cell_sequence, thin_sequence is expanded on first access """
+        if 'thin_elements' in self.dep_mgr.containers:
+            self.thin_elements.clear()
+            self._data_thin_sequence.clear()
+        else:
+            self.thin_elements = {}
+            self._data_thin_sequence = NodesList()
+            self._thin_elements = self.dep_mgr.ref(self.thin_elements, 'thin_elements')
+            self._thin_sequence = self.dep_mgr.ref(self._data_thin_sequence, 'thin_sequence')
+        self.__dict__.pop('thin_sequence', None)
+        self.__dict__.pop('thin_cell_sequence', None)
+
+        if self._is_compressed():
+            self._slice_cells(method)
+            return
+        if num_workers == 1:
+            thin_sequence, thin_elements = slicing.slice_nodes(self.sequence._v, self.elements._v, method)
+        else:
+            thin_sequence, thin_elements = slicing.slice_nodes_parallel(self.sequence._v, self.elements._v, method,
+                                                                        num_workers=num_workers, use_threads=use_threads)
+        self._set_thin_sequence(thin_sequence)
+        with self.batch_update():
+            for thin_name, thin_element in thin_elements.items():
+                self._thin_elements[thin_name] = thin_element
+
+    def _set_thin_sequence(self, nodes):
+        """ Fill the thin sequence registered in the dependency manager """
+        self._data_thin_sequence.extend(nodes)
+        self.thin_sequence = self._data_thin_sequence
+
+    def iter_thin_line(self, method: str = 'teapot'):
+        """ Generate (thin node, thin element) of sliced lattice in s order, interleaved with drifts.
+        Nothing is registered in the lattice, unexpanded cells are expanded one node at a time """
+        nodes = self.cell_sequence.iter_nodes() if self._is_compressed() else iter(self.sequence._v)
+        return slicing.iter_thin_line(nodes, self.elements._v, method)
+
+    def _slice_cells(self, method: str):
+        """ Slice unexpanded cells, every cell and its elements are sliced once.
+        The compressed thin sequence is kept as thin_cell_sequence """
+        from xsequence.cells import Cell, CellRepetition, CellSequence
+        thin_elements = {}
+
+        def slice_nodes(nodes):
+            thin_nodes, nodes_thin_elements = slicing.slice_nodes(nodes, self.elements._v, method)
+            thin_elements.update(nodes_thin_elements)
+            return thin_nodes
+
+        thin_cells = {name: Cell(name, slice_nodes(cell.nodes), cell.length)
+                      for name, cell in self.cell_sequence.cells.items()}
+        self.thin_cell_sequence = CellSequence()
+        for item in self.cell_sequence:
+            if isinstance(item, Node):
+                self.thin_cell_sequence += slice_nodes([item])
+            else:
+                self.thin_cell_sequence.append(CellRepetition(thin_cells[item.cell.name], item.count, item.offset, item.period))
+        with self.batch_update():
+            for thin_name, thin_element in thin_elements.items():
+                self._thin_elements[thin_name] = thin_element
@@ -7,8 +7,8 @@ from collections import OrderedDict
 import numpy as np
 from typing import List
 from dataclasses import dataclass
-from scipy.spatial.transform import Rotation
 from numpy.typing import ArrayLike
+from xsequence.profiling import instrument
 
 
 @dataclass
@@ -30,6 +30,7 @@ class AlignmentErrors:
     rotations: np.ndarray = np.zeros(3)
 
     def rotate(self, xyz_vector: ArrayLike) -> np.ndarray:
+        from scipy.spatial.transform import Rotation
         xyz_vector = np.array(xyz_vector)
         rotation_matrix = Rotation.from_euler('xyz', self.rotations)
         return rotation_matrix.apply(xyz_vector)
@@ -133,7 +134,62 @@ class Node:
         return f'{self.__class__.__name__}({self.element_name}{content})'
 
 
+def match_element_name(name: str, pattern: str) -> bool:
+    """ Match element name with pattern: '*suffix', 'prefix*' or a substring """
+    if pattern.startswith('*'):
+        return name.endswith(pattern[1:])
+    elif pattern.endswith('*'):
+        return name.startswith(pattern[:-1])
+    else:
+        return pattern in name
+
+
+def bisect_position(nodes: list, position: float, lo: int = 0, right: bool = False) -> int:
+    """ Get first index from lo of nodes sorted by position with a position above (right) or from position """
+    hi = len(nodes)
+    while lo < hi:
+        mid = (lo + hi)//2
+        mid_position = nodes[mid].position
+        if mid_position < position or (right and mid_position == position):
+            lo = mid + 1
+        else:
+            hi = mid
+    return lo
+
+
+def find_node_index(nodes: list, node: Node, lo: int = 0) -> int:
+    """ Get index of node object in nodes sorted by position, with a binary search on position.
+    Nodes not in position order are found with a linear search """
+    position = node.position
+    for idx in range(bisect_position(nodes, position, lo), len(nodes)):
+        if nodes[idx] is node:
+            return idx
+        if nodes[idx].position > position:
+            break
+    for idx in range(len(nodes)):
+        if nodes[idx] is node:
+            return idx
+    raise ValueError(f'Node {node.element_name} not in nodes')
+
+
 class NodesList(List):
+    @classmethod
+    @instrument
+    def from_arrays(cls,
+                    element_names: list,
+                    locations: ArrayLike,
+                    lengths: ArrayLike = None,
+                    pos_anchor: str = 'center',
+                    element_numbers: ArrayLike = None,
+                    ) -> "NodesList":
+        """ Build nodes list from columns of element names, locations and lengths """
+        num_nodes = len(element_names)
+        locations = np.asarray(locations, dtype=float).tolist()
+        lengths = [0.0]*num_nodes if lengths is None else np.asarray(lengths, dtype=float).tolist()
+        element_numbers = [0]*num_nodes if element_numbers is None else np.asarray(element_numbers, dtype=int).tolist()
+        return cls([Node(name, element_number=number, pos_anchor=pos_anchor, length=length, location=location)
+                    for name, number, length, location in zip(element_names, element_numbers, lengths, locations)])
+
     @property
     def names(self) -> list:
         return [node.element_name for node in self]
@@ -150,28 +206,90 @@ class NodesList(List):
     def coordinates(self) -> list:
         return self.get_coordinates()
 
+    @instrument
     def get_positions(self, pos_anchor:str = 'center') -> list:
-        return [node.positions[pos_anchor] for node in self]
+        return [node.calculate_positions()[pos_anchor] for node in self]
 
+    @instrument
     def get_coordinates(self, error_anchor:str = 'center') -> list:
         return [node.coordinates[error_anchor] for node in self]
 
+    @instrument
     def find_elements(self, pattern):
-        if pattern.startswith('*'):
-            return NodesList([node for node in self if node.element_name.endswith(pattern[1:])])
-        elif pattern.endswith('*'):
-            return NodesList([node for node in self if node.element_name.startswith(pattern[:-1])])
-        else:
-            return NodesList([node for node in self if pattern in node.element_name])
+        return NodesList([node for node in self if match_element_name(node.element_name, pattern)])
 
+    @instrument
     def get_range_s(self, start_location: float, end_location: float):
         start_idx = next(idx for idx, node in enumerate(self) if node.start > start_location)
         stop_idx = 1 + next(idx for idx, node in enumerate(self) if node.end > end_location)
         return self[start_idx:stop_idx]
 
+    def iter_nodes(self):
+        """ Generate nodes in sequence order, as CellSequence.iter_nodes """
+        return iter(self)
+
     def _get_total_length(self):
         return self[-1].end
 
     def __repr__(self):
         return f"{self.names}"
 
+
+class OccurrenceIndex:
+    """ Index of the nodes of every element in sequence order, keeping the element numbers of nodes up to date.
+    Adding or removing nodes only renumbers the other nodes of the same elements """
+    def __init__(self, nodes: NodesList = ()):
+        self._nodes = {}
+        for node in nodes:
+            occurrences = self._nodes.setdefault(node.element_name, [])
+            occurrences.append(node)
+            node.element_number = len(occurrences)
+
+    @instrument
+    def update(self, added: list = (), removed: list = ()):
+        """ Add and remove nodes, removed nodes are identified as objects.
+        Added nodes are inserted by position among the nodes of the same element,
+        only the nodes after the first changed occurrence are renumbered """
+        first_changed = {}
+        for node in removed:
+            occurrences = self._nodes[node.element_name]
+            idx = find_node_index(occurrences, node)
+            del occurrences[idx]
+            first_changed[node.element_name] = min(idx, first_changed.get(node.element_name, idx))
+        for node in added:
+            occurrences = self._nodes.setdefault(node.element_name, [])
+            # Existing nodes stay in front of added nodes at equal position
+            idx = bisect_position(occurrences, node.position, right=True)
+            occurrences.insert(idx, node)
+            first_changed[node.element_name] = min(idx, first_changed.get(node.element_name, idx))
+        for name, first in first_changed.items():
+            occurrences = self._nodes[name]
+            if not occurrences:
+                del self._nodes[name]
+            for idx in range(first, len(occurrences)):
+                occurrences[idx].element_number = idx + 1
+
+    def add(self, node: Node):
+        """ Add node, ordered by position among the nodes of the same element """
+        self.update(added=[node])
+
+    def remove(self, node: Node):
+        """ Remove node, identified as object """
+        self.update(removed=[node])
+
+    def __getitem__(self, name: str) -> NodesList:
+        """ Get all nodes of element, in sequence order """
+        return NodesList(self._nodes.get(name, []))
+
+    def __contains__(self, name: str) -> bool:
+        return name in self._nodes
+
+    def __iter__(self):
+        return iter(self._nodes)
+
+    def __len__(self):
+        return len(self._nodes)
+
+    def count(self, name: str) -> int:
+        """ Get number of occurrences of element """
+        return len(self._nodes.get(name, []))
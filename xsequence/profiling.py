@@ -0,0 +1,175 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+import os
+import time
+import functools
+import contextlib
+import tracemalloc
+from dataclasses import dataclass
+
+
+class _ProfilerState:
+    """ Global profiler state, instrumented functions only check enabled when profiling is off """
+    def __init__(self):
+        self.enabled = False
+        self.track_memory = False
+        self.stats = None
+        self.enclosing_stats = []
+        self.callbacks = []
+
+
+_state = _ProfilerState()
+
+
+@dataclass
+class CallStats:
+    """ Accumulated statistics of an instrumented function, times include nested instrumented calls """
+    calls: int = 0
+    total_time: float = 0.0
+    max_time: float = 0.0
+    allocated_bytes: int = 0
+
+    @property
+    def mean_time(self) -> float:
+        return self.total_time/self.calls if self.calls else 0.0
+
+
+class ProfileStats(dict):
+    """ Statistics of instrumented functions as {name: CallStats} """
+    def add(self, name: str, duration: float, allocated_bytes: int = 0):
+        stats = self.get(name)
+        if stats is None:
+            stats = self[name] = CallStats()
+        stats.calls += 1
+        stats.total_time += duration
+        stats.max_time = max(stats.max_time, duration)
+        stats.allocated_bytes += allocated_bytes
+
+    def to_dict(self) -> dict:
+        return {name: dict(stats.__dict__, mean_time=stats.mean_time) for name, stats in self.items()}
+
+    def report(self, sort_by: str = 'total_time') -> str:
+        """ Get plain text table of statistics """
+        lines = [f"{'function':40s} {'calls':>8s} {'total [ms]':>12s} {'mean [ms]':>12s} {'max [ms]':>12s} {'alloc [kB]':>12s}"]
+        for name, stats in sorted(self.items(), key=lambda item: getattr(item[1], sort_by), reverse=True):
+            lines.append(f'{name:40s} {stats.calls:8d} {stats.total_time*1e3:12.3f} {stats.mean_time*1e3:12.3f} '
+                         f'{stats.max_time*1e3:12.3f} {stats.allocated_bytes/1e3:12.1f}')
+        return '\n'.join(lines)
+
+    def print_report(self, sort_by: str = 'total_time'):
+        """ Print table of statistics, rendered with rich if available """
+        try:
+            from rich.console import Console
+            from rich.table import Table
+        except ImportError:
+            print(self.report(sort_by=sort_by))
+            return
+        table = Table(title='xsequence profile')
+        for column in ['function', 'calls', 'total [ms]', 'mean [ms]', 'max [ms]', 'alloc [kB]']:
+            table.add_column(column, justify='left' if column == 'function' else 'right')
+        for name, stats in sorted(self.items(), key=lambda item: getattr(item[1], sort_by), reverse=True):
+            table.add_row(name, str(stats.calls), f'{stats.total_time*1e3:.3f}', f'{stats.mean_time*1e3:.3f}',
+                          f'{stats.max_time*1e3:.3f}', f'{stats.allocated_bytes/1e3:.1f}')
+        Console().print(table)
+
+
+def _record(name: str, duration: float, allocated_bytes: int):
+    if _state.stats is not None:
+        _state.stats.add(name, duration, allocated_bytes)
+    for stats in _state.enclosing_stats:
+        stats.add(name, duration, allocated_bytes)
+    for callback in _state.callbacks:
+        callback(name, duration, allocated_bytes)
+
+
+def instrument(function=None, *, name: str = None):
+    """ Decorator recording wall time, calls and allocated bytes of function while profiling is enabled.
+    When disabled, the only overhead is one flag check """
+    def decorator(function):
+        label = name or function.__qualname__
+
+        @functools.wraps(function)
+        def wrapper(*args, **kwargs):
+            if not _state.enabled:
+                return function(*args, **kwargs)
+            track_memory = _state.track_memory and tracemalloc.is_tracing()
+            memory_start = tracemalloc.get_traced_memory()[0] if track_memory else 0
+            start = time.perf_counter()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                duration = time.perf_counter() - start
+                allocated_bytes = max(tracemalloc.get_traced_memory()[0] - memory_start, 0) if track_memory else 0
+                _record(label, duration, allocated_bytes)
+        return wrapper
+
+    if function is not None:
+        return decorator(function)
+    return decorator
+
+
+def add_callback(callback):
+    """ Add callback(name, duration, allocated_bytes), called after every instrumented call while enabled """
+    _state.callbacks.append(callback)
+
+
+def remove_callback(callback):
+    _state.callbacks.remove(callback)
+
+
+def enable(track_memory: bool = False) -> ProfileStats:
+    """ Enable profiling, statistics are accumulated in the returned object until disabled """
+    _state.stats = ProfileStats() if _state.stats is None else _state.stats
+    _state.track_memory = track_memory
+    if track_memory and not tracemalloc.is_tracing():
+        tracemalloc.start()
+    _state.enabled = True
+    return _state.stats
+
+
+def disable():
+    """ Disable profiling """
+    _state.enabled = False
+    _state.track_memory = False
+    _state.stats = None
+
+
+def is_enabled() -> bool:
+    return _state.enabled
+
+
+def get_stats() -> ProfileStats:
+    """ Get statistics of the currently enabled profiling, None if disabled """
+    return _state.stats
+
+
+@contextlib.contextmanager
+def profile(track_memory: bool = False, callback=None):
+    """ Profile instrumented xsequence functions inside the context, yields ProfileStats.
+    Calls inside nested contexts are also recorded in the statistics of the enclosing contexts.
+    With track_memory, allocations are traced with tracemalloc, which slows down execution """
+    previous = (_state.enabled, _state.track_memory, _state.stats, _state.enclosing_stats)
+    stop_tracing = track_memory and not tracemalloc.is_tracing()
+    if _state.stats is not None:
+        _state.enclosing_stats = _state.enclosing_stats + [_state.stats]
+    _state.stats = None
+    stats = enable(track_memory=track_memory)
+    if callback is not None:
+        add_callback(callback)
+    try:
+        yield stats
+    finally:
+        if callback is not None:
+            remove_callback(callback)
+        if stop_tracing:
+            tracemalloc.stop()
+        _state.enabled, _state.track_memory, _state.stats, _state.enclosing_stats = previous
+
+
+if os.environ.get('XSEQUENCE_PROFILE', '') not in ('', '0'):
+    # Profile the whole process and print the report at exit, XSEQUENCE_PROFILE=memory also traces allocations
+    import atexit
+    atexit.register(enable(track_memory=os.environ['XSEQUENCE_PROFILE'] == 'memory').print_report)
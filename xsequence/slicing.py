@@ -3,6 +3,17 @@
 # Copyright (c) CERN, 2022.                      #
 # ############################################## #
 
+import os
+import concurrent.futures
+import numpy as np
+import xsequence.elements as xe
+from xsequence import validation
+from xsequence.lattice_baseclasses import Node, NodesList
+from xsequence.profiling import instrument
+
+
+_ENTRANCE, _SLICE, _EXIT = 0, 1, 2
+
 
 class UndefinedSlicingMethod(Exception):
     """Exception raised for trying to define kn/ks for Quadrupole, Sextupole, Octupole."""
@@ -43,3 +54,177 @@ def get_slice_positions(element, method: str ='teapot') -> list:
     else:
         raise UndefinedSlicingMethod(method)
 
+
+def get_thin_template(element_name: str, element, method: str = 'teapot') -> tuple:
+    """ Get thin elements replacing every node of an element, built once per element, as
+    (entrance edge name, [(slice name, location relative to node center)], exit edge name, thin elements).
+    Edge names are None for elements without edges """
+    thin_elements = {}
+    entrance, exit = None, None
+    if isinstance(element, xe.SectorBend):
+        h = element.angle/element.length
+        entrance = f'{element_name}_sliced_entrance'
+        thin_elements[entrance] = xe.DipoleEdge(entrance, side='entrance', h=h, edge_angle=element.e1)
+
+    slices = []
+    for idx, thin_pos in enumerate(get_slice_positions(element, method=method)):
+        thin_name = f'{element_name}_sliced_{idx}'
+        slices.append((thin_name, thin_pos))
+        thin_elements[thin_name] = element._get_thin_element()
+
+    if isinstance(element, xe.SectorBend):
+        exit = f'{element_name}_sliced_exit'
+        thin_elements[exit] = xe.DipoleEdge(exit, side='exit', h=h, edge_angle=element.e2)
+    return entrance, slices, exit, thin_elements
+
+
+def _append_thin_nodes(thin_nodes: list, node: Node, template: tuple):
+    """ Append thin nodes of template placed at node """
+    entrance, slices, exit, _ = template
+    positions = node.calculate_positions()
+    if entrance is not None:
+        thin_nodes.append(Node(entrance, location=positions['start'], length=0.0))
+    for thin_name, location in slices:
+        thin_nodes.append(Node(thin_name, reference=positions['center'], location=location, length=0.0))
+    if exit is not None:
+        thin_nodes.append(Node(exit, location=positions['end'], length=0.0))
+
+
+def get_thin_nodes(node: Node, element, method: str = 'teapot') -> list:
+    """ Get thin nodes and thin elements replacing node, as list of (thin node, thin element) """
+    template = get_thin_template(node.element_name, element, method)
+    thin_nodes = []
+    _append_thin_nodes(thin_nodes, node, template)
+    return [(thin_node, template[3][thin_node.element_name]) for thin_node in thin_nodes]
+
+
+def _get_element_indices(nodes: list) -> tuple:
+    """ Get names of the elements of nodes in order of first appearance and array of their index per node """
+    index = {}
+    element_indices = [index.setdefault(node.element_name, len(index)) for node in nodes]
+    return list(index), np.array(element_indices, dtype=int)
+
+
+def _slice_arrays(element_indices: np.ndarray, starts: np.ndarray, centers: np.ndarray, ends: np.ndarray,
+                  element_names: list, elements: list, method: str = 'teapot') -> tuple:
+    """ Slice nodes given as arrays of element indices and positions, elements lists every referenced element once.
+    Returns (thin element names, arrays of thin element index, location and reference per thin node, thin elements),
+    thin nodes of edges are located at the node start or end, slices relative to the node center """
+    thin_names, kinds, slot_locations, sizes = [], [], [], []
+    thin_elements = {}
+    for element_name, element in zip(element_names, elements):
+        entrance, slices, exit, template_elements = get_thin_template(element_name, element, method)
+        slots = [(entrance, _ENTRANCE, 0.0)] if entrance is not None else []
+        slots += [(thin_name, _SLICE, location) for thin_name, location in slices]
+        slots += [(exit, _EXIT, 0.0)] if exit is not None else []
+        thin_names += [slot[0] for slot in slots]
+        kinds += [slot[1] for slot in slots]
+        slot_locations += [slot[2] for slot in slots]
+        sizes.append(len(slots))
+        thin_elements.update(template_elements)
+
+    sizes = np.array(sizes, dtype=int)
+    offsets = np.cumsum(sizes) - sizes
+    counts = sizes[element_indices]
+    node_indices = np.repeat(np.arange(len(element_indices)), counts)
+    slots = np.repeat(offsets[element_indices] - (np.cumsum(counts) - counts), counts) + np.arange(counts.sum())
+    kinds = np.array(kinds, dtype=int)[slots]
+    locations = np.where(kinds == _SLICE, np.array(slot_locations, dtype=float)[slots],
+                         np.where(kinds == _ENTRANCE, starts[node_indices], ends[node_indices]))
+    references = np.where(kinds == _SLICE, centers[node_indices], 0.0)
+    return thin_names, slots, locations, references, thin_elements
+
+
+def _get_thin_nodes(thin_names: list, slots: np.ndarray, locations: np.ndarray, references: np.ndarray) -> list:
+    return [Node(thin_names[slot], length=0.0, location=location, reference=reference)
+            for slot, location, reference in zip(slots.tolist(), locations.tolist(), references.tolist())]
+
+
+@instrument
+def slice_nodes(nodes: list, elements: dict, method: str = 'teapot') -> tuple:
+    """ Slice nodes, returns thin sequence and thin elements.
+    Thin elements are named after their element and built once, nodes of the same element share them """
+    nodes = list(nodes)
+    element_names, element_indices = _get_element_indices(nodes)
+    thin_names, slots, locations, references, thin_elements = _slice_arrays(
+        element_indices, *validation.get_node_positions(nodes), element_names,
+        [elements[element_name] for element_name in element_names], method)
+    return NodesList(_get_thin_nodes(thin_names, slots, locations, references)), thin_elements
+
+
+@instrument
+def slice_nodes_parallel(nodes: list, elements: dict, method: str = 'teapot', num_workers: int = None,
+                         use_threads: bool = False) -> tuple:
+    """ Slice nodes in parallel, partitioned in contiguous s-ranges, one per worker process or thread.
+    Workers receive arrays of element indices and positions with every element of their partition once, and
+    return arrays of thin element indices and positions, thin nodes are only built when stitching partitions
+    in order. The result is identical to slice_nodes """
+    num_workers = num_workers or os.cpu_count() or 1
+    nodes = list(nodes)
+    if num_workers == 1 or len(nodes) < 2*num_workers:
+        return slice_nodes(nodes, elements, method)
+    element_names, element_indices = _get_element_indices(nodes)
+    starts, centers, ends = validation.get_node_positions(nodes)
+    bounds = [len(nodes)*idx//num_workers for idx in range(num_workers + 1)]
+    partitions = []
+    for start, end in zip(bounds[:-1], bounds[1:]):
+        # Sorted indices keep the elements of each partition in order of first appearance in nodes
+        partition_indices, local_indices = np.unique(element_indices[start:end], return_inverse=True)
+        partition_names = [element_names[idx] for idx in partition_indices]
+        partitions.append((local_indices, starts[start:end], centers[start:end], ends[start:end], partition_names,
+                           [elements[element_name] for element_name in partition_names], method))
+    executor_class = concurrent.futures.ThreadPoolExecutor if use_threads else concurrent.futures.ProcessPoolExecutor
+    with executor_class(max_workers=num_workers) as executor:
+        results = list(executor.map(_slice_arrays, *zip(*partitions)))
+
+    thin_sequence = NodesList()
+    thin_elements = {}
+    for thin_names, slots, locations, references, partition_elements in results:
+        thin_sequence.extend(_get_thin_nodes(thin_names, slots, locations, references))
+        thin_elements.update(partition_elements)
+    return thin_sequence, thin_elements
+
+
+def _drift_before(position: float, previous_end: float, drift_count: int,
+                  index: int, name: str, previous_name: str):
+    """ Get drift node and element from previous_end to position, None for zero length gaps.
+    Raises NegativeDriftError reporting the thin node at index of the thin sequence before previous_end """
+    drift_length = position - previous_end
+    if drift_length > 1e-10:
+        drift_name = f'drift_{drift_count}'
+        return (Node(drift_name, length=drift_length, location=previous_end + drift_length/2.),
+                xe.Drift(drift_name, length=drift_length))
+    if drift_length < -1e-6: # Tolerance for rounding
+        raise validation.NegativeDriftError(validation.DriftReport(indices=np.array([index]), names=[name],
+                                                                   element_numbers=[0], previous_names=[previous_name],
+                                                                   gaps=np.array([drift_length])))
+    return None
+
+
+def iter_thin_line(nodes, elements: dict, method: str = 'teapot'):
+    """ Generate (thin node, thin element) of sliced nodes in s order, interleaved with drifts as in
+    the line representation, from the start of the first node to the end of the last node.
+    Nodes can be any iterable, nothing is kept in memory between steps """
+    previous_end = None
+    previous_name = 'start'
+    node_end = None
+    drift_count = 0
+    index = 0
+    for node in nodes:
+        positions = node.calculate_positions()
+        if previous_end is None:
+            previous_end = positions['start']
+        for thin_node, thin_element in get_thin_nodes(node, elements[node.element_name], method):
+            drift = _drift_before(thin_node.position, previous_end, drift_count, index,
+                                  thin_node.element_name, previous_name)
+            if drift is not None:
+                drift_count += 1
+                yield drift
+            yield thin_node, thin_element
+            previous_end, previous_name = thin_node.position, thin_node.element_name
+            index += 1
+        node_end = positions['end']
+    if node_end is not None:
+        drift = _drift_before(node_end, previous_end, drift_count, index, 'end', previous_name)
+        if drift is not None:
+            yield drift
@@ -0,0 +1,192 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+import numpy as np
+import xsequence.elements as xe
+
+
+ANCHOR_OFFSETS = {'start': 0.0, 'center': 0.5, 'end': 1.0}
+
+
+def get_element_geometry(element) -> tuple:
+    """ Get (length, bending angle, tilt) of element, as used by the survey """
+    angle = element.angle if isinstance(element, xe.SectorBend) else 0.0
+    tilt = element.parameter_data.tilt if element.parameter_data is not None else 0.0
+    return element.length, angle, tilt
+
+
+def get_rotation_matrix(theta: float = 0.0, phi: float = 0.0, psi: float = 0.0) -> np.ndarray:
+    """ Get global rotation matrix W = THETA PHI PSI from survey angles, MAD-X conventions """
+    ct, st, cp, sp, cs, ss = np.cos(theta), np.sin(theta), np.cos(phi), np.sin(phi), np.cos(psi), np.sin(psi)
+    rot_theta = np.array([[ct, 0, st], [0, 1, 0], [-st, 0, ct]])
+    rot_phi = np.array([[1, 0, 0], [0, cp, sp], [0, -sp, cp]])
+    rot_psi = np.array([[cs, -ss, 0], [ss, cs, 0], [0, 0, 1]])
+    return rot_theta @ rot_phi @ rot_psi
+
+
+def get_local_transforms(gaps: np.ndarray, lengths: np.ndarray, angles: np.ndarray, tilts: np.ndarray) -> tuple:
+    """ Get rotations (n, 3, 3) and displacements (n, 3) of nodes, including the drift in front of them,
+    in the local frame at the end of the previous node """
+    num_nodes = len(lengths)
+    bend = angles != 0.0
+    rho = np.divide(lengths, angles, out=np.zeros(num_nodes), where=bend)
+    cos_a, sin_a = np.cos(angles), np.sin(angles)
+    displacement = np.zeros((num_nodes, 3))
+    displacement[:, 0] = np.where(bend, rho*(cos_a - 1.0), 0.0)
+    displacement[:, 2] = np.where(bend, rho*sin_a, lengths)
+    rotation = np.zeros((num_nodes, 3, 3))
+    rotation[:, 0, 0] = cos_a
+    rotation[:, 0, 2] = -sin_a
+    rotation[:, 1, 1] = 1.0
+    rotation[:, 2, 0] = sin_a
+    rotation[:, 2, 2] = cos_a
+
+    tilted = np.flatnonzero(tilts != 0.0)
+    if len(tilted):
+        cos_t, sin_t = np.cos(tilts[tilted]), np.sin(tilts[tilted])
+        tilt = np.zeros((len(tilted), 3, 3))
+        tilt[:, 0, 0], tilt[:, 0, 1], tilt[:, 1, 0], tilt[:, 1, 1], tilt[:, 2, 2] = cos_t, -sin_t, sin_t, cos_t, 1.0
+        displacement[tilted] = np.einsum('nij,nj->ni', tilt, displacement[tilted])
+        rotation[tilted] = tilt @ rotation[tilted] @ tilt.transpose(0, 2, 1)
+
+    displacement[:, 2] += gaps
+    return rotation, displacement
+
+
+def scan_frames(rotation: np.ndarray, displacement: np.ndarray) -> tuple:
+    """ Inclusive prefix composition of local transforms into frames relative to the start,
+    as a log-depth scan of batched products with (W_a, V_a)(W_b, V_b) = (W_a W_b, V_a + W_a V_b) """
+    rotation, displacement = rotation.copy(), displacement.copy()
+    step = 1
+    while step < len(rotation):
+        new_displacement = displacement[:-step] + np.einsum('nij,nj->ni', rotation[:-step], displacement[step:])
+        new_rotation = rotation[:-step] @ rotation[step:]
+        displacement[step:] = new_displacement
+        rotation[step:] = new_rotation
+        step *= 2
+    return rotation, displacement
+
+
+def planar_frames(angles: np.ndarray, displacement: np.ndarray) -> tuple:
+    """ Frames relative to the start for lattices bending in the horizontal plane only, from cumulative sums """
+    theta = -np.cumsum(angles)
+    theta_entry = np.concatenate([[0.0], theta[:-1]])
+    cos_e, sin_e = np.cos(theta_entry), np.sin(theta_entry)
+    positions = np.zeros_like(displacement)
+    positions[:, 0] = np.cumsum(cos_e*displacement[:, 0] + sin_e*displacement[:, 2])
+    positions[:, 1] = np.cumsum(displacement[:, 1])
+    positions[:, 2] = np.cumsum(-sin_e*displacement[:, 0] + cos_e*displacement[:, 2])
+    cos_t, sin_t = np.cos(theta), np.sin(theta)
+    rotation = np.zeros((len(angles), 3, 3))
+    rotation[:, 0, 0], rotation[:, 0, 2], rotation[:, 1, 1], rotation[:, 2, 0], rotation[:, 2, 2] = \
+        cos_t, sin_t, 1.0, -sin_t, cos_t
+    return rotation, positions
+
+
+class Survey:
+    """ Global floor coordinates X, Y, Z and angles THETA, PHI, PSI at the exit of every node of a lattice,
+    with MAD-X conventions. Node and element data is read once, (re)computation is vectorized """
+    def __init__(self, lattice, x0: float = 0.0, y0: float = 0.0, z0: float = 0.0,
+                 theta0: float = 0.0, phi0: float = 0.0, psi0: float = 0.0):
+        self.lattice = lattice
+        self.initial_position = np.array([x0, y0, z0], dtype=float)
+        self.initial_rotation = get_rotation_matrix(theta0, phi0, psi0)
+        self.theta0 = theta0
+
+        sequence = lattice.sequence._v
+        self.names = [node.element_name for node in sequence]
+        self.element_names = list(dict.fromkeys(self.names))
+        element_ids = {name: idx for idx, name in enumerate(self.element_names)}
+        self._element_index = np.array([element_ids[name] for name in self.names], dtype=int)
+        self._locations = np.array([node.location + node.reference for node in sequence], dtype=float)
+        self._anchor_offsets = np.array([ANCHOR_OFFSETS[node.pos_anchor] for node in sequence])
+        self._geometry = np.array([get_element_geometry(lattice.elements._v[name]) for name in self.element_names],
+                                  dtype=float).reshape(-1, 3)
+        self.compute()
+
+    def _get_node_geometry(self, indices=slice(None)) -> tuple:
+        """ Get start, end, length, angle and tilt of nodes """
+        lengths, angles, tilts = self._geometry[self._element_index[indices]].T
+        starts = self._locations[indices] - self._anchor_offsets[indices]*lengths
+        return starts, starts + lengths, lengths, angles, tilts
+
+    def compute(self):
+        """ Compute frames of all nodes """
+        starts, ends, lengths, angles, tilts = self._get_node_geometry()
+        gaps = starts - np.concatenate([[0.0], ends[:-1]])
+        rotation, displacement = get_local_transforms(gaps, lengths, angles, tilts)
+        if np.all(tilts == 0.0):
+            rotation, positions = planar_frames(angles, displacement)
+        else:
+            rotation, positions = scan_frames(rotation, displacement)
+        self.rotation = self.initial_rotation @ rotation
+        self.position = self.initial_position + positions @ self.initial_rotation.T
+        self.s = ends
+
+    def update(self, element_names):
+        """ Update survey after changes of the geometry of given elements.
+        Only nodes of these elements, and the drifts behind them, are recomputed, the frames between them
+        are moved rigidly """
+        if isinstance(element_names, str):
+            element_names = [element_names]
+        for name in element_names:
+            idx = self.element_names.index(name)
+            self._geometry[idx] = get_element_geometry(self.lattice.elements._v[name])
+        occurrences = np.flatnonzero(np.isin(self._element_index, [self.element_names.index(name) for name in element_names]))
+        changed = np.unique(np.concatenate([occurrences, occurrences + 1]))
+        changed = changed[changed < len(self.names)]
+        if len(changed) == 0:
+            return
+
+        starts, ends, lengths, angles, tilts = self._get_node_geometry(changed)
+        previous = changed - 1
+        previous_ends = np.where(previous >= 0, self._get_node_geometry(np.maximum(previous, 0))[1], 0.0)
+        rotation, displacement = get_local_transforms(starts - previous_ends, lengths, angles, tilts)
+        self.s[changed] = ends
+
+        boundaries = np.append(changed[1:], len(self.names))
+        for idx, (node, boundary) in enumerate(zip(changed, boundaries)):
+            if node == 0:
+                rotation_in, position_in = self.initial_rotation, self.initial_position
+            else:
+                rotation_in, position_in = self.rotation[node - 1], self.position[node - 1]
+            new_rotation = rotation_in @ rotation[idx]
+            new_position = position_in + rotation_in @ displacement[idx]
+            correction = new_rotation @ self.rotation[node].T
+            offset = new_position - correction @ self.position[node]
+            self.rotation[node], self.position[node] = new_rotation, new_position
+            if boundary > node + 1:
+                self.rotation[node+1:boundary] = correction @ self.rotation[node+1:boundary]
+                self.position[node+1:boundary] = offset + self.position[node+1:boundary] @ correction.T
+
+    @property
+    def x(self) -> np.ndarray:
+        return self.position[:, 0]
+
+    @property
+    def y(self) -> np.ndarray:
+        return self.position[:, 1]
+
+    @property
+    def z(self) -> np.ndarray:
+        return self.position[:, 2]
+
+    @property
+    def theta(self) -> np.ndarray:
+        theta = np.arctan2(self.rotation[:, 0, 2], self.rotation[:, 2, 2])
+        return np.unwrap(np.concatenate([[self.theta0], theta]))[1:]
+
+    @property
+    def phi(self) -> np.ndarray:
+        return np.arctan2(self.rotation[:, 1, 2], np.hypot(self.rotation[:, 0, 2], self.rotation[:, 2, 2]))
+
+    @property
+    def psi(self) -> np.ndarray:
+        return np.arctan2(self.rotation[:, 1, 0], self.rotation[:, 1, 1])
+
+    def to_dict(self) -> dict:
+        """ Get survey columns as dict of arrays """
+        return {'name': np.array(self.names), 's': self.s, 'x': self.x, 'y': self.y, 'z': self.z,
+                'theta': self.theta, 'phi': self.phi, 'psi': self.psi}
@@ -0,0 +1,169 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+import os
+import numpy as np
+from xsequence import aperture
+from xsequence._lazy import lazy_import
+
+pd = lazy_import('pandas')
+
+
+ELEMENT_ATTRIBUTES = ('angle', 'k1', 'k2', 'k3', 'kick', 'voltage', 'frequency', 'lag')
+APERTURE_COLUMNS = ('aper_type', 'aper_1', 'aper_2', 'aper_offset_x', 'aper_offset_y')
+ANCHOR_OFFSETS = {'start': 0.5, 'center': 0.0, 'end': -0.5}
+TABLE_FORMATS = {'.parquet': 'parquet', '.feather': 'feather', '.arrow': 'feather', '.tfs': 'tfs'}
+CHUNK_SIZE = 100_000
+
+
+def _import_pyarrow():
+    try:
+        import pyarrow
+    except ImportError as error:
+        raise ImportError('pyarrow is required for Parquet and Feather tables, '
+                          'install it with pip install xsequence[arrow]') from error
+    return pyarrow
+
+
+def get_table_columns(lattice, attributes: tuple = ELEMENT_ATTRIBUTES) -> dict:
+    """ Get columns of lattice table as dict of arrays, one row per node. Positions s are node centers.
+    Element data is read once per element and broadcast to nodes, missing attributes are 0 """
+    nodes = list(lattice.cell_sequence.iter_nodes()) if lattice._is_compressed() else lattice.sequence._v
+    element_names = list(lattice.elements._v)
+    element_codes = {name: code for code, name in enumerate(element_names)}
+    codes = np.array([element_codes[node.element_name] for node in nodes], dtype=np.int64)
+    lengths = np.array([node.length for node in nodes], dtype=float)
+    centers = np.array([node.location + node.reference + ANCHOR_OFFSETS[node.pos_anchor]*node.length
+                        for node in nodes], dtype=float)
+
+    elements = [lattice.elements._v[name] for name in element_names]
+    columns = {'name': np.array(element_names, dtype=object)[codes],
+               'keyword': np.array([element.__class__.__name__.lower() for element in elements], dtype=object)[codes],
+               'element_number': np.array([node.element_number for node in nodes], dtype=np.int64),
+               's_start': centers - lengths/2, 's': centers, 's_end': centers + lengths/2, 'length': lengths}
+    for attribute in attributes:
+        values = [getattr(element, attribute, 0.0) for element in elements]
+        columns[attribute] = np.array([value if np.isscalar(value) else 0.0 for value in values], dtype=float)[codes]
+
+    rows = [aperture.get_aperture_row(element.aperture_data)[:5] for element in elements]
+    aperture_values = np.array(rows, dtype=float).reshape(-1, 5)
+    aperture_values[aperture_values[:, 0] == aperture.APERTURE_NONE, 1:3] = 0.0
+    aperture_values[aperture_values[:, 0] == aperture.APERTURE_POLYGON, 1:3] = 0.0
+    for idx, column in enumerate(APERTURE_COLUMNS):
+        columns[column] = aperture_values[codes, idx]
+    columns['aper_type'] = columns['aper_type'].astype(np.int64)
+    return columns
+
+
+def columns_to_table(columns: dict, kind: str = 'pandas'):
+    """ Convert columns to table of given kind: 'dict', 'pandas', 'recarray' or 'arrow' """
+    if kind == 'dict':
+        return columns
+    if kind == 'pandas':
+        table = pd.DataFrame(columns)
+        for key in ['name', 'keyword']:
+            table[key] = table[key].astype('category')
+        return table
+    if kind == 'recarray':
+        return np.rec.fromarrays([values.astype(str) if values.dtype == object else values
+                                  for values in columns.values()], names=list(columns))
+    if kind == 'arrow':
+        pa = _import_pyarrow()
+        arrays = {key: pa.array(values).dictionary_encode() if key in ('name', 'keyword') else pa.array(values)
+                  for key, values in columns.items()}
+        return pa.table(arrays)
+    raise ValueError(f'Unknown table kind {kind}')
+
+
+def get_table_format(path: str, table_format: str = None) -> str:
+    if table_format is not None:
+        return table_format
+    extension = os.path.splitext(path)[1].lower()
+    if extension not in TABLE_FORMATS:
+        raise ValueError(f'Unknown table format of {path}, expected one of {list(TABLE_FORMATS)}')
+    return TABLE_FORMATS[extension]
+
+
+def _iter_chunks(columns: dict, chunk_size: int):
+    num_rows = len(next(iter(columns.values()))) if columns else 0
+    for start in range(0, max(num_rows, 1), chunk_size):
+        yield {key: values[start:start + chunk_size] for key, values in columns.items()}
+
+
+def _write_arrow(columns: dict, path: str, table_format: str, chunk_size: int):
+    pa = _import_pyarrow()
+    schema = pa.table({key: pa.array(values[:1]) for key, values in columns.items()}).schema
+    if table_format == 'parquet':
+        import pyarrow.parquet as pq
+        writer = pq.ParquetWriter(path, schema)
+        write = writer.write_table
+    else:
+        import pyarrow.ipc
+        writer = pyarrow.ipc.new_file(path, schema)
+        write = writer.write_table
+    with writer:
+        for chunk in _iter_chunks(columns, chunk_size):
+            write(pa.table({key: pa.array(values) for key, values in chunk.items()}, schema=schema))
+
+
+TFS_TYPES = {'i': '%d', 'f': '%le', 'O': '%s', 'U': '%s'}
+TFS_FORMATS = {'%d': '{:>14d}', '%le': '{:>22.15g}', '%s': '{:>20s}'}
+
+
+def _write_tfs(columns: dict, path: str, chunk_size: int, headers: dict = None):
+    """ Write columns as TFS file, rows are formatted and written chunk by chunk """
+    types = [TFS_TYPES[values.dtype.kind] for values in columns.values()]
+    with open(path, 'w') as f:
+        for key, value in (headers or {}).items():
+            if isinstance(value, str):
+                f.write(f'@ {key.upper():16s} %s "{value}"\n')
+            else:
+                f.write(f'@ {key.upper():16s} %le {value}\n')
+        f.write('* ' + ' '.join(f'{key.upper():>20s}' for key in columns) + '\n')
+        f.write('$ ' + ' '.join(f'{column_type:>20s}' for column_type in types) + '\n')
+        line_format = '  ' + ' '.join(TFS_FORMATS[column_type] for column_type in types) + '\n'
+        for chunk in _iter_chunks(columns, chunk_size):
+            values = [[f'"{value}"' for value in values] if column_type == '%s' else values.tolist()
+                      for values, column_type in zip(chunk.values(), types)]
+            f.write(''.join(line_format.format(*row) for row in zip(*values)))
+
+
+def write_table(columns: dict, path: str, table_format: str = None, chunk_size: int = CHUNK_SIZE,
+                headers: dict = None):
+    """ Write table columns to Parquet, Feather or TFS file in chunks of rows, format from extension if not given """
+    table_format = get_table_format(path, table_format)
+    if table_format == 'tfs':
+        _write_tfs(columns, path, chunk_size, headers=headers)
+    elif table_format in ('parquet', 'feather'):
+        _write_arrow(columns, path, table_format, chunk_size)
+    else:
+        raise ValueError(f'Unknown table format {table_format}')
+
+
+def _read_tfs(path: str, columns: list = None) -> "pd.DataFrame":
+    names, skiprows = None, 0
+    with open(path) as f:
+        for line in f:
+            skiprows += 1
+            if line.startswith('*'):
+                names = [name.lower() for name in line.split()[1:]]
+            elif line.startswith('$'):
+                break
+    return pd.read_csv(path, sep=r'\s+', skiprows=skiprows, names=names, usecols=columns, quotechar='"')
+
+
+def read_table(path: str, columns: list = None, table_format: str = None) -> "pd.DataFrame":
+    """ Read table written by write_table as DataFrame, only the given columns are read """
+    table_format = get_table_format(path, table_format)
+    if table_format == 'tfs':
+        return _read_tfs(path, columns=columns)
+    _import_pyarrow()
+    if table_format == 'parquet':
+        import pyarrow.parquet as pq
+        return pq.read_table(path, columns=columns).to_pandas()
+    if table_format == 'feather':
+        import pyarrow.feather
+        return pyarrow.feather.read_table(path, columns=columns).to_pandas()
+    raise ValueError(f'Unknown table format {table_format}')
@@ -0,0 +1,80 @@
+"""
+Module tests.lattices
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a helper module with the lattices shared by the test modules.
+"""
+
+import math
+from xsequence.cells import Cell, CellRepetition, CellSequence
+from xsequence.elements import Marker, Quadrupole, SectorBend, Sextupole
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node, NodesList
+
+
+MADX_SEQUENCE = """
+kqf = 0.1; kqd := -kqf; ang = 0.01; unused = 3;
+qf: quadrupole, l=1.0, k1:=kqf;
+qd: quadrupole, l=1.0, k1:=kqd, apertype=ellipse, aperture={0.02, 0.01};
+mb: sbend, l=3.0, angle:=ang, e1=0.001;
+rb: rbend, l=2.0, angle=0.02;
+mp: multipole, knl:={0, 0.5*kqf};
+bpm: marker;
+cav: rfcavity, l=0.5, volt=2, freq=400, lag=0.5;
+fodo: sequence, l=20, refer=centre;
+qf, at=1.0;
+mb, at=5.0;
+bpm, at=7.0;
+qd, at=9.0;
+mb, at=13.0;
+rb, at=16.0;
+mp, at=17.2;
+cav, at=18.0;
+endsequence;
+beam, particle=electron, energy=10;
+"""
+
+
+def make_lattice(lazy: bool, order_nodes: bool = False) -> Lattice:
+    elements = {'qf': Quadrupole('qf', length=1.0, k1=0.1), 'm1': Marker('m1')}
+    sequence = NodesList()
+    for idx in range(5):
+        sequence += [Node('qf', location=4.0*idx + 1.0), Node('m1', location=4.0*idx + 3.0)]
+    if order_nodes:
+        sequence = NodesList(sequence[::-1])
+    return Lattice('cell', elements, sequence, Beam(10.0, 'electron'), global_variables={'kf': 0.1},
+                   lazy=lazy, order_nodes=order_nodes)
+
+
+def get_elements() -> dict:
+    return {'qf': Quadrupole('qf', length=1.0, k1=0.1), 'qd': Quadrupole('qd', length=1.0, k1=-0.1),
+            'mb': SectorBend('mb', length=3.0, angle=0.01), 'ip': Marker('ip'), 'm1': Marker('m1')}
+
+
+def get_cell_nodes() -> list:
+    return [Node('qf', location=0.5), Node('mb', location=3.0), Node('m1', location=5.0),
+            Node('qd', location=6.5), Node('mb', location=9.0)]
+
+
+def make_lattices() -> tuple:
+    cell = Cell('fodo', get_cell_nodes(), length=12.0)
+    cells = CellSequence([Node('ip', location=1.0), CellRepetition(cell, count=50, offset=2.0),
+                          Node('ip', location=603.0), CellRepetition(cell, count=30, offset=604.0, period=12.5)])
+    flat = NodesList([Node('ip', location=1.0)])
+    flat += [Node(node.element_name, location=node.location + 2.0 + 12.0*idx) for idx in range(50) for node in get_cell_nodes()]
+    flat += [Node('ip', location=603.0)]
+    flat += [Node(node.element_name, location=node.location + 604.0 + 12.5*idx) for idx in range(30) for node in get_cell_nodes()]
+    return (Lattice('ring', get_elements(), cells, Beam(10.0, 'electron'), key='cells', global_variables={}),
+            Lattice('ring', get_elements(), flat, Beam(10.0, 'electron'), global_variables={}))
+
+
+def make_fodo_lattice(num_nodes: int) -> Lattice:
+    """ FODO ring with shared elements, 7 nodes per cell """
+    num_cells = max(1, num_nodes // 7)
+    elements = {'qf': Quadrupole('qf', length=1.0, k1=0.2), 'qd': Quadrupole('qd', length=1.0, k1=-0.2),
+                'mb': SectorBend('mb', length=4.0, angle=math.pi/num_cells), 'sf': Sextupole('sf', length=0.5, k2=0.1),
+                'bpm': Marker('bpm')}
+    cell = [('qf', 0.5), ('sf', 1.5), ('mb', 4.0), ('bpm', 6.5), ('qd', 7.5), ('mb', 10.5), ('bpm', 13.0)]
+    sequence = NodesList([Node(name, location=location + 14.0*idx)
+                          for idx in range(num_cells) for name, location in cell])
+    return Lattice('fodo', elements, sequence, Beam(45.6, 'electron'), global_variables={})
@@ -0,0 +1,72 @@
+"""
+Module tests.test_aperture
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the lattice aperture table.
+"""
+
+import numpy as np
+import pytest
+import xsequence.elements as xe
+import xsequence.elements_dataclasses as xed
+from xsequence.aperture import APERTURE_ELLIPTICAL, APERTURE_NONE, APERTURE_POLYGON, APERTURE_RECTANGULAR
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node, NodesList
+
+
+@pytest.fixture
+def table():
+    elements = {'qf': xe.Quadrupole('qf', length=2.0, aperture_data=xed.EllipticalAperture(aperture_size=[0.02, 0.01])),
+                'qd': xe.Quadrupole('qd', length=2.0, aperture_data=xed.EllipticalAperture(aperture_size=[0.04, 0.03],
+                                                                                           aperture_offset=[0.01, 0.0])),
+                'mb': xe.SectorBend('mb', length=2.0, angle=0.01,
+                                    aperture_data=xed.RectangularAperture(aperture_size=[-0.02, 0.04, -0.01, 0.01])),
+                'col': xe.Collimator('col', length=1.0, aperture_data=xed.ApertureData(aper_vx=[-0.01, 0.01, 0.0],
+                                                                                       aper_vy=[-0.01, -0.01, 0.01])),
+                'm1': xe.Marker('m1')}
+    sequence = NodesList([Node('qf', location=1.0), Node('m1', location=3.0), Node('qd', location=7.0),
+                          Node('mb', location=11.0), Node('col', location=14.5)])
+    lattice = Lattice('line', elements, sequence, Beam(1.0, 'electron'))
+    return lattice.get_aperture_table()
+
+
+def test_aperture_at(table):
+    types, sizes, offsets = table.aperture_at([1.0, 4.0, 7.0, 11.0, 14.5])
+    assert list(types) == [APERTURE_ELLIPTICAL, APERTURE_ELLIPTICAL, APERTURE_ELLIPTICAL, APERTURE_RECTANGULAR, APERTURE_POLYGON]
+    assert np.allclose(sizes[:4], [[0.02, 0.01], [0.03, 0.02], [0.04, 0.03], [0.03, 0.01]])
+    assert np.allclose(offsets[:4], [[0.0, 0.0], [0.005, 0.0], [0.01, 0.0], [0.01, 0.0]])
+
+
+def test_is_inside(table):
+    x = np.array([0.019, 0.021, 0.045, 0.0, 0.039, 0.041, 0.0, 0.009])
+    y = np.array([0.0, 0.0, 0.0, 0.0, 0.005, 0.0, 0.0, 0.009])
+    s = np.array([1.0, 1.0, 7.0, 7.0, 11.0, 11.0, 14.5, 14.5])
+    assert list(table.is_inside(x, y, s)) == [True, False, True, True, True, False, True, False]
+
+
+def test_is_inside_with_reused_location(table):
+    rng = np.random.default_rng(1)
+    s = rng.uniform(0.0, 12.0, 10000)
+    location = table.locate(s)
+    x, y = rng.normal(0.0, 0.02, (2, 10000))
+    inside = table.is_inside(x, y, s, location=location)
+    assert np.array_equal(inside, table.is_inside(x, y, s))
+    types, sizes, offsets = table.aperture_at(s, location=location)
+    elliptical = types == APERTURE_ELLIPTICAL
+    radius = ((x - offsets[:, 0])/sizes[:, 0])**2 + ((y - offsets[:, 1])/sizes[:, 1])**2
+    assert np.array_equal(inside[elliptical], radius[elliptical] <= 1.0)
+
+
+def test_scalar_positions(table):
+    assert table.is_inside(0.0, 0.0, 1.0) and not table.is_inside(0.05, 0.0, 1.0)
+    types, sizes, offsets = table.aperture_at(4.0)
+    assert types == APERTURE_ELLIPTICAL and np.allclose(sizes, [0.03, 0.02]) and np.allclose(offsets, [0.005, 0.0])
+    assert table.is_inside(0.0, 0.0, 1.0) == table.is_inside([0.0], [0.0], [1.0])[0]
+
+
+def test_positions_outside_knots(table):
+    types, sizes, offsets = table.aperture_at([-1.0, -1e-9, 0.0, 20.0])
+    assert list(types) == [APERTURE_NONE, APERTURE_NONE, APERTURE_ELLIPTICAL, APERTURE_POLYGON]
+    assert np.all(np.isinf(sizes[:2])) and np.allclose(offsets[:2], 0.0)
+    assert list(table.is_inside([1.0, 1.0, 0.0], [1.0, 1.0, 0.0], [-1.0, -5.0, 20.0])) == [True, True, True]
+    assert not table.is_inside(1.0, 1.0, 20.0)
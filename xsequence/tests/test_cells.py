@@ -0,0 +1,75 @@
+"""
+Module tests.test_cells
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test lattices built from repeated cells.
+"""
+
+import numpy as np
+import pytest
+from xsequence.cells import Cell, CellRepetition, CellSequence
+from xsequence.elements import Quadrupole
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node
+from xsequence.tests.lattices import get_cell_nodes, get_elements, make_lattices
+from xsequence.validation import NegativeDriftError
+
+
+def nodes_data(nodes) -> list:
+    return [(node.element_name, node.element_number, round(node.start, 9), round(node.end, 9)) for node in nodes]
+
+
+def test_cell_lattice_queries_without_expansion():
+    cells, flat = make_lattices()
+    assert cells.cell_sequence.num_nodes == len(flat.sequence._v) == 402
+    assert nodes_data(cells.get_class([Quadrupole])) == nodes_data(flat.get_class([Quadrupole]))
+    assert nodes_data(cells.find_elements('m*')) == nodes_data(flat.find_elements('m*'))
+    for start, end in [(0.0, 20.0), (300.2, 700.0), (650.0, 900.0)]:
+        assert nodes_data(cells.get_range_s(start, end)) == nodes_data(flat.get_range_s(start, end))
+    assert cells.get_total_length() == flat.get_total_length()
+
+    line, line_elements = cells._get_line()
+    flat_line, flat_line_elements = flat._get_line()
+    assert isinstance(line, CellSequence) and len(line) < len(flat_line)
+    assert [node.element_name for node in line.iter_nodes() if not node.element_name.startswith('drift')] == \
+           [node.element_name for node in flat_line if not node.element_name.startswith('drift')]
+    assert np.allclose([node.length for node in line.iter_nodes()], [node.length for node in flat_line])
+    assert len(line_elements) < len(flat_line_elements)
+    assert cells._is_compressed()
+
+
+def test_cell_lattice_slicing_and_expansion():
+    cells, flat = make_lattices()
+    cells.slice_lattice()
+    flat.slice_lattice()
+    assert cells._is_compressed() and len(cells.thin_cell_sequence) == 4
+    assert 'thin_sequence' not in cells.__dict__
+    assert [node.element_name for node in cells.thin_sequence] == [node.element_name for node in flat.thin_sequence]
+    assert np.allclose([node.position for node in cells.thin_sequence], [node.position for node in flat.thin_sequence])
+    assert set(cells.thin_elements) == set(flat.thin_elements)
+
+    assert nodes_data(cells.sequence._v) == nodes_data(flat.sequence._v)
+    assert not cells._is_compressed()
+    cells.insert_elements(['m1'], [1.8])
+    assert cells.find_elements('m1')[0].element_number == 1
+
+
+def test_cell_negative_drift():
+    cell = Cell('cell', [Node('qf', location=0.5), Node('qd', location=1.0)], length=2.0)
+    lattice = Lattice('bad', get_elements(), CellSequence([CellRepetition(cell, 3)]), Beam(10.0, 'electron'),
+                      key='cells', global_variables={})
+    with pytest.raises(NegativeDriftError, match='Negative drift') as error:
+        lattice._get_line()
+    assert list(error.value.report.names) == ['qd']*3
+
+
+def test_cell_lattice_export_matches_flat():
+    pf = pytest.importorskip('xsequence.helpers.pyat_functions')
+    pytest.importorskip('at')
+    cells, flat = make_lattices()
+    ring, flat_ring = pf.lattice_to_pyat(cells), pf.lattice_to_pyat(flat)
+    assert [element.FamName for element in ring if not element.FamName.startswith('drift')] == \
+           [element.FamName for element in flat_ring if not element.FamName.startswith('drift')]
+    assert [type(element) for element in ring] == [type(element) for element in flat_ring]
+    assert np.allclose(ring.get_s_pos(range(len(ring) + 1)), flat_ring.get_s_pos(range(len(flat_ring) + 1)))
+    assert cells._is_compressed()
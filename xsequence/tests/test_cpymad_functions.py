@@ -0,0 +1,75 @@
+"""
+Module tests.test_cpymad_functions
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the import of MAD-X sequences through cpymad.
+"""
+
+import numpy as np
+import pytest
+from cpymad.madx import Madx
+from xsequence.elements import Marker, Quadrupole, RectangularBend, SectorBend, RFCavity, ThinMultipole
+from xsequence.helpers.cpymad_functions import from_cpymad
+from xsequence.tests.lattices import MADX_SEQUENCE
+
+
+@pytest.fixture(scope='module')
+def madx():
+    madx = Madx(stdout=False)
+    madx.input(MADX_SEQUENCE)
+    madx.use('fodo')
+    yield madx
+    madx.quit()
+
+
+def test_from_cpymad_sequence(madx):
+    lattice = from_cpymad(madx, 'fodo')
+    assert [node.element_name for node in lattice.sequence] == ['qf', 'mb', 'bpm', 'qd', 'mb', 'rb', 'mp', 'cav']
+    assert [node.element_number for node in lattice.sequence] == [1, 1, 1, 1, 2, 1, 1, 1]
+    assert np.allclose([node.position for node in lattice.sequence], [1.0, 5.0, 7.0, 9.0, 13.0, 16.0, 17.2, 18.0])
+    assert lattice.beam.energy == 10.0
+
+
+def test_from_cpymad_elements(madx):
+    lattice = from_cpymad(madx, 'fodo')
+    assert type(lattice.elements['qf']) is Quadrupole
+    assert type(lattice.elements['mb']) is SectorBend
+    assert type(lattice.elements['rb']) is RectangularBend
+    assert type(lattice.elements['mp']) is ThinMultipole
+    assert type(lattice.elements['bpm']) is Marker
+    assert type(lattice.elements['cav']) is RFCavity
+    assert lattice.elements['mb'].e1 == 0.001
+    assert lattice.elements['cav'].voltage == 2.0
+    assert lattice.elements['qd'].aperture_data.aperture_size == [0.02, 0.01]
+
+
+def test_from_cpymad_deferred_expressions(madx):
+    lattice = from_cpymad(madx, 'fodo')
+    assert set(lattice.globals._v) == {'kqf', 'kqd', 'ang'}
+    assert np.isclose(lattice.elements['qd'].k1, -0.1)
+    lattice.globals['kqf'] = 0.2
+    assert np.isclose(lattice.elements['qf'].k1, 0.2)
+    assert np.isclose(lattice.elements['qd'].k1, -0.2)
+    assert np.isclose(lattice.elements['mp'].knl[1], 0.1)
+    lattice.globals['ang'] = 0.02
+    assert np.isclose(lattice.elements['mb'].angle, 0.02)
+
+
+def test_from_cpymad_predefined_constants_and_precision():
+    madx = Madx(stdout=False)
+    madx.input("""
+    ang := 2*pi/8;
+    q: quadrupole, l=1.2345678901234567, k1=0.1234567890123456;
+    b: sbend, l=2, angle:=ang;
+    ring: sequence, l=10;
+    q, at=1; b, at=5;
+    endsequence;
+    beam, particle=proton, energy=450;
+    """)
+    lattice = from_cpymad(madx, 'ring')
+    madx.quit()
+    assert set(lattice.globals._v) == {'ang', 'pi'}
+    assert lattice.elements['b'].angle == np.pi / 4
+    assert lattice.elements['q'].length == 1.2345678901234567
+    assert lattice.elements['q'].k1 == 0.1234567890123456
+    assert lattice.beam.energy == 450.0
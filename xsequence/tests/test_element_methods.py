@@ -38,4 +38,17 @@ def test_neq_method(el1, el2):
     assert el1 != el2
 
 
-
+@mark.parametrize('sbend',
+                 [SectorBend('b0', length=2.0, angle=0.3, e1=0.01, e2=0.011, k1=0.1),
+                  SectorBend('b1', length=2.0, angle=-0.3),
+                  SectorBend('b2', length=2.0, angle=0.0),
+                 ])
+def test_bend_conversion_round_trip(sbend):
+    rbend = sbend.convert_to_rbend()
+    assert type(rbend) is RectangularBend
+    assert abs(rbend._chord_length - get_chord_lengths([sbend.angle], [sbend.length])[0]) < 1e-12
+    assert abs(rbend.length - sbend.length) < 1e-12
+    sbend_again = rbend.convert_to_sbend()
+    assert type(sbend_again) is SectorBend
+    for key in ['length', 'angle', 'e1', 'e2', 'k1']:
+        assert abs(getattr(sbend_again, key) - getattr(sbend, key)) < 1e-12
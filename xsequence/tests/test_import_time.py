@@ -0,0 +1,50 @@
+"""
+Module tests.test_import_time
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to guard the import time of xsequence.
+"""
+
+import json
+import subprocess
+import sys
+import pytest
+
+IMPORT_TIME_BUDGET = 0.5
+HEAVY_MODULES = ['xdeps', 'scipy', 'at', 'pandas', 'xtrack', 'cpymad', 'lark']
+
+SCRIPT = """
+import json, sys, time
+start = time.perf_counter()
+import {module}
+duration = time.perf_counter() - start
+loaded = [name for name in {heavy} if name in sys.modules and 'Lazy' not in type(sys.modules[name]).__name__]
+print(json.dumps([duration, loaded]))
+"""
+
+
+def import_module_in_subprocess(module: str) -> "Tuple[float, list]":
+    script = SCRIPT.format(module=module, heavy=HEAVY_MODULES)
+    output = subprocess.run([sys.executable, '-c', script], capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def test_import_xsequence_within_budget():
+    duration, loaded = min((import_module_in_subprocess('xsequence') for _ in range(3)), key=lambda result: result[0])
+    assert loaded == []
+    assert duration < IMPORT_TIME_BUDGET
+
+
+@pytest.mark.parametrize('module', ['xsequence.lattice', 'xsequence.knobs', 'xsequence.helpers.pyat_functions',
+                                    'xsequence.helpers.xtrack_functions'])
+def test_heavy_dependencies_are_deferred(module):
+    _, loaded = import_module_in_subprocess(module)
+    assert loaded == []
+
+
+def test_lazy_submodules():
+    import xsequence
+    assert xsequence.lattice.Lattice.__name__ == 'Lattice'
+    assert 'slicing' in dir(xsequence)
+    with pytest.raises(AttributeError):
+        xsequence.unknown
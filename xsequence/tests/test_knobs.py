@@ -0,0 +1,64 @@
+"""
+Module tests.test_knobs
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the compiled evaluation of knobs.
+"""
+
+import numpy as np
+import pytest
+from xsequence.elements import Quadrupole, SectorBend, ThinMultipole
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node, NodesList
+
+
+@pytest.fixture
+def lattice():
+    elements = {'qf': Quadrupole('qf', length=1.0), 'qd': Quadrupole('qd', length=1.0),
+                'mb': SectorBend('mb', length=3.0, angle=0.1)}
+    sequence = NodesList([Node('qf', location=1.0), Node('mb', location=5.0), Node('qd', location=9.0)])
+    lattice = Lattice('fodo', elements, sequence, Beam(10.0, 'electron'),
+                      global_variables={'kf': 0.1, 'kd': -0.1, 'trim': 0.0, 'scale': 2.0})
+    lattice._globals['kd_total'] = lattice._globals['kd'] + lattice._globals['trim']
+    lattice._elements['qf'].k1 = lattice._globals['kf'] * lattice._globals['scale']
+    lattice._elements['qd'].k1 = lattice._globals['kd_total'] * lattice._elements['qf'].length
+    lattice._elements['mb'].k1 = lattice._math.sin(lattice._globals['trim'])
+    return lattice
+
+
+def test_knob_evaluation_matches_dependency_manager(lattice):
+    evaluator = lattice.compile_knobs(['kf', 'trim'])
+    settings = np.array([[0.1, 0.0], [0.2, 0.01], [-0.3, 0.5]])
+    result = evaluator.evaluate(settings)
+    assert result.shape == (3, 3)
+    for setting, values in zip(settings, result):
+        lattice.globals['kf'], lattice.globals['trim'] = setting
+        expected = [getattr(lattice.elements[name], attribute) for name, attribute in evaluator.targets]
+        assert np.allclose(values, expected)
+
+
+def test_knob_evaluation_grouped_by_class(lattice):
+    evaluator = lattice.compile_knobs(['kf'])
+    assert ('qf', 'k1') in evaluator.targets and ('mb', 'k1') not in evaluator.targets
+    grouped = lattice.compile_knobs(['kf', 'trim']).evaluate_by_class({'kf': np.linspace(0, 1, 5), 'trim': 0.0})
+    targets, values = grouped[Quadrupole]
+    assert sorted(targets) == [('qd', 'k1'), ('qf', 'k1')]
+    assert values.shape == (5, 2)
+    assert np.allclose(grouped[SectorBend][1], 0.0)
+    with pytest.raises(KeyError):
+        lattice.compile_knobs(['unknown'])
+
+
+def test_knob_evaluation_of_indexed_targets_and_functions():
+    elements = {'qf': Quadrupole('qf', length=1.0), 'mp': ThinMultipole('mp', knl=[0.0, 0.0], ksl=[0.0, 0.0])}
+    sequence = NodesList([Node('qf', location=1.0), Node('mp', location=3.0)])
+    lattice = Lattice('line', elements, sequence, Beam(10.0, 'electron'), global_variables={'k.1': 0.1})
+    lattice._elements['qf'].k1 = -lattice._math.sqrt(lattice._globals['k.1']) / 2
+    lattice._elements['mp'].knl[1] = abs(lattice._elements['qf'].k1) * lattice._elements['qf'].length
+    evaluator = lattice.compile_knobs(['k.1'])
+    assert evaluator.targets == [('qf', 'k1'), ('mp', 'knl', 1)]
+    values = np.array([0.04, 0.09, 0.25])
+    result = evaluator.evaluate(values)
+    assert np.allclose(result, [[-np.sqrt(value)/2, np.sqrt(value)/2] for value in values])
+    lattice.globals['k.1'] = 0.25
+    assert np.isclose(lattice.elements['mp'].knl[1], result[-1, 1])
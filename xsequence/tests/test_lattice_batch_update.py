@@ -0,0 +1,52 @@
+"""
+Module tests.test_lattice_batch_update
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test deferred dependency propagation in batch updates.
+"""
+
+import numpy as np
+import pytest
+from xsequence.elements import Quadrupole
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node, NodesList
+
+
+@pytest.fixture
+def lattice():
+    elements = {f'q{idx}': Quadrupole(f'q{idx}', length=1.0) for idx in range(10)}
+    sequence = NodesList([Node(f'q{idx}', location=2.0*idx + 1.0) for idx in range(10)])
+    lattice = Lattice('cell', elements, sequence, Beam(10.0, 'electron'), global_variables={'kf': 0.1, 'scale': 1.0})
+    lattice._globals['kf_total'] = lattice._globals['kf'] * lattice._globals['scale']
+    for idx in range(10):
+        lattice._elements[f'q{idx}'].k1 = lattice._globals['kf_total'] * (idx + 1)
+    return lattice
+
+
+def test_batch_update_defers_propagation(lattice):
+    with lattice.batch_update():
+        lattice.globals['kf'] = 0.2
+        lattice.globals['scale'] = 2.0
+        assert lattice.globals['kf'] == 0.2
+        assert np.isclose(lattice.elements['q0'].k1, 0.1)
+    assert np.isclose(lattice.globals['kf_total'], 0.4)
+    assert np.allclose([lattice.elements[f'q{idx}'].k1 for idx in range(10)], 0.4*np.arange(1, 11))
+
+
+def test_batch_update_runs_tasks_once(lattice):
+    runs = []
+    run_tasks = lattice.dep_mgr.run_tasks
+    lattice.dep_mgr.run_tasks = lambda tasks=None: runs.append(list(tasks)) or run_tasks(runs[-1])
+    with lattice.batch_update():
+        for value in np.linspace(0.1, 0.5, 20):
+            lattice.globals['kf'] = value
+        with lattice.batch_update():
+            lattice.globals['scale'] = 3.0
+            lattice._elements['q9'].k1 = lattice._globals['kf'] * 2
+        assert runs == []
+    assert len(runs) == 1
+    assert len(runs[0]) == len(set(task.taskid for task in runs[0]))
+    assert np.isclose(lattice.elements['q0'].k1, 1.5)
+    assert np.isclose(lattice.elements['q9'].k1, 1.0)
+    lattice.globals['kf'] = 0.1
+    assert np.isclose(lattice.elements['q9'].k1, 0.2)
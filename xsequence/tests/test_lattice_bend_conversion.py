@@ -0,0 +1,63 @@
+"""
+Module tests.test_lattice_bend_conversion
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the conversion of all bends of a lattice.
+"""
+
+import numpy as np
+import pytest
+import xsequence.elements as xe
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, NodesList
+
+
+@pytest.fixture
+def lattice():
+    elements = {f'mb{idx}': xe.SectorBend(f'mb{idx}', length=2.0 + 0.1*idx, angle=0.01*(idx + 1), e1=0.002)
+                for idx in range(50)}
+    elements['rb'] = xe.RectangularBend('rb', length=2.0, angle=0.02)
+    elements['qf'] = xe.Quadrupole('qf', length=1.0)
+    names = [f'mb{idx}' for idx in range(50)] + ['rb', 'qf']
+    lattice = Lattice('ring', elements, NodesList.from_arrays(names, np.arange(len(names))*10.0 + 5.0),
+                      Beam(1.0, 'electron'), global_variables={'ang': 0.01})
+    lattice._elements['mb0'].angle = lattice._globals['ang']
+    lattice._elements['qf'].k1 = lattice._elements['mb0'].angle * 10
+    return lattice
+
+
+def test_convert_sbend_to_rbend(lattice):
+    expected = {name: element.convert_to_rbend() for name, element in lattice.elements._v.items()
+                if type(element) is xe.SectorBend}
+    lattice.convert_sbend_to_rbend()
+    for name, rbend in expected.items():
+        element = lattice.elements[name]
+        assert type(element) is xe.RectangularBend
+        assert np.isclose(element._chord_length, rbend._chord_length, rtol=1e-14)
+        assert element.e1 == rbend.e1 and element._rbend_e1 == rbend._rbend_e1
+    assert [node.length for node in lattice.sequence] == [lattice.elements[node.element_name].length for node in lattice.sequence]
+
+
+def test_bend_conversion_keeps_expressions(lattice):
+    lattice.convert_sbend_to_rbend()
+    rbend = lattice.elements._v['mb0']
+    geometry = (rbend._chord_length, rbend.length, rbend.e1)
+    lattice.globals['ang'] = 0.03
+    assert np.isclose(lattice.elements['mb0'].angle, 0.03)
+    # Only the driven attributes change, the rectangular bend geometry is not recomputed
+    assert (rbend._chord_length, rbend.length, rbend.e1) == geometry
+    assert np.isclose(lattice.elements['qf'].k1, 0.3)
+    lattice.convert_rbend_to_sbend()
+    assert all(type(lattice.elements[node.element_name]) is xe.SectorBend for node in lattice.sequence[:-1])
+    lattice.globals['ang'] = 0.04
+    assert np.isclose(lattice.elements['mb0'].angle, 0.04)
+    assert np.isclose(lattice.elements['qf'].k1, 0.4)
+
+
+def test_bend_conversion_rebuilds_line(lattice):
+    lattice._line
+    lattice.convert_sbend_to_rbend()
+    assert type(lattice._line_elements['mb1']) is xe.RectangularBend
+    lattice.convert_rbend_to_sbend()
+    assert type(lattice._line_elements['mb1']) is xe.SectorBend
+    assert all(node.length == lattice._line_elements[node.element_name].length for node in lattice._line)
@@ -0,0 +1,32 @@
+"""
+Module tests.test_lattice_lazy
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test lazy construction of lattices.
+"""
+
+import numpy as np
+import pytest
+from xsequence.tests.lattices import make_lattice
+
+
+def test_lazy_lattice_builds_on_first_access():
+    lattice = make_lattice(lazy=True)
+    assert 'dep_mgr' not in lattice.__dict__ and 'sequence' not in lattice.__dict__
+    assert lattice.elements['qf'].k1 == 0.1
+    assert 'dep_mgr' in lattice.__dict__ and 'sequence' not in lattice.__dict__
+    assert lattice._data_sequence[0].length == 0.0
+    assert [node.element_number for node in lattice.sequence] == [node.element_number for node in make_lattice(False).sequence]
+    assert lattice.sequence[0].length == 1.0
+    assert '_line' not in lattice.__dict__
+    assert len(lattice._line) == 19
+
+
+@pytest.mark.parametrize('order_nodes', [False, True])
+def test_lazy_lattice_matches_eager(order_nodes):
+    lazy, eager = make_lattice(True, order_nodes), make_lattice(False, order_nodes)
+    lazy._elements['qf'].k1 = lazy._globals['kf'] * 2
+    lazy.globals['kf'] = 0.3
+    assert np.isclose(lazy.elements['qf'].k1, 0.6)
+    assert [node.position for node in lazy.sequence] == [node.position for node in eager.sequence]
+    assert lazy.get_total_length() == eager.get_total_length()
@@ -0,0 +1,51 @@
+"""
+Module tests.test_lattice_splicing
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test bulk insertion, removal and replacement of nodes.
+"""
+
+import numpy as np
+import pytest
+from xsequence.elements import Marker, Quadrupole
+from xsequence.tests.lattices import make_lattice
+from xsequence.validation import NegativeDriftError
+
+
+def test_insert_and_remove_elements():
+    lattice = make_lattice(lazy=False)
+    monitors = [Marker(f'bpm{idx}') for idx in range(1000)]
+    locations = (4.0*(np.arange(1000) % 5) + 2.0 + 0.005*(np.arange(1000) // 5))[::-1]
+    indices = lattice.insert_elements(monitors[:500] + ['m1']*500, locations)
+    assert len(lattice.sequence._v) == 1010
+    positions = [node.position for node in lattice.sequence._v]
+    assert np.all(np.diff(positions) >= 0)
+    assert [lattice.sequence._v[idx].position for idx in indices] == sorted(locations)
+    assert lattice.occurrences.count('m1') == 505
+    assert [node.element_number for node in lattice.occurrences['m1']] == list(range(1, 506))
+    assert lattice.elements['bpm0'] is monitors[0] and 'bpm999' not in lattice.elements._v
+    assert lattice.get_node_indices('m1') == [idx for idx, node in enumerate(lattice.sequence._v)
+                                              if node.element_name == 'm1']
+
+    removed = lattice.remove_elements(['m1'] + [f'bpm{idx}' for idx in range(500)])
+    assert len(removed) == 1005 and 'm1' not in lattice.occurrences
+    assert [node.element_name for node in lattice.sequence._v] == ['qf']*5
+    assert [node.element_number for node in lattice.sequence._v] == [1, 2, 3, 4, 5]
+
+
+def test_replace_nodes_and_negative_drift():
+    lattice = make_lattice(lazy=False)
+    lattice.replace_nodes([1, 5], [Quadrupole('qd', length=0.5, k1=-0.1), 'qd'])
+    assert [node.element_name for node in lattice.sequence._v][:6] == ['qf', 'qd', 'qf', 'm1', 'qf', 'qd']
+    assert lattice.sequence[5].position == 11.0 and lattice.sequence[5].element_number == 2
+    assert lattice.get_node_indices('m1') == [3, 7, 9]
+
+    names = [node.element_name for node in lattice.sequence._v]
+    with pytest.raises(NegativeDriftError, match='Negative drift'):
+        lattice.insert_elements(['qf'], [1.5])
+    assert [node.element_name for node in lattice.sequence._v] == names
+    assert lattice.occurrences.count('qf') == 5
+    with pytest.raises(NegativeDriftError, match='Negative drift'):
+        lattice.replace_nodes([3], [Quadrupole('qx', length=4.0)])
+    assert 'qx' not in lattice.elements._v and 'qx' not in lattice.occurrences
+    assert [node.element_name for node in lattice.sequence._v] == names
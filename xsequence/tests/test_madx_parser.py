@@ -0,0 +1,134 @@
+"""
+Module tests.test_madx_parser
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the MAD-X sequence file parser.
+"""
+
+import os
+import numpy as np
+import pytest
+from cpymad.madx import Madx
+from xsequence.elements import Quadrupole, SectorBend
+from xsequence.helpers import madx_parser
+from xsequence.helpers.cpymad_functions import from_cpymad
+from xsequence.tests.lattices import MADX_SEQUENCE
+
+
+MADX_FILE = """
+/* Cell with inherited elements,
+   refer=entry and from anchors */
+real const lq = 1.0;  ! quadrupole length
+kqf := 0.1*scale; scale = 1;
+mq: quadrupole, l=lq;
+qf: mq, k1:=kqf;
+qd: mq, k1:=-kqf;
+cell: sequence, l=10, refer=entry;
+qf, at=0;
+mb: sbend, l=2*lq, angle:=qf->l*0.01, at=2;
+qd, at=2, from=mb;
+endsequence;
+call, file="strengths.madx";
+"""
+
+
+def test_parser_matches_cpymad():
+    madx = Madx(stdout=False)
+    madx.input(MADX_SEQUENCE)
+    madx.use('fodo')
+    expected = from_cpymad(madx, 'fodo')
+    madx.quit()
+    result = madx_parser.parse_madx_string(MADX_SEQUENCE)
+    lattice = result.to_lattice('fodo')
+    assert result.skipped == []
+    assert [node.element_name for node in lattice.sequence] == [node.element_name for node in expected.sequence]
+    assert np.allclose([node.position for node in lattice.sequence], [node.position for node in expected.sequence])
+    for name, element in expected.elements._v.items():
+        assert type(lattice.elements[name]) is type(element)
+    assert set(lattice.globals._v) == set(expected.globals._v)
+    lattice.globals['kqf'] = 0.2
+    assert np.isclose(lattice.elements['qd'].k1, -0.2)
+    assert np.isclose(lattice.elements['mp'].knl[1], 0.1)
+
+
+def test_parser_file_anchors_and_call(tmp_path):
+    with open(tmp_path / 'cell.madx', 'w') as f:
+        f.write(MADX_FILE)
+    with open(tmp_path / 'strengths.madx', 'w') as f:
+        f.write('scale = 2;\n')
+    lattice = madx_parser.from_madx_file(str(tmp_path / 'cell.madx'), 'cell')
+    assert [node.element_name for node in lattice.sequence] == ['qf', 'mb', 'qd']
+    assert np.allclose([node.start for node in lattice.sequence], [0.0, 2.0, 4.0])
+    assert type(lattice.elements['qf']) is Quadrupole and type(lattice.elements['mb']) is SectorBend
+    assert np.isclose(lattice.elements['qd'].k1, -0.2)
+    assert np.isclose(lattice.elements['mb'].angle, 0.01)
+    lattice.globals['scale'] = 3
+    assert np.isclose(lattice.elements['qf'].k1, 0.3)
+
+
+def test_parser_cache_and_parallel(tmp_path):
+    paths = []
+    for idx in range(2):
+        paths.append(str(tmp_path / f'fodo_{idx}.madx'))
+        with open(paths[-1], 'w') as f:
+            f.write(MADX_SEQUENCE + f'kqf = {idx + 1};\n')
+    results = madx_parser.parse_madx_files(paths, max_workers=2, cache_dir=str(tmp_path / 'cache'))
+    assert [result.variables['kqf'] for result in results] == [1, 2]
+    assert len(os.listdir(tmp_path / 'cache')) == 2
+    madx_parser._RESULT_CACHE.clear()
+    cached = madx_parser.parse_madx_file(paths[1], cache_dir=str(tmp_path / 'cache'))
+    assert np.isclose(cached.to_lattice('fodo').elements['qd'].k1, -2.0)
+    with open(paths[1], 'a') as f:
+        f.write('kqf = 5;\n')
+    assert madx_parser.parse_madx_file(paths[1], cache_dir=str(tmp_path / 'cache')).variables['kqf'] == 5
+
+
+def test_parser_chained_anchors_and_cache_size(tmp_path, monkeypatch):
+    result = madx_parser.parse_madx_string('qf: quadrupole, l=2; m: marker;\n'
+                                           'line: sequence, l=10;\nqf, at=1;\nm1: m, at=2, from=qf;\n'
+                                           'm2: m, at=1, from=m1;\nendsequence;\n')
+    lattice = result.to_lattice('line')
+    assert np.allclose([node.position for node in lattice.sequence], [1.0, 3.0, 4.0])
+
+    monkeypatch.setattr(madx_parser, '_RESULT_CACHE_SIZE', 2)
+    madx_parser._RESULT_CACHE.clear()
+    for idx in range(3):
+        with open(tmp_path / f'fodo_{idx}.madx', 'w') as f:
+            f.write(MADX_SEQUENCE + f'kqf = {idx + 1};\n')
+        madx_parser.parse_madx_file(str(tmp_path / f'fodo_{idx}.madx'))
+    assert len(madx_parser._RESULT_CACHE) == 2
+    assert madx_parser._cache_key(str(tmp_path / 'fodo_0.madx')) not in madx_parser._RESULT_CACHE
+    cached = madx_parser.parse_madx_file(str(tmp_path / 'fodo_2.madx'))
+    cached.variables['kqf'] = 10
+    assert madx_parser.parse_madx_file(str(tmp_path / 'fodo_2.madx')).variables['kqf'] == 3
+
+
+def test_parser_cache_same_file_in_other_directory(tmp_path):
+    for directory, kq in [('a', 0.1), ('b', 0.5)]:
+        (tmp_path / directory).mkdir()
+        with open(tmp_path / directory / 'main.madx', 'w') as f:
+            f.write('call, file="opt.madx";\n')
+        with open(tmp_path / directory / 'opt.madx', 'w') as f:
+            f.write(f'kq = {kq};\n')
+    cache_dir = str(tmp_path / 'cache')
+    for directory, kq in [('a', 0.1), ('b', 0.5)]:
+        assert madx_parser.parse_madx_file(str(tmp_path / directory / 'main.madx')).variables['kq'] == kq
+    madx_parser._RESULT_CACHE.clear()
+    for directory, kq in [('a', 0.1), ('b', 0.5), ('a', 0.1), ('b', 0.5)]:
+        result = madx_parser.parse_madx_file(str(tmp_path / directory / 'main.madx'), cache_dir=cache_dir)
+        assert result.variables['kq'] == kq
+    madx_parser._RESULT_CACHE.clear()
+    assert madx_parser.parse_madx_file(str(tmp_path / 'b' / 'main.madx'), cache_dir=cache_dir).variables['kq'] == 0.5
+
+
+def test_parser_definitions_with_constant_deferred_values():
+    result = madx_parser.parse_madx_string("""
+    kq = 0.1;
+    q: quadrupole, l:= 1, k1:=kq * 2, aperture:={ 0.02, 0.01}, apertype="ellipse";
+    b: sbend, l:= 2, angle:=atan2(kq, 2), e1:= -0.001;
+    """)
+    assert result.skipped == []
+    assert result.elements['q'].values == {'l': 1.0, 'aperture': [0.02, 0.01], 'apertype': 'ellipse'}
+    assert result.elements['q'].expressions == {'k1': ('kq * 2', "(v['kq'] * 2)")}
+    assert result.elements['b'].values == {'l': 2.0, 'e1': -0.001}
+    assert np.isclose(result.get_element_value('b', 'angle'), np.arctan2(0.1, 2))
@@ -0,0 +1,48 @@
+"""
+Module tests.test_occurrence_index
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the incremental index of element occurrences.
+"""
+
+import pytest
+from xsequence.lattice_baseclasses import Node
+from xsequence.validation import NegativeDriftError
+from xsequence.tests.lattices import make_lattice
+
+
+def test_occurrence_index_queries():
+    lattice = make_lattice(lazy=False, order_nodes=True)
+    assert lattice.occurrences.count('qf') == 5 and 'm1' in lattice.occurrences
+    assert [node.element_number for node in lattice.occurrences['qf']] == [1, 2, 3, 4, 5]
+    assert lattice.get_node_indices('m1') == [1, 3, 5, 7, 9]
+
+
+def test_occurrence_index_incremental_update():
+    lattice = make_lattice(lazy=False)
+    removed = lattice.sequence._v.pop(2)
+    new_node = Node('m1', location=6.0, length=0.0)
+    lattice.sequence._v.insert(2, new_node)
+    lattice.update_sequence(inserted=[2], removed=[removed])
+    assert lattice.occurrences.count('qf') == 4
+    assert [node.element_number for node in lattice.occurrences['qf']] == [1, 2, 3, 4]
+    assert new_node.element_number == 2 and lattice.sequence[3].element_number == 3
+    numbers = [node.element_number for node in lattice.sequence._v]
+    lattice.update_sequence()
+    assert [node.element_number for node in lattice.sequence._v] == numbers
+    assert lattice.get_node_indices('m1') == [1, 2, 3, 5, 7, 9]
+
+    lattice.sequence._v.insert(1, Node('qf', location=1.5, length=1.0))
+    with pytest.raises(NegativeDriftError, match='Negative drift'):
+        lattice.update_sequence(inserted=[1])
+
+
+def test_occurrence_index_equal_positions():
+    lattice = make_lattice(lazy=False)
+    lattice.insert_elements(['m1']*3, [3.0]*3)
+    first = lattice.occurrences['m1'][0]
+    assert [node.element_number for node in lattice.occurrences['m1']] == [1, 2, 3, 4, 5, 6, 7, 8]
+    lattice.remove_nodes(lattice.get_node_indices('m1')[1:3])
+    assert lattice.occurrences['m1'][0] is first
+    assert [node.element_number for node in lattice.sequence._v if node.element_name == 'm1'] == [1, 2, 3, 4, 5, 6]
+    assert lattice.get_node_indices('m1') == [1, 2, 4, 6, 8, 10]
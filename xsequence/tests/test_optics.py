@@ -0,0 +1,89 @@
+"""
+Module tests.test_optics
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the vectorized thin-lens linear optics.
+"""
+
+import numpy as np
+import pytest
+from xsequence.elements import Marker, ThinMultipole
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node, NodesList
+from xsequence.optics import cumulative_matrix_product
+from xsequence.tests.lattices import make_fodo_lattice
+
+
+def thin_fodo(half_cell: float = 5.0, focal_length: float = 4.0, num_cells: int = 10) -> Lattice:
+    elements = {'qf': ThinMultipole('qf', knl=[0.0, 1/focal_length]),
+                'qd': ThinMultipole('qd', knl=[0.0, -1/focal_length]), 'm': Marker('m')}
+    sequence = NodesList()
+    for idx in range(num_cells):
+        sequence += [Node('qf', location=2*half_cell*idx), Node('m', location=2*half_cell*idx + half_cell/2),
+                     Node('qd', location=2*half_cell*idx + half_cell)]
+    sequence.append(Node('m', location=2*half_cell*num_cells))
+    return Lattice('fodo', elements, sequence, Beam(10.0, 'electron'), global_variables={})
+
+
+def test_cumulative_matrix_product():
+    matrices = np.random.default_rng(0).normal(size=(2, 13, 6, 6))
+    expected = [matrices[:, 0]]
+    for idx in range(1, 13):
+        expected.append(matrices[:, idx] @ expected[-1])
+    for block_size in [None, 1, 4, 16]:
+        assert np.allclose(cumulative_matrix_product(matrices, block_size), np.stack(expected, axis=1))
+        assert np.allclose(cumulative_matrix_product(matrices[0], block_size), np.stack(expected, axis=1)[0])
+
+
+def test_thin_fodo_analytic():
+    half_cell, focal_length, num_cells = 5.0, 4.0, 10
+    optics = thin_fodo(half_cell, focal_length, num_cells).linear_optics()
+    mu = 2*np.arcsin(half_cell/(2*focal_length))
+    beta_max = 2*half_cell*(1 + np.sin(mu/2))/np.sin(mu)
+    beta_min = 2*half_cell*(1 - np.sin(mu/2))/np.sin(mu)
+    assert np.isclose(optics.qx, np.mod(num_cells*mu/(2*np.pi), 1.0))
+    assert np.isclose(optics.qy, optics.qx)
+    assert np.isclose(optics['mux'][-1], num_cells*mu/(2*np.pi))
+    assert np.isclose(optics['betx'][0], beta_max)
+    assert np.isclose(optics['bety'][0], beta_min)
+    assert np.allclose(optics['betx'][2::3], beta_min) and np.allclose(optics['bety'][2::3], beta_max)
+    assert np.allclose(optics['dx'], 0.0)
+    assert set(optics.to_dict()) >= {'name', 's', 'betx', 'mux', 'dx'}
+
+
+def test_optics_against_pyat():
+    at = pytest.importorskip('at')
+    from xsequence.helpers.pyat_functions import lattice_to_pyat
+    lattice = make_fodo_lattice(140)
+    ring = lattice_to_pyat(lattice)
+    ring.disable_6d()
+    at_initial, ring_data, _ = at.get_optics(ring)
+    for element in lattice.elements._v.values():
+        if element.length > 0:
+            element.num_slices = 20
+    optics = lattice.linear_optics()
+    assert np.allclose([optics.qx, optics.qy], ring_data.tune, atol=1e-3)
+    initial = optics.twiss['initial']
+    assert np.allclose([initial['betx'], initial['bety']], at_initial.beta, rtol=1e-3)
+    assert np.allclose(initial['dispersion'][:2], at_initial.dispersion[:2], rtol=1e-3, atol=1e-6)
+
+
+def test_optics_scan_matches_serial():
+    lattice = make_fodo_lattice(70)
+    lattice.globals['kf'] = 0.2
+    lattice._elements['qf'].k1 = lattice._globals['kf']
+    optics = lattice.linear_optics()
+    values = np.array([[0.15, -0.15], [0.2, -0.2], [0.22, -0.22]])
+    observe = np.arange(0, len(optics.s), 5)
+    result = optics.scan([('qf', 'k1'), ('qd', 'k1')], values, chunk_size=2, observe=observe)
+    assert result['betx'].shape == (3, len(observe)) and result['qx'].shape == (3,)
+    for idx, (k1f, k1d) in enumerate(values):
+        lattice.elements['qf'].k1, lattice.elements['qd'].k1 = k1f, k1d
+        serial = lattice.linear_optics()
+        assert np.isclose(result['qx'][idx], serial.qx) and np.isclose(result['qy'][idx], serial.qy)
+        for key in ['betx', 'muy', 'dx']:
+            assert np.allclose(result[key][idx], serial[key][observe])
+
+    lattice.elements['qd'].k1 = -0.2
+    knobs = optics.scan_knobs(['kf'], values[:, :1])
+    assert np.allclose(knobs['qx'], optics.scan([('qf', 'k1')], values[:, :1])['qx'])
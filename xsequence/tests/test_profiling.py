@@ -0,0 +1,50 @@
+"""
+Module tests.test_profiling
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the opt-in profiling of xsequence operations.
+"""
+
+from xsequence import profiling
+from xsequence.tests.lattices import make_lattice
+
+
+def test_profile_records_operations_and_callbacks():
+    calls = []
+    with profiling.profile(callback=lambda name, duration, allocated: calls.append(name)) as stats:
+        lattice = make_lattice(lazy=False)
+        lattice.globals['kf'] = 0.2
+        lattice.slice_lattice()
+        lattice._get_line()
+    assert stats['Lattice.__init__'].calls == 1 and stats['Lattice.slice_lattice'].calls == 1
+    assert stats['slice_nodes'].calls == 1 and 'get_slice_positions' not in stats
+    assert stats['LatticeManager.run_tasks'].calls >= 1 and 'LatticeManager.set_value' not in stats
+    assert 'Lattice._get_line' in stats
+    assert stats['Lattice.__init__'].total_time >= stats['Lattice._init_sequence'].total_time > 0
+    assert calls.count('Lattice.__init__') == 1
+    assert not profiling.is_enabled()
+
+    make_lattice(lazy=False).slice_lattice()
+    assert stats['Lattice.slice_lattice'].calls == 1 and len(calls) == sum(s.calls for s in stats.values())
+
+
+def test_nested_profile_keeps_enclosing_stats():
+    with profiling.profile() as outer:
+        make_lattice(lazy=False)
+        with profiling.profile() as inner:
+            make_lattice(lazy=False).slice_lattice()
+        assert profiling.get_stats() is outer and profiling.is_enabled()
+        make_lattice(lazy=False)
+    assert inner['Lattice.__init__'].calls == 1 and inner['Lattice.slice_lattice'].calls == 1
+    assert outer['Lattice.__init__'].calls == 3 and outer['Lattice.slice_lattice'].calls == 1
+    assert profiling.get_stats() is None and not profiling.is_enabled()
+
+
+def test_profile_memory_and_report(capsys):
+    with profiling.profile(track_memory=True) as stats:
+        make_lattice(lazy=False).slice_lattice()
+    assert stats['Lattice.slice_lattice'].allocated_bytes > 0
+    assert stats.to_dict()['Lattice.slice_lattice']['calls'] == 1
+    assert stats.report().splitlines()[0].startswith('function')
+    stats.print_report()
+    assert 'Lattice.slice_lattice' in capsys.readouterr().out
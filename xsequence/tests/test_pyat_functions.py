@@ -0,0 +1,136 @@
+"""
+Module tests.test_pyat_functions
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the pyat helper functions.
+"""
+
+import at
+import numpy as np
+import pytest
+from xsequence.elements import Drift, Marker, Quadrupole, RFCavity
+from xsequence.elements_dataclasses import PyatData
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node, NodesList
+from xsequence.helpers import pyat_functions as pf
+from xsequence.validation import NegativeDriftError
+
+
+@pytest.fixture
+def fodo_ring():
+    cells = []
+    for _ in range(4):
+        cells += [at.Drift('d1', 1.0), at.Quadrupole('qf', 0.5, 1.2),
+                  at.Drift('d2', 2.0), at.Quadrupole('qd', 0.5, -1.2),
+                  at.Drift('d1', 1.0), at.Marker('m1')]
+    return at.Lattice(cells, energy=1e9)
+
+
+def test_optics_df_matches_lindata(fodo_ring):
+    refpts = range(len(fodo_ring))
+    _, _, _, lin = at.linopt(fodo_ring, refpts=refpts, get_chrom=True)
+    df = pf.pyat_optics_to_pandas_df(fodo_ring, lin)
+    assert list(df['name']) == [fodo_ring[i].FamName for i in refpts]
+    assert list(df['keyword']) == [fodo_ring[i].__class__.__name__.lower() for i in refpts]
+    assert np.array_equal(df['betx'].values, lin['beta'][:, 0])
+    assert np.array_equal(df['py'].values, lin['closed_orbit'][:, 3])
+    assert list(df.columns[2:]) == [column for column, _, _ in pf.OPTICS_COLUMNS]
+    assert df['name'].dtype == object and df['keyword'].dtype == object
+    df.loc[0, 'name'] = 'start'
+    assert df['name'][0] == 'start'
+
+
+def test_optics_record_array_with_precomputed_categories(fodo_ring):
+    refpts = np.array([1, 3, 5])
+    categories = pf.RingCategories(fodo_ring)
+    _, _, lin = at.linopt6(fodo_ring, refpts=refpts)
+    table = pf.pyat_optics_to_record_array(fodo_ring, lin, refpts=refpts, categories=categories)
+    assert list(table.name) == ['qf', 'qd', 'm1']
+    assert list(table.keyword) == ['quadrupole', 'quadrupole', 'marker']
+    assert np.array_equal(table.s, lin['s_pos'])
+    df = pf.pyat_optics_to_pandas_df(fodo_ring, lin, refpts=refpts, categorical=True)
+    assert list(df['name']) == ['qf', 'qd', 'm1'] and list(df['name'].cat.categories) == ['m1', 'qd', 'qf']
+
+
+def test_optics_without_idx_requires_refpts(fodo_ring):
+    _, _, lin = at.linopt6(fodo_ring, refpts=[1, 3])
+    with pytest.raises(ValueError):
+        pf.pyat_optics_to_pandas_df(fodo_ring, lin)
+
+
+def test_refpt_index_matches_get_refpts(fodo_ring):
+    index = pf.RefptIndex(fodo_ring)
+    assert np.array_equal(index.get_refpts([at.Quadrupole]), at.get_refpts(fodo_ring, at.Quadrupole))
+    assert np.array_equal(index.get_refpts([at.Quadrupole, at.Marker]),
+                          np.sort(np.concatenate([at.get_refpts(fodo_ring, at.Quadrupole), at.get_refpts(fodo_ring, at.Marker)])))
+    assert np.array_equal(index.get_s_pos(index.get_refpts([at.Marker])), fodo_ring.get_s_pos(at.get_refpts(fodo_ring, at.Marker)))
+    with pytest.raises(ValueError):
+        index.get_refpts([at.Marker])[0] = 0
+
+
+def test_refpt_index_xsequence_types_and_patterns(fodo_ring):
+    index = pf.RefptIndex(fodo_ring)
+    assert np.array_equal(index.get_refpts([Quadrupole]), index.get_refpts([at.Quadrupole]))
+    assert np.array_equal(index.get_refpts(pattern='qf'), at.get_refpts(fodo_ring, 'qf'))
+    assert np.array_equal(index.get_refpts([Quadrupole], pattern='q*'), index.get_refpts([at.Quadrupole]))
+    assert len(index.get_refpts([Drift], pattern='d2')) == 4
+
+
+def test_get_optics_pyat_with_refpt_index(fodo_ring):
+    index = pf.RefptIndex(fodo_ring)
+    lin, spos = pf.get_optics_pyat(fodo_ring, refpt_index=index, element_types=[Quadrupole])
+    assert np.array_equal(lin['idx'], index.get_refpts([Quadrupole]))
+    assert np.array_equal(spos, lin['s_pos'])
+    default_lin, default_spos = pf.get_optics_pyat(fodo_ring, element_types=[Quadrupole])
+    assert np.array_equal(default_lin['idx'], lin['idx']) and np.array_equal(default_spos, spos)
+    assert np.array_equal(pf.get_indices(fodo_ring, [at.Quadrupole, at.Marker]),
+                          index.get_refpts([at.Quadrupole, at.Marker]))
+    lin, spos = pf.get_optics_pyat(fodo_ring, refpts=[1, 3])
+    assert np.array_equal(spos, fodo_ring.get_s_pos([1, 3]))
+
+
+def test_lattice_to_pyat():
+    elements = {'qf': Quadrupole('qf', length=0.5, k1=1.2),
+                'qd': Quadrupole('qd', length=0.5, k1=-1.2, pyat_data=PyatData(PassMethod='QuadLinearPass')),
+                'm1': Marker('m1')}
+    sequence = NodesList()
+    for idx in range(4):
+        sequence += [Node('qf', location=1.25 + 5*idx), Node('qd', location=3.75 + 5*idx), Node('m1', location=5.0 + 5*idx)]
+    lattice = Lattice('fodo', elements, sequence, Beam(1.0, 'relativistic'))
+    ring = pf.lattice_to_pyat(lattice)
+    assert [el.FamName for el in ring[:6]] == ['qf', 'drift_0', 'qd', 'drift_1', 'm1', 'drift_2']
+    assert np.isclose(ring.get_s_pos(len(ring))[0], 19.0)
+    assert ring[0].PolynomB[1] == 1.2 and ring[0] is not ring[6]
+    assert ring[2].PassMethod == 'QuadLinearPass'
+    assert np.isclose(ring.energy, 1e9)
+    assert len(at.get_refpts(ring, at.Quadrupole)) == 8
+    assert not ring.radiation
+
+
+def test_lattice_to_pyat_occurrences_are_independent():
+    elements = {'qf': Quadrupole('qf', length=0.5, k1=1.2), 'm1': Marker('m1')}
+    sequence = NodesList()
+    for idx in range(4):
+        sequence += [Node('qf', location=1.25 + 5*idx), Node('m1', location=5.0 + 5*idx)]
+    ring = pf.lattice_to_pyat(Lattice('fodo', elements, sequence, Beam(1.0, 'relativistic')))
+    refpts = at.get_refpts(ring, 'qf')
+    at.set_value_refpts(ring, refpts[:1], 'PolynomB', 5.0, index=1)
+    ring[refpts[1]].PolynomB[1] += 0.1
+    assert [ring[idx].PolynomB[1] for idx in refpts] == [5.0, 1.3, 1.2, 1.2]
+    assert [ring[idx].PolynomA[1] for idx in refpts] == [0.0]*4
+
+
+def test_lattice_to_pyat_matches_line():
+    elements = {'qf': Quadrupole('qf', length=0.5, k1=1.2), 'm1': Marker('m1'),
+                'cav': RFCavity('cav', length=0.5, voltage=1.0, frequency=400.0, lag=0.0)}
+    sequence = NodesList([Node('m1', location=0.0), Node('qf', location=1.25), Node('cav', location=3.0),
+                          Node('qf', location=3.25, reference=2.0), Node('m1', location=6.0, pos_anchor='end')])
+    lattice = Lattice('line', elements, sequence, Beam(1.0, 'relativistic'))
+    ring = pf.lattice_to_pyat(lattice)
+    line, _ = lattice._get_line()
+    assert [element.FamName for element in ring] == [node.element_name for node in line]
+    assert [element.Length for element in ring] == [node.length for node in line]
+    assert ring.harmonic_number == lattice.elements['cav'].harmonic_number
+    lattice.sequence[3].location = 0.5
+    with pytest.raises(NegativeDriftError):
+        pf.lattice_to_pyat(lattice)
@@ -0,0 +1,71 @@
+"""
+Module tests.test_pyat_runner
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the asyncio runner of pyat optics.
+"""
+
+import asyncio
+import threading
+import concurrent.futures
+import at
+import numpy as np
+import pytest
+from xsequence.helpers import pyat_functions as pf
+from xsequence.helpers.pyat_runner import PyatOpticsRunner
+
+
+def fodo_ring(k1: float = 1.2):
+    cells = []
+    for _ in range(4):
+        cells += [at.Drift('d1', 1.0), at.Quadrupole('qf', 0.5, k1),
+                  at.Drift('d2', 2.0), at.Quadrupole('qd', 0.5, -k1),
+                  at.Drift('d1', 1.0), at.Marker('m1')]
+    return at.Lattice(cells, energy=1e9)
+
+
+def test_runner_deduplicates_requests_in_process_pool():
+    async def run():
+        async with PyatOpticsRunner(max_workers=2) as runner:
+            futures = [runner.submit(fodo_ring()), runner.submit(fodo_ring()), runner.submit(fodo_ring(1.0))]
+            assert runner.num_in_flight == 0
+            await asyncio.sleep(0)
+            assert runner.num_in_flight == 2
+            tables = await asyncio.gather(*futures)
+        return tables
+
+    tables = asyncio.run(run())
+    ring = fodo_ring()
+    expected = pf.pyat_optics_to_pandas_df(ring, pf.calc_optics_pyat(ring), refpts=range(len(ring)))
+    assert np.allclose(tables[0]['betx'], expected['betx']) and tables[0].equals(tables[1])
+    assert not np.allclose(tables[2]['betx'], expected['betx'])
+
+
+def test_runner_timeout_and_cancellation():
+    release = threading.Event()
+
+    async def run():
+        executor = concurrent.futures.ThreadPoolExecutor(max_workers=1)
+        runner = PyatOpticsRunner(executor=executor, table='recarray')
+        blocker = asyncio.get_running_loop().run_in_executor(executor, release.wait)
+        try:
+            with pytest.raises(asyncio.TimeoutError):
+                await runner.calc_optics(fodo_ring(), timeout=0.05)
+            await asyncio.sleep(0)
+            assert runner.num_in_flight == 0
+
+            first, second = runner.submit(fodo_ring()), runner.submit(fodo_ring())
+            await asyncio.sleep(0)
+            first.cancel()
+            await asyncio.sleep(0)
+            assert runner.num_in_flight == 1
+        finally:
+            release.set()
+        table = await second
+        await blocker
+        runner.close()
+        executor.shutdown()
+        return table
+
+    table = asyncio.run(run())
+    assert isinstance(table, np.recarray) and len(table) == len(fodo_ring())
@@ -0,0 +1,95 @@
+"""
+Module tests.test_slicing_nodes
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test serial, parallel and streaming slicing of node sequences.
+"""
+
+import numpy as np
+import pytest
+import xsequence.elements as xe
+from xsequence import slicing
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node, NodesList
+from xsequence.tests.lattices import make_lattices
+from xsequence.validation import NegativeDriftError
+
+
+def make_lattice():
+    return make_lattices()[1]
+
+
+def test_slice_nodes_matches_per_node_slicing():
+    lattice = make_lattice()
+    for element in lattice.elements._v.values():
+        if element.length > 0:
+            element.num_slices = 3
+    thin_sequence, thin_elements = slicing.slice_nodes(lattice.sequence._v, lattice.elements._v)
+    expected = [pair for node in lattice.sequence._v
+                for pair in slicing.get_thin_nodes(node, lattice.elements._v[node.element_name])]
+    assert [node.element_name for node in thin_sequence] == [node.element_name for node, _ in expected]
+    assert [node.position for node in thin_sequence] == [node.position for node, _ in expected]
+    assert list(thin_elements) == list(dict.fromkeys(node.element_name for node, _ in expected))
+    assert all(thin_elements[node.element_name].__dict__.keys() == element.__dict__.keys() for node, element in expected)
+    assert thin_elements['mb_sliced_entrance'].side == 'entrance' and thin_elements['mb_sliced_exit'].side == 'exit'
+
+
+@pytest.mark.parametrize('use_threads', [False, True])
+def test_parallel_slicing_matches_serial(use_threads):
+    lattice = make_lattice()
+    for element in lattice.elements._v.values():
+        if element.length > 0:
+            element.num_slices = 3
+    serial = slicing.slice_nodes(lattice.sequence._v, lattice.elements._v)
+    parallel = slicing.slice_nodes_parallel(lattice.sequence._v, lattice.elements._v, num_workers=3,
+                                            use_threads=use_threads)
+    assert [node.element_name for node in parallel[0]] == [node.element_name for node in serial[0]]
+    assert [(node.location, node.reference) for node in parallel[0]] == \
+           [(node.location, node.reference) for node in serial[0]]
+    assert list(parallel[1]) == list(serial[1])
+    assert all(parallel[1][name].__dict__.keys() == serial[1][name].__dict__.keys() for name in serial[1])
+
+
+def test_slice_lattice_with_workers():
+    serial, parallel = make_lattice(), make_lattice()
+    serial.slice_lattice()
+    parallel.slice_lattice(num_workers=2, use_threads=True)
+    assert [node.position for node in parallel.thin_sequence] == [node.position for node in serial.thin_sequence]
+    assert list(parallel.thin_elements) == list(serial.thin_elements)
+
+
+def test_iter_thin_line_streams_sliced_lattice():
+    cells, flat = make_lattices()
+    thin_sequence, thin_elements = slicing.slice_nodes(flat.sequence._v, flat.elements._v)
+    stream = flat.iter_thin_line()
+    assert next(stream)[0].element_name == 'ip_sliced_0'
+    line = [(node, element) for node, element in flat.iter_thin_line()]
+    assert [node.element_name for node, _ in line if not node.element_name.startswith('drift')] == \
+           [node.element_name for node in thin_sequence]
+    assert all(node.length == element.length for node, element in line)
+    line_nodes, _ = flat._get_line()
+    assert np.isclose(sum(node.length for node, _ in line), sum(node.length for node in line_nodes))
+    assert np.isclose(sum(node.length for node, _ in line), flat.get_total_length() - flat.sequence[0].start)
+    assert [node.position for node, _ in cells.iter_thin_line()] == [node.position for node, _ in line]
+    assert cells._is_compressed()
+
+
+def test_iter_thin_line_covers_first_and_last_node():
+    elements = {'qf': xe.Quadrupole('qf', length=2.0, k1=0.1, num_slices=1),
+                'qd': xe.Quadrupole('qd', length=2.0, k1=-0.1, num_slices=1)}
+    lattice = Lattice('line', elements, NodesList([Node('qf', location=1.0), Node('qd', location=9.0)]),
+                      Beam(1.0, 'electron'))
+    line = list(lattice.iter_thin_line())
+    assert [node.element_name for node, _ in line] == ['drift_0', 'qf_sliced_0', 'drift_1', 'qd_sliced_0', 'drift_2']
+    assert np.allclose([node.length for node, _ in line], [1.0, 0.0, 8.0, 0.0, 1.0])
+    assert np.isclose(sum(node.length for node, _ in line), lattice.get_total_length())
+
+
+def test_iter_thin_line_reports_negative_drift():
+    elements = {'qf': xe.Quadrupole('qf', length=2.0, k1=0.1, num_slices=1),
+                'qd': xe.Quadrupole('qd', length=2.0, k1=-0.1, num_slices=1)}
+    with pytest.raises(NegativeDriftError, match='Negative drift') as error:
+        list(slicing.iter_thin_line([Node('qf', location=1.0), Node('qd', location=0.5)], elements))
+    assert list(error.value.report.indices) == [1]
+    assert error.value.report.names == ['qd_sliced_0'] and error.value.report.previous_names == ['qf_sliced_0']
+    assert np.allclose(error.value.report.gaps, [-0.5])
@@ -0,0 +1,69 @@
+"""
+Module tests.test_survey
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the survey of lattices.
+"""
+
+import numpy as np
+import pytest
+from cpymad.madx import Madx
+import xsequence.elements as xe
+from xsequence.elements_dataclasses import ElementParameterData
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, NodesList
+from xsequence.helpers.cpymad_functions import from_cpymad
+
+
+MADX_SEQUENCE = """
+mb: sbend, l=3.0, angle=0.1;
+mbv: sbend, l=2.0, angle=0.05, tilt=pi/2;
+mbt: rbend, l=2.0, angle=-0.03, tilt=0.3;
+qf: quadrupole, l=1.0, k1=0.1;
+ring: sequence, l=40, refer=centre;
+qf, at=1; mb, at=5; mbv, at=10; mb, at=14; mbt, at=20; qf, at=25; mb, at=30; mbv, at=35;
+endsequence;
+beam;
+"""
+
+
+@pytest.mark.parametrize('initial', [{}, {'x0': 1.0, 'theta0': 0.2, 'phi0': 0.01}])
+def test_survey_matches_madx(initial):
+    madx = Madx(stdout=False)
+    madx.input(MADX_SEQUENCE)
+    madx.use('ring')
+    madx.survey(**initial)
+    table = madx.table.survey.dframe()
+    lattice = from_cpymad(madx, 'ring')
+    madx.quit()
+    table = table[[not name.startswith(('drift', 'ring$')) for name in table['name']]]
+    survey = lattice.survey(**initial)
+    for column in ['s', 'x', 'y', 'z', 'theta', 'phi', 'psi']:
+        assert np.allclose(getattr(survey, column), table[column].values, atol=1e-12)
+
+
+def test_planar_ring_closes():
+    num_bends = 1000
+    elements = {'mb': xe.SectorBend('mb', length=1.0, angle=2*np.pi/num_bends), 'qf': xe.Quadrupole('qf', length=0.5)}
+    names = ['mb' if idx % 2 else 'qf' for idx in range(2*num_bends)]
+    lattice = Lattice('ring', elements, NodesList.from_arrays(names, np.arange(2*num_bends)*2.0 + 1.0), Beam(1.0, 'electron'))
+    survey = lattice.survey()
+    assert np.isclose(survey.theta[-1], -2*np.pi)
+    assert np.allclose(survey.position[-1], [0.0, 0.0, -0.5], atol=1e-9)
+    assert np.allclose(survey.y, 0.0)
+
+
+def test_survey_incremental_update():
+    elements = {'mb': xe.SectorBend('mb', length=1.0, angle=0.01),
+                'mv': xe.SectorBend('mv', length=1.0, angle=0.02, parameter_data=ElementParameterData(tilt=np.pi/2)),
+                'qf': xe.Quadrupole('qf', length=0.5)}
+    names = ['qf', 'mb', 'mv', 'qf', 'mb', 'qf', 'mv', 'mb'] * 20
+    lattice = Lattice('line', elements, NodesList.from_arrays(names, np.arange(len(names))*2.0 + 1.0), Beam(1.0, 'electron'))
+    survey = lattice.survey(z0=5.0)
+    lattice.elements['mv'].angle = 0.03
+    lattice.elements['mv'].length = 1.2
+    survey.update('mv')
+    expected = lattice.survey(z0=5.0)
+    assert np.allclose(survey.position, expected.position, atol=1e-12)
+    assert np.allclose(survey.rotation, expected.rotation, atol=1e-12)
+    assert np.allclose(survey.s, expected.s)
@@ -0,0 +1,56 @@
+"""
+Module tests.test_tables
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test export of lattice tables.
+"""
+
+import numpy as np
+import pytest
+import xsequence.elements as xe
+import xsequence.elements_dataclasses as xed
+from xsequence import tables
+from xsequence.aperture import APERTURE_ELLIPTICAL
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node, NodesList
+from xsequence.tests.lattices import make_lattices
+
+
+@pytest.fixture
+def lattice():
+    elements = {'qf': xe.Quadrupole('qf', length=2.0, k1=0.1, aperture_data=xed.EllipticalAperture(aperture_size=[0.02, 0.01])),
+                'mb': xe.SectorBend('mb', length=2.0, angle=0.01), 'm1': xe.Marker('m1')}
+    sequence = NodesList([Node('qf', location=1.0), Node('m1', location=3.0), Node('mb', location=5.0), Node('qf', location=8.0)])
+    return Lattice('line', elements, sequence, Beam(1.0, 'electron'), global_variables={})
+
+
+def test_to_table(lattice):
+    table = lattice.to_table()
+    assert list(table['name']) == ['qf', 'm1', 'mb', 'qf'] and list(table['element_number']) == [1, 1, 1, 2]
+    assert list(table['s']) == [1.0, 3.0, 5.0, 8.0] and list(table['s_end']) == [2.0, 3.0, 6.0, 9.0]
+    assert list(table['k1']) == [0.1, 0.0, 0.0, 0.1] and list(table['angle']) == [0.0, 0.0, 0.01, 0.0]
+    assert list(table['aper_type']) == [APERTURE_ELLIPTICAL, 0, 0, APERTURE_ELLIPTICAL]
+    assert list(table['aper_1']) == [0.02, 0.0, 0.0, 0.02]
+    assert lattice.to_table(kind='recarray').keyword[2] == 'sectorbend'
+
+    cells, flat = make_lattices()
+    cells_table, flat_table = cells.to_table(kind='dict'), flat.to_table(kind='dict')
+    assert cells._is_compressed()
+    assert all(np.array_equal(cells_table[key], flat_table[key]) for key in flat_table)
+
+
+def test_write_and_read_tfs(lattice, tmp_path):
+    lattice.write_table(str(tmp_path / 'line.tfs'), chunk_size=3)
+    table = tables.read_table(str(tmp_path / 'line.tfs'), columns=['name', 's', 'k1'])
+    assert list(table.columns) == ['name', 's', 'k1']
+    assert list(table['name']) == ['qf', 'm1', 'mb', 'qf'] and np.allclose(table['k1'], [0.1, 0.0, 0.0, 0.1])
+    with open(tmp_path / 'line.tfs') as f:
+        assert f.readline().split() == ['@', 'NAME', '%s', '"line"']
+
+
+@pytest.mark.parametrize('extension', ['parquet', 'feather'])
+def test_write_and_read_arrow(lattice, tmp_path, extension):
+    pytest.importorskip('pyarrow')
+    lattice.write_table(str(tmp_path / f'line.{extension}'), chunk_size=3)
+    table = tables.read_table(str(tmp_path / f'line.{extension}'), columns=['s', 'k1'])
+    assert list(table.columns) == ['s', 'k1'] and np.allclose(table['s'], [1.0, 3.0, 5.0, 8.0])
@@ -0,0 +1,56 @@
+"""
+Module tests.test_validation
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the validation of negative drifts.
+"""
+
+import numpy as np
+import pytest
+from xsequence.lattice_baseclasses import Node
+from xsequence.tests.lattices import make_lattice
+from xsequence.validation import NegativeDriftError, find_local_negative_drifts, find_negative_drifts
+
+
+def test_negative_drifts_reported_at_once():
+    lattice = make_lattice(lazy=False)
+    assert lattice.validate().ok
+    nodes = lattice.sequence._v
+    nodes[2].location = 3.2
+    nodes[3].location = 3.5
+    nodes[6].location = 14.8
+    report = find_negative_drifts(nodes)
+    assert list(report.indices) == [2, 3, 7]
+    assert report.names == ['qf', 'm1', 'm1'] and report.previous_names == ['m1', 'qf', 'qf']
+    assert np.allclose(report.gaps, [-0.3, -0.2, -0.3])
+    assert 'node 7: m1 4 overlaps qf' in str(report)
+    assert len(find_negative_drifts(nodes, tolerance=0.25)) == 2
+
+    with pytest.raises(NegativeDriftError, match='3 negative drifts') as error:
+        lattice._check_negative_drifts()
+    assert error.value.report.names == report.names
+    with pytest.raises(ValueError, match='Negative drift'):
+        lattice._get_line()
+
+
+def test_local_revalidation():
+    lattice = make_lattice(lazy=False)
+    nodes = lattice.sequence._v
+    nodes.insert(5, Node('m1', location=9.4))
+    local = find_local_negative_drifts(nodes, [5])
+    assert list(local.indices) == [5] and np.isclose(local.gaps[0], -0.1)
+    assert list(lattice.validate(indices=[0, 8]).indices) == []
+    nodes[0].location = -1.0
+    assert find_local_negative_drifts(nodes, [0]).previous_names == ['start']
+
+
+def test_nodes_contained_in_long_node():
+    nodes = [Node('a', length=10.0, location=5.0), Node('b', length=1.0, location=2.5),
+             Node('c', length=1.0, location=4.5), Node('d', length=1.0, location=12.5)]
+    report = find_negative_drifts(nodes)
+    assert list(report.indices) == [1, 2] and report.previous_names == ['a', 'a']
+    assert np.allclose(report.gaps, [-8.0, -6.0])
+    local = find_local_negative_drifts(nodes, [0])
+    assert list(local.indices) == [1, 2] and local.previous_names == ['a', 'a']
+    assert np.allclose(local.gaps, [-8.0, -6.0])
+    assert list(find_local_negative_drifts(nodes, [3]).indices) == []
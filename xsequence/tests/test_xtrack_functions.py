@@ -0,0 +1,60 @@
+"""
+Module tests.test_xtrack_functions
+------------------
+:author: Felix Carlier (fcarlier@cern.ch)
+This is a test module to test the export of lattices to xtrack.
+"""
+
+import numpy as np
+import pytest
+from xsequence.elements import Marker, Quadrupole, SectorBend
+from xsequence.lattice import Lattice
+from xsequence.lattice_baseclasses import Beam, Node, NodesList
+from xsequence.helpers.xtrack_functions import lattice_to_xtrack
+
+
+@pytest.fixture
+def lattice():
+    elements = {'qf': Quadrupole('qf', length=1.0, k1=0.1, num_slices=2),
+                'qd': Quadrupole('qd', length=1.0, k1=-0.1),
+                'mb': SectorBend('mb', length=3.0, angle=0.1),
+                'm1': Marker('m1')}
+    sequence = NodesList([Node('qf', location=1.0), Node('mb', location=5.0), Node('qd', location=9.0),
+                          Node('mb', location=13.0), Node('m1', location=15.0)])
+    lattice = Lattice('fodo', elements, sequence, Beam(10.0, 'electron'), global_variables={'kf': 0.1, 'kb': 0.1})
+    lattice._elements['qf'].k1 = lattice._globals['kf']*2
+    lattice._elements['mb'].angle = lattice._globals['kb']
+    lattice._elements['qd'].k1 = -lattice._math.sqrt(lattice._globals['kf']**2)
+    return lattice
+
+
+def test_thin_line_layout(lattice):
+    line = lattice_to_xtrack(lattice)
+    names = [name for name in line.element_names if not name.startswith('drift_')]
+    assert names == ['qf_sliced_0', 'qf_sliced_1', 'mb_sliced_entrance', 'mb_sliced_0', 'mb_sliced_exit',
+                     'qd_sliced_0', 'mb_sliced_entrance', 'mb_sliced_0', 'mb_sliced_exit', 'm1_sliced_0']
+    assert np.isclose(line.get_length(), 14.5)
+    assert len(line.element_dict) < len(line.element_names)
+
+
+def test_thin_line_knobs(lattice):
+    line = lattice_to_xtrack(lattice)
+    assert np.isclose(line['qf_sliced_0'].knl[1], 0.1)
+    line.vars['kf'] = 0.5
+    line.vars['kb'] = 0.2
+    assert np.isclose(line['qf_sliced_1'].knl[1], 0.5)
+    assert np.isclose(line['qd_sliced_0'].knl[1], -0.5)
+    assert np.isclose(line['mb_sliced_0'].knl[0], 0.2)
+    assert np.isclose(line['mb_sliced_0'].hxl, 0.2)
+    assert np.isclose(line['mb_sliced_exit'].k, 0.2/3.0)
+
+
+def test_thick_line_knobs(lattice):
+    line = lattice_to_xtrack(lattice, thin=False)
+    assert line.element_names == ['qf', 'drift_0', 'mb', 'drift_1', 'qd', 'drift_2', 'mb', 'drift_3', 'm1']
+    line.vars['kf'] = 0.3
+    assert np.isclose(line['qf'].k1, 0.6)
+    assert np.isclose(line['qd'].k1, -0.3)
+    assert np.isclose(line['mb'].h, 0.1/3.0)
+    line.vars['kb'] = 0.2
+    assert np.isclose(line['mb'].h, 0.2/3.0)
@@ -0,0 +1,117 @@
+# copyright #################################### #
+# This file is part of the Xsequence Package.    #
+# Copyright (c) CERN, 2022.                      #
+# ############################################## #
+
+from dataclasses import dataclass, field
+import numpy as np
+
+
+@dataclass
+class DriftReport:
+    """ Nodes starting before the end of the previous node, with negative drift lengths as gaps """
+    indices: np.ndarray = field(default_factory=lambda: np.zeros(0, dtype=int))
+    names: list = field(default_factory=list)
+    element_numbers: list = field(default_factory=list)
+    previous_names: list = field(default_factory=list)
+    gaps: np.ndarray = field(default_factory=lambda: np.zeros(0))
+
+    def __len__(self) -> int:
+        return len(self.indices)
+
+    @property
+    def ok(self) -> bool:
+        return len(self.indices) == 0
+
+    def __str__(self) -> str:
+        lines = [f'{len(self)} negative drifts']
+        for idx, name, number, previous_name, gap in zip(self.indices, self.names, self.element_numbers,
+                                                         self.previous_names, self.gaps):
+            lines.append(f'  node {idx}: {name} {number} overlaps {previous_name} by {-gap:.6g} m')
+        return '\n'.join(lines)
+
+    def raise_for_negative_drifts(self):
+        if not self.ok:
+            raise NegativeDriftError(self)
+
+
+class NegativeDriftError(ValueError):
+    """ Error raised for overlapping nodes, all offending nodes are given in report """
+    def __init__(self, report: DriftReport):
+        self.report = report
+        super().__init__(f'Negative drift detected, {report}')
+
+
+_ANCHOR_OFFSETS = {'start': 0.0, 'center': 0.5, 'end': 1.0}
+
+
+def get_node_positions(nodes: list) -> tuple:
+    """ Get arrays of start, center and end positions of nodes, equal to those of Node.calculate_positions """
+    locations = (np.array([node.location for node in nodes], dtype=float)
+                 + np.array([node.reference for node in nodes], dtype=float))
+    lengths = np.array([node.length for node in nodes], dtype=float)
+    offsets = np.array([_ANCHOR_OFFSETS[node.pos_anchor] for node in nodes], dtype=float)
+    return locations - offsets*lengths, locations + (0.5 - offsets)*lengths, locations + (1.0 - offsets)*lengths
+
+
+def get_node_bounds(nodes: list) -> tuple:
+    """ Get arrays of start and end positions of nodes, equal to those of Node.calculate_positions """
+    starts, _, ends = get_node_positions(nodes)
+    return starts, ends
+
+
+def _get_report(nodes: list, indices: np.ndarray, previous: np.ndarray, gaps: np.ndarray) -> DriftReport:
+    return DriftReport(indices=indices, names=[nodes[idx].element_name for idx in indices],
+                       element_numbers=[nodes[idx].element_number for idx in indices],
+                       previous_names=[nodes[idx].element_name if idx >= 0 else 'start' for idx in previous],
+                       gaps=gaps)
+
+
+def find_negative_drifts(nodes: list, tolerance: float = 0.0, start: float = 0.0) -> DriftReport:
+    """ Find all nodes starting before the end of any previous node, in one pass over sequence.
+    Starts are compared to the largest previous end, which also finds nodes contained in a long node,
+    the first node is compared to start. Drifts down to -tolerance are accepted as rounding """
+    if len(nodes) == 0:
+        return DriftReport()
+    starts, ends = get_node_bounds(nodes)
+    bounds = np.concatenate([[start], ends[:-1]])
+    previous_ends = np.maximum.accumulate(bounds)
+    previous = np.maximum.accumulate(np.where(bounds == previous_ends, np.arange(-1, len(nodes) - 1), -1))
+    gaps = starts - previous_ends
+    indices = np.flatnonzero(gaps < -tolerance)
+    return _get_report(nodes, indices, previous[indices], gaps[indices])
+
+
+def find_local_negative_drifts(nodes: list, indices: list, tolerance: float = 0.0, start: float = 0.0) -> DriftReport:
+    """ Find negative drifts only around nodes at given indices, for revalidation after local edits.
+    Nodes before the edits are assumed free of negative drifts. After each edited node the check continues
+    as long as the following nodes start before the largest previous end """
+    indices = np.asarray(indices, dtype=int).reshape(-1)
+    checked = np.unique(np.concatenate([indices, indices + 1]))
+    checked = set(checked[(checked >= 0) & (checked < len(nodes))].tolist())
+    bounds = {}
+
+    def get_bounds(idx: int) -> tuple:
+        if idx not in bounds:
+            positions = nodes[idx].calculate_positions()
+            bounds[idx] = (positions['start'], positions['end'])
+        return bounds[idx]
+
+    found, previous_found, gaps = [], [], []
+    last = -1
+    for idx in sorted(checked):
+        if idx <= last:
+            continue
+        previous = idx - 1
+        previous_end = get_bounds(previous)[1] if previous >= 0 else start
+        while idx < len(nodes) and (idx in checked or get_bounds(idx)[0] < previous_end - tolerance):
+            node_start, node_end = get_bounds(idx)
+            if node_start - previous_end < -tolerance:
+                found.append(idx)
+                previous_found.append(previous)
+                gaps.append(node_start - previous_end)
+            if node_end >= previous_end:
+                previous, previous_end = idx, node_end
+            last = idx
+            idx += 1
+    return _get_report(nodes, np.array(found, dtype=int), np.array(previous_found, dtype=int), np.array(gaps))